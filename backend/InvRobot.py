@@ -3,6 +3,7 @@ Serveur FastAPI principal - Version modulaire
 """
 import sys
 import io
+import importlib.util
 import logging
 import multiprocessing
 import os
@@ -23,8 +24,14 @@ from fastapi.responses import FileResponse, HTMLResponse
 from fastapi import Request, HTTPException, Depends
 import socket
 import os
+import time
+import uuid
 # Imports locaux
-from config import CORS_ORIGINS, BUILD_DIR
+from config import (
+    CORS_ORIGINS, BUILD_DIR, SLOW_REQUEST_SECONDS, SERVER_TIMING,
+    LOG_LEVEL, LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_CONSOLE, LOG_SOCKET_PORT, log_paths,
+    HOST, PORT, WEB_WORKERS, WORKER_MAX_REQUESTS, GRACEFUL_SHUTDOWN_SECONDS,
+)
 from database import lifespan
 from routes import (
     pieces_router,
@@ -38,20 +45,24 @@ from routes import (
     uploads_router,
     departements_router,
     parametres_router,
+    metrics_router,
+    debug_router,
 )
 from routes import auth_router
 from auth import get_current_user
+from utils.logging_config import setup_logging, start_log_receiver, request_id_var
+from utils.metrics import route_label
+from utils.profiling import (
+    RequestProfile, RequestMetrics, current_profile, compact_sql, server_timing, UNMATCHED_ROUTE,
+)
 
 
-# Setup logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    filename="InvRob.log",
-    filemode="w"
-)
+# Setup logging (écritures hors de la boucle d'événements, voir utils/logging_config.py) ;
+# un worker lancé par le mode multi-processus envoie ses journaux au superviseur
+setup_logging(LOG_LEVEL, LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, console=LOG_CONSOLE, socket_port=LOG_SOCKET_PORT)
 
 logger = logging.getLogger("Inventaire-Robot")
+log_paths(logger)
 
 # Création de l'application FastAPI
 app = FastAPI(
@@ -60,6 +71,47 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+app.state.request_metrics = RequestMetrics()
+
+
+# Identifiant de requête (journaux, en-tête X-Request-ID) et profilage : latence par route,
+# requêtes SQL et temps DB (connexions de get_db_connection)
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    request_id = (request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16])[:64]
+    id_token = request_id_var.set(request_id)
+    try:
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            response = await call_next(request)
+        finally:
+            current_profile.reset(token)
+
+        total = time.perf_counter() - profile.start
+        route = route_label(request.scope, UNMATCHED_ROUTE)
+        slow = bool(SLOW_REQUEST_SECONDS) and total > SLOW_REQUEST_SECONDS
+        request.app.state.request_metrics.observe(request.method, route, profile, total, slow)
+
+        if slow:
+            queries = "".join(
+                f"\n    {duration * 1000:8.1f} ms  {compact_sql(query)}" for query, duration in profile.queries
+            )
+            logger.warning(
+                "🐢 Requête lente %s %s : %.0f ms dont %.0f ms en base (%d requêtes SQL)%s",
+                request.method, route, total * 1000, profile.db_time * 1000, profile.query_count, queries,
+                extra={"route": route, "duration_ms": round(total * 1000, 1),
+                       "db_ms": round(profile.db_time * 1000, 1), "sql_count": profile.query_count},
+            )
+
+        if SERVER_TIMING:
+            response.headers["Server-Timing"] = server_timing(profile, total)
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        request_id_var.reset(id_token)
+
+
 # Middleware CORS
 app.add_middleware(
     CORSMiddleware,
@@ -67,6 +119,7 @@ app.add_middleware(
     allow_origins=CORS_ORIGINS,
     allow_methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Next-Cursor", "Server-Timing", "X-Request-ID"],
 )
 
 
@@ -89,6 +142,8 @@ app.include_router(piece_images_router, prefix="/api")
 app.include_router(uploads_router, prefix="/api")
 app.include_router(departements_router, prefix="/api")
 app.include_router(parametres_router, prefix="/api")
+app.include_router(metrics_router, prefix="/api")
+app.include_router(debug_router, prefix="/api")
 
 # Configuration du frontend (si build existe)
 if BUILD_DIR.exists():
@@ -140,8 +195,30 @@ if __name__ == "__main__":
         logger.info("🔧 Mode développement activé (avec reload)")
         uvicorn.run("server:app", host="0.0.0.0", port=8000, reload=True)
     else:
-        logger.info("🚀 Mode production")
-        uvicorn.run(app, host="0.0.0.0", port=2549, log_config=None, access_log=False)
+        workers = WEB_WORKERS
+        if workers > 1 and is_frozen and importlib.util.find_spec("InvRobot") is None:
+            # Les workers réimportent l'application par son nom : exécutable à construire avec --hidden-import InvRobot
+            logger.warning("⚠️ Module InvRobot absent de l'exécutable — démarrage avec un seul worker")
+            workers = 1
+
+        if workers > 1:
+            logger.info(f"🚀 Mode production ({workers} workers)")
+            # Lus par les workers au démarrage : taille des pools et journaux envoyés au superviseur
+            os.environ["WEB_WORKERS"] = str(workers)
+            os.environ["LOG_SOCKET_PORT"] = str(start_log_receiver())
+            uvicorn.run(
+                "InvRobot:app", host=HOST, port=PORT, workers=workers,
+                limit_max_requests=WORKER_MAX_REQUESTS or None,
+                timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS,
+                log_config=None, access_log=False,
+            )
+        else:
+            logger.info("🚀 Mode production")
+            uvicorn.run(
+                app, host=HOST, port=PORT,
+                timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS,
+                log_config=None, access_log=False,
+            )
 
 
 # backend/InvRobot.py - AJOUTE une fonction helper
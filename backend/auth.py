@@ -1,7 +1,15 @@
 # backend/auth.py
 """Utilitaires d'authentification JWT et dependencies FastAPI"""
 from datetime import datetime, timedelta
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import secrets
+import time
+import uuid
 
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -10,16 +18,33 @@ from passlib.context import CryptContext
 import asyncpg
 import os
 
-from database import get_db_connection
+from config import (
+    ACCESS_TOKEN_TTL_MINUTES, REFRESH_TOKEN_TTL_DAYS, REFRESH_TOKEN_REUSE_GRACE_SECONDS,
+    PASSWORD_HASH_CONCURRENCY, PASSWORD_HASH_QUEUE_LIMIT,
+    LOGIN_MAX_FAILURES_PER_USER, LOGIN_MAX_FAILURES_PER_IP, LOGIN_RATE_WINDOW_SECONDS,
+)
+from utils.pg_listener import notify
+from utils.rate_limit import LoginRateLimiter
 
 # ==================== Configuration ====================
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "CHANGE_ME_IN_PRODUCTION")  # ⚠️ Mettre dans .env
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 90  # 90 jours
+# Jeton d'accès court (autorise sans lecture en base), renouvelé par le jeton de rafraîchissement
+ACCESS_TOKEN_EXPIRE_MINUTES = ACCESS_TOKEN_TTL_MINUTES
+REFRESH_TOKEN_EXPIRE_DAYS = REFRESH_TOKEN_TTL_DAYS
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer(auto_error=False)
 
+# bcrypt libère le GIL : des threads suffisent, bornés pour ne pas saturer le CPU
+_hash_executor = ThreadPoolExecutor(max_workers=max(PASSWORD_HASH_CONCURRENCY, 1), thread_name_prefix="bcrypt")
+_hash_semaphore = asyncio.Semaphore(max(PASSWORD_HASH_CONCURRENCY, 1))
+_hash_waiting = 0
+
+logger = logging.getLogger("Inventaire-Robot")
+
+login_limiter = LoginRateLimiter(LOGIN_MAX_FAILURES_PER_USER, LOGIN_MAX_FAILURES_PER_IP, LOGIN_RATE_WINDOW_SECONDS)
+
 # Liste complète des permissions disponibles dans le système
 ALL_PERMISSIONS = [
     "inventaire_view", "inventaire_create", "inventaire_update",
@@ -32,49 +57,315 @@ ALL_PERMISSIONS = [
     "receptions_view", "receptions_create", "receptions_update",
     "historique_view",
     "can_delete_any", "can_manage_users", "can_approve_orders", "can_submit_approval",
+    "debug_access",
 ]
 
 
 # ==================== Fonctions utilitaires ====================
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+async def _run_hash(func, *args):
+    """
+    Calcul bcrypt dans l'exécuteur dédié, hors de la boucle asyncio. Au-delà de
+    PASSWORD_HASH_QUEUE_LIMIT calculs en attente, refus immédiat (503).
+    """
+    global _hash_waiting
+    if _hash_waiting >= PASSWORD_HASH_QUEUE_LIMIT > 0:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Serveur occupé, réessayez dans quelques secondes",
+            headers={"Retry-After": "2"},
+        )
+    _hash_waiting += 1
+    try:
+        async with _hash_semaphore:
+            return await asyncio.get_running_loop().run_in_executor(_hash_executor, func, *args)
+    finally:
+        _hash_waiting -= 1
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Vérifie si le mot de passe correspond au hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return await _run_hash(pwd_context.verify, plain_password, hashed_password)
 
 
-def hash_password(password: str) -> str:
+async def hash_password(password: str) -> str:
     """Hash un mot de passe"""
-    return pwd_context.hash(password)
+    return await _run_hash(pwd_context.hash, password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    """Crée un JWT token"""
+    """Crée un JWT token (identifiant "jti" pour la révocation à la déconnexion)"""
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    now = datetime.utcnow()
+    expire = now + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    to_encode.update({"exp": expire, "iat": now, "jti": secrets.token_urlsafe(12)})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def access_token_claims(user: dict) -> dict:
+    """Contenu du jeton d'accès : assez pour autoriser une requête sans lecture en base"""
+    raw_perms = user.get('group_permissions') or {}
+    if isinstance(raw_perms, str):
+        raw_perms = json.loads(raw_perms)
+    return {
+        "sub":         user['username'],
+        "role":        user['role'],
+        "id":          str(user['id']),
+        "group":       user.get('group_name') or user['role'],
+        "permissions": raw_perms,
+        "ver":         user.get('token_version') or 0,
+    }
+
+
+_USER_QUERY = """SELECT u.id, u.username, u.password_hash, u.role,
+                        u.email, u.group_id, u.token_version,
+                        g.name        AS group_name,
+                        g.permissions AS group_permissions
+                 FROM users u
+                 LEFT JOIN user_groups g ON u.group_id = g.id"""
+
+
 async def get_user_by_username(conn, username: str):
     """Récupère un utilisateur avec son groupe et ses permissions."""
-    row = await conn.fetchrow(
-        """SELECT u.id, u.username, u.password_hash, u.role,
-                  u.email, u.group_id,
-                  g.name        AS group_name,
-                  g.permissions AS group_permissions
-           FROM users u
-           LEFT JOIN user_groups g ON u.group_id = g.id
-           WHERE u.username = $1""",
-        username
-    )
+    row = await conn.fetchrow(_USER_QUERY + " WHERE u.username = $1", username)
     return dict(row) if row else None
 
 
+async def get_user_by_id(conn, user_id):
+    """Récupère un utilisateur (par id) avec son groupe et ses permissions."""
+    row = await conn.fetchrow(_USER_QUERY + " WHERE u.id = $1", user_id)
+    return dict(row) if row else None
+
+
+class TokenVersions:
+    """
+    Révocation des jetons d'accès, en mémoire du processus :
+
+    - version courante par utilisateur (users.token_version), indexée par users.id :
+      un jeton n'est accepté que si son "ver" est la version courante de l'utilisateur
+      dont il porte l'id (un utilisateur recréé sous le même nom a un autre id).
+      Changer le mot de passe, le rôle, le groupe ou les permissions du groupe
+      incrémente la version (revoke_user_tokens).
+    - jetons révoqués un par un (déconnexion), gardés jusqu'à leur expiration ; la
+      table "RevokedTokens" fait foi et est relue au démarrage et à chaque reconnexion.
+
+    Tenu à jour par NOTIFY (TOKEN_CHANNEL) ; un utilisateur pas encore vu par ce
+    processus est lu une fois en base.
+    """
+
+    def __init__(self):
+        # users.id (texte, claim "id") → version
+        self._versions: Dict[str, int] = {}
+        self._revoked: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str) -> Optional[int]:
+        version = self._versions.get(user_id)
+        if version is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return version
+
+    def set(self, user_id: str, version: int):
+        """Les versions ne font qu'augmenter : une lecture en retard ne réactive pas un jeton"""
+        if version > self._versions.get(user_id, -1):
+            self._versions[user_id] = version
+
+    def forget(self, user_id: str):
+        self._versions.pop(user_id, None)
+
+    def revoke(self, jti: str, expires_at: float):
+        self._revoked[jti] = expires_at
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        if not jti or not self._revoked:
+            return False
+        now = time.time()
+        for key in [k for k, exp in self._revoked.items() if exp < now]:
+            del self._revoked[key]
+        return jti in self._revoked
+
+    def clear(self):
+        """Notifications possiblement perdues (reconnexion) : versions relues en base"""
+        self._versions.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._versions),
+            "revoked": len(self._revoked),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+token_versions = TokenVersions()
+
+# Canal NOTIFY des révocations ; appliqué au COMMIT par tous les processus, y compris
+# celui qui l'envoie (une transaction annulée ne révoque donc rien)
+TOKEN_CHANNEL = "token_revocation"
+
+
+async def revoke_user_tokens(db, username: Optional[str] = None, group_id: Optional[int] = None):
+    """
+    Invalide les jetons d'accès d'un utilisateur ou de tous les membres d'un groupe
+    (nouvelle version de jeton). Les jetons de rafraîchissement restent valides :
+    le prochain /auth/refresh émet un jeton avec les droits à jour. db : connexion ou pool.
+    """
+    if username is not None:
+        rows = await db.fetch(
+            "UPDATE users SET token_version = token_version + 1 WHERE username = $1 RETURNING id, token_version",
+            username
+        )
+    else:
+        rows = await db.fetch(
+            "UPDATE users SET token_version = token_version + 1 WHERE group_id = $1 RETURNING id, token_version",
+            group_id
+        )
+    for row in rows:
+        await notify(db, TOKEN_CHANNEL, f"v:{row['token_version']}:{row['id']}")
+
+
+async def forget_user_tokens(db, user_id):
+    """Utilisateur supprimé : version oubliée partout (ses jetons ne trouvent plus son id en base)"""
+    await notify(db, TOKEN_CHANNEL, f"d:0:{user_id}")
+
+
+async def revoke_access_token(db, payload: dict):
+    """Déconnexion : ce jeton d'accès est refusé jusqu'à son expiration"""
+    if payload.get("jti") and payload.get("exp"):
+        await db.execute('DELETE FROM "RevokedTokens" WHERE "expires_at" < NOW()')
+        await db.execute(
+            '''INSERT INTO "RevokedTokens" ("jti", "expires_at") VALUES ($1, to_timestamp($2))
+               ON CONFLICT ("jti") DO NOTHING''',
+            payload["jti"], float(payload["exp"])
+        )
+        await notify(db, TOKEN_CHANNEL, f"j:{payload['exp']}:{payload['jti']}")
+
+
+async def load_revoked_tokens(db):
+    """Révocations pas encore expirées, relues en base (démarrage, reconnexion LISTEN)"""
+    rows = await db.fetch(
+        'SELECT "jti", EXTRACT(EPOCH FROM "expires_at")::float8 AS "exp" FROM "RevokedTokens" WHERE "expires_at" > NOW()'
+    )
+    for row in rows:
+        token_versions.revoke(row["jti"], row["exp"])
+
+
+def on_token_reconnect(pool):
+    """
+    Hook on_reconnect de TOKEN_CHANNEL : notifications possiblement perdues, versions
+    relues en base au besoin et révocations rechargées.
+    """
+    async def reload():
+        try:
+            await load_revoked_tokens(pool)
+        except Exception as e:
+            logger.warning("⚠️ Rechargement des jetons révoqués (non bloquant): %s", e)
+
+    def hook():
+        token_versions.clear()
+        asyncio.create_task(reload())
+    return hook
+
+
+def on_token_notification(payload: str):
+    """Callback LISTEN (utils.pg_listener) de TOKEN_CHANNEL"""
+    kind, value, key = payload.split(":", 2)
+    if kind == "v":
+        token_versions.set(key, int(value))
+    elif kind == "d":
+        token_versions.forget(key)
+    elif kind == "j":
+        token_versions.revoke(key, float(value))
+
+
+def _hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+async def issue_refresh_token(conn, user_id, family: Optional[uuid.UUID] = None) -> str:
+    """
+    Nouveau jeton de rafraîchissement (opaque, seul son hash est stocké). family relie
+    les jetons successifs d'une même session pour révoquer la session entière.
+    """
+    token = secrets.token_urlsafe(32)
+    await conn.execute(
+        'DELETE FROM "RefreshTokens" WHERE "user_id" = $1 AND "expires_at" < NOW()',
+        user_id
+    )
+    await conn.execute(
+        '''INSERT INTO "RefreshTokens" ("user_id", "family", "token_hash", "expires_at")
+           VALUES ($1, $2, $3, NOW() + make_interval(days => $4))''',
+        user_id, family or uuid.uuid4(), _hash_refresh_token(token), REFRESH_TOKEN_EXPIRE_DAYS
+    )
+    return token
+
+
+async def rotate_refresh_token(conn, token: str) -> Optional[Tuple[object, str]]:
+    """
+    Consomme un jeton de rafraîchissement et en émet le successeur : (user_id, nouveau jeton).
+    Un jeton déjà consommé présenté à nouveau (vol probable) révoque toute la session,
+    sauf dans les REFRESH_TOKEN_REUSE_GRACE_SECONDS (deux onglets qui rafraîchissent ensemble).
+    """
+    if not token:
+        return None
+    token_hash = _hash_refresh_token(token)
+    async with conn.transaction():
+        row = await conn.fetchrow(
+            '''UPDATE "RefreshTokens" SET "used_at" = NOW()
+               WHERE "token_hash" = $1 AND "used_at" IS NULL AND "revoked_at" IS NULL AND "expires_at" > NOW()
+               RETURNING "user_id", "family"''',
+            token_hash
+        )
+        if row is not None:
+            return row["user_id"], await issue_refresh_token(conn, row["user_id"], row["family"])
+
+        reused = await conn.fetchrow(
+            '''SELECT "family" FROM "RefreshTokens"
+               WHERE "token_hash" = $1 AND "revoked_at" IS NULL
+                 AND "used_at" < NOW() - make_interval(secs => $2)''',
+            token_hash, float(REFRESH_TOKEN_REUSE_GRACE_SECONDS)
+        )
+        if reused is not None:
+            await conn.execute(
+                'UPDATE "RefreshTokens" SET "revoked_at" = NOW() WHERE "family" = $1 AND "revoked_at" IS NULL',
+                reused["family"]
+            )
+            logger.warning("⚠️ Jeton de rafraîchissement réutilisé — session révoquée")
+    return None
+
+
+async def revoke_refresh_tokens(conn, user_id=None, token: Optional[str] = None):
+    """Révoque la session d'un jeton (déconnexion) ou toutes celles d'un utilisateur"""
+    if token:
+        await conn.execute(
+            '''UPDATE "RefreshTokens" SET "revoked_at" = NOW()
+               WHERE "revoked_at" IS NULL AND "family" =
+                     (SELECT "family" FROM "RefreshTokens" WHERE "token_hash" = $1)''',
+            _hash_refresh_token(token)
+        )
+    elif user_id is not None:
+        await conn.execute(
+            'UPDATE "RefreshTokens" SET "revoked_at" = NOW() WHERE "user_id" = $1 AND "revoked_at" IS NULL',
+            user_id
+        )
+
+
 async def get_current_user_from_token(
         token: str,
-        conn: asyncpg.Connection
+        conn,
+        use_cache: bool = True,
 ):
-    """Vérifie le token JWT et retourne l'utilisateur depuis la DB"""
+    """
+    Vérifie le token JWT, sa révocation et sa version. Sans lecture en base si la
+    version de l'utilisateur est connue ; use_cache=False (écoute NOTIFY coupée)
+    relit la version en base.
+    conn peut être une connexion ou le pool : il n'est utilisé qu'en cas d'absence du cache.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Token invalide ou expiré",
@@ -87,11 +378,29 @@ async def get_current_user_from_token(
 
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        if username is None:
+        user_id = payload.get("id")
+        version = payload.get("ver")
+        # Jetons émis avant les versions (90 jours, non révocables) : reconnexion
+        if username is None or user_id is None or version is None or token_versions.is_revoked(payload.get("jti")):
             raise credentials_exception
 
-        user = await get_user_by_username(conn, username)
-        if user is None:
+        current = token_versions.get(user_id) if use_cache else None
+        if current is None or version > current:
+            # L'id (immuable) et le nom doivent correspondre : un utilisateur supprimé puis
+            # recréé sous le même nom ne réactive pas les jetons (et les droits) de l'ancien
+            # La table des révocations est aussi consultée : la mémoire peut en avoir manqué
+            row = await conn.fetchrow(
+                '''SELECT u.token_version,
+                          EXISTS (SELECT 1 FROM "RevokedTokens" r WHERE r."jti" = $3) AS revoked
+                   FROM users u WHERE u.id = $1 AND u.username = $2''',
+                uuid.UUID(user_id), username, payload.get("jti")
+            )
+            if row is None or row["revoked"]:
+                raise credentials_exception
+            current = row["token_version"]
+            if use_cache:
+                token_versions.set(user_id, current)
+        if version != current:
             raise credentials_exception
 
         return {
@@ -100,16 +409,17 @@ async def get_current_user_from_token(
             "id":       payload.get("id"),
             "group":    payload.get("group"),
             "permissions": payload.get("permissions", {}),
+            # Expiration (epoch) du jeton vérifié, pour /auth/me
+            "exp":      payload.get("exp"),
         }
 
-    except JWTError:
+    except (JWTError, ValueError, TypeError):
         raise credentials_exception
 
 
 async def get_current_user(
         request: Request,
         credentials: HTTPAuthorizationCredentials = Depends(security),
-        conn: asyncpg.Connection = Depends(get_db_connection)
 ):
     """Vérifie le token JWT (header ou cookie) et retourne l'utilisateur"""
     token = None
@@ -121,7 +431,11 @@ async def get_current_user(
     if not token:
         token = request.cookies.get('access_token')
 
-    return await get_current_user_from_token(token, conn)
+    # Pas de connexion réservée : le pool n'est sollicité qu'en cas d'absence du cache,
+    # ou à chaque requête si l'écoute NOTIFY est coupée (révocations non reçues)
+    listener = getattr(request.app.state, "pg_listener", None)
+    use_cache = listener is not None and listener.connected
+    return await get_current_user_from_token(token, request.app.state.pool, use_cache=use_cache)
 
 
 # ==================== Dependencies ====================
@@ -137,6 +451,21 @@ async def require_admin(user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Accès refusé - Admin seulement")
     return user
 
+def require_permission(permission: str):
+    """
+    Protège une route par permission de groupe (mêmes règles que usePermissions côté
+    frontend : superadmin a tout, admin tout sauf debug_access qui doit être accordé).
+    """
+    async def dependency(user: dict = Depends(get_current_user)):
+        role = user.get("role")
+        if role == "superadmin" or (role == "admin" and permission != "debug_access"):
+            return user
+        if not (user.get("permissions") or {}).get(permission):
+            raise HTTPException(status_code=403, detail=f"Permission requise : {permission}")
+        return user
+    return dependency
+
+
 def get_username_from_request(request: Request) -> str:
     """
     Extrait le username du JWT (header ou cookie) sans accès DB.
@@ -0,0 +1,290 @@
+"""
+Banc d'essai : sérialisation des listes GET /pieces et GET /commande.
+
+Compare, sur des lignes synthétiques :
+  - avant : construction d'un modèle Pydantic par ligne (helpers safe_*) puis
+            validation/sérialisation du response_model et JSONResponse, comme FastAPI ;
+  - après : lignes déjà normalisées en SQL (PIECE_FIELD_SQL / COMMANDE_FIELD_SQL)
+            → rows_to_dicts → dumps (orjson si installé).
+
+Vérifie aussi que les deux chemins produisent exactement les mêmes octets JSON.
+
+Usage (depuis backend/) :
+    python -m benchmarks.bench_serialization [nombre_de_lignes]
+"""
+import json
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import List
+
+from pydantic import TypeAdapter
+
+from models import Piece, Commande
+from utils.helpers import safe_string, safe_int, safe_float, calculate_qty_to_order, get_stock_status
+from utils.serialization import dumps, rows_to_dicts, orjson
+
+
+# ── Données synthétiques ────────────────────────────────────
+
+def _fournisseurs(rng: random.Random, piece_id: int) -> list:
+    return [
+        {
+            "RéfFournisseur": piece_id * 10 + i,
+            "NomFournisseur": f"Fournisseur {i}",
+            "NuméroTél": "418-555-0100",
+            "NumSap": f"SAP{i}",
+            "EstPrincipal": i == 0,
+            "NumPièceFournisseur": f"F-{piece_id}-{i}",
+            "PrixUnitaire": round(rng.uniform(1, 500), 2),
+        }
+        for i in range(rng.randint(0, 3))
+    ]
+
+
+def make_raw_rows(count: int, seed: int = 42) -> List[dict]:
+    """Lignes telles que renvoyées par l'ancienne requête « SELECT p.*, ... »"""
+    rng = random.Random(seed)
+    base = datetime(2024, 1, 1, 8, 30)
+    rows = []
+    for piece_id in range(1, count + 1):
+        fournisseurs = _fournisseurs(rng, piece_id)
+        principal = fournisseurs[0] if fournisseurs else None
+        rows.append({
+            "RéfPièce": piece_id,
+            "NomPièce": f"Pièce {piece_id}",
+            "DescriptionPièce": rng.choice([None, "", f"Description détaillée {piece_id}"]),
+            "NumPièce": f"NP-{piece_id:06d}",
+            "NumPièceAutreFournisseur": rng.choice([None, f"AF-{piece_id}"]),
+            "RefFabricant": rng.choice([None, rng.randint(1, 50)]),
+            "Lieuentreposage": rng.choice([None, f"A-{piece_id % 40}"]),
+            "QtéenInventaire": rng.randint(0, 30),
+            "Qtéminimum": rng.choice([None, rng.randint(0, 20)]),
+            "Qtémax": rng.choice([None, 100]),
+            "Qtécommandée": rng.choice([0, rng.randint(1, 10)]),
+            "Qtéreçue": rng.randint(0, 5),
+            "Qtéarecevoir": rng.randint(0, 5),
+            "Prix unitaire": Decimal(f"{rng.uniform(0, 900):.2f}"),
+            "Soumission LD": rng.choice([None, "LD-1"]),
+            "SoumDem": rng.choice([None, True, False]),
+            "Datecommande": rng.choice([None, date(2024, 3, 1) + timedelta(days=piece_id % 90)]),
+            "Cmd_info": rng.choice([None, "urgent"]),
+            "NoFESTO": rng.choice([None, f"FESTO{piece_id}"]),
+            "RTBS": rng.choice([None, rng.randint(1000, 9999)]),
+            "devise": rng.choice([None, "", "CAD", "USD"]),
+            "RefDepartement": rng.choice([None, rng.randint(1, 8)]),
+            "Created": base + timedelta(minutes=piece_id, microseconds=piece_id % 7 * 1000),
+            "Modified": base + timedelta(hours=piece_id),
+            "NomFabricant": rng.choice([None, "Festo", "SMC"]),
+            "NomDepartement": rng.choice([None, "Maintenance"]),
+            "ref_four_principal": principal["RéfFournisseur"] if principal else None,
+            "fournisseur_principal_nom": principal["NomFournisseur"] if principal else None,
+            "fournisseur_principal_tel": principal["NuméroTél"] if principal else None,
+            "fournisseur_principal_numsap": principal["NumSap"] if principal else None,
+            "fournisseur_principal_num_sap": principal["NumSap"] if principal else None,
+            "tous_fournisseurs": json.dumps(fournisseurs) if fournisseurs else None,
+        })
+    return rows
+
+
+# ── Avant : un modèle Pydantic par ligne ─────────────────────
+
+def legacy_piece(piece_dict: dict) -> Piece:
+    qty_inventaire = safe_int(piece_dict.get("QtéenInventaire", 0))
+    qty_minimum = safe_int(piece_dict.get("Qtéminimum", 0))
+    qty_max = safe_int(piece_dict.get("Qtémax", 100))
+    fournisseur_principal = None
+    if piece_dict.get("fournisseur_principal_nom"):
+        fournisseur_principal = {
+            "RéfFournisseur": piece_dict.get("ref_four_principal"),
+            "NomFournisseur": safe_string(piece_dict.get("fournisseur_principal_nom", "")),
+            "NuméroTél": safe_string(piece_dict.get("fournisseur_principal_tel", "")),
+            "NumSap": safe_string(piece_dict.get("fournisseur_principal_numsap", "")),
+            "EstPrincipal": True,
+        }
+    tous_raw = piece_dict.get("tous_fournisseurs")
+    if tous_raw:
+        tous_fournisseurs = json.loads(tous_raw)
+    else:
+        tous_fournisseurs = [fournisseur_principal] if fournisseur_principal else []
+    return Piece(
+        RéfPièce=piece_dict["RéfPièce"],
+        NomPièce=safe_string(piece_dict.get("NomPièce", "")),
+        DescriptionPièce=safe_string(piece_dict.get("DescriptionPièce", "")),
+        NumPièce=safe_string(piece_dict.get("NumPièce", "")),
+        NumPièceAutreFournisseur=safe_string(piece_dict.get("NumPièceAutreFournisseur", "")),
+        Lieuentreposage=safe_string(piece_dict.get("Lieuentreposage", "")),
+        QtéenInventaire=qty_inventaire,
+        Qtéminimum=qty_minimum,
+        Qtémax=qty_max,
+        Qtéàcommander=calculate_qty_to_order(qty_inventaire, qty_minimum, qty_max),
+        Qtécommandée=safe_int(piece_dict.get("Qtécommandée")),
+        Prix_unitaire=safe_float(piece_dict.get("Prix unitaire", 0)),
+        Soumission_LD=safe_string(piece_dict.get("Soumission LD", "")),
+        SoumDem=piece_dict.get("SoumDem", ""),
+        fournisseur_principal=fournisseur_principal,
+        fournisseurs=tous_fournisseurs,
+        NomFabricant=safe_string(piece_dict.get("NomFabricant", "")),
+        RefFabricant=piece_dict.get("RefFabricant"),
+        statut_stock=get_stock_status(qty_inventaire, qty_minimum),
+        Created=piece_dict.get("Created"),
+        Modified=piece_dict.get("Modified"),
+        RTBS=piece_dict.get("RTBS"),
+        devise=safe_string(piece_dict.get("devise", "CAD")) or "CAD",
+        RefDepartement=piece_dict.get("RefDepartement"),
+        NomDepartement=safe_string(piece_dict.get("NomDepartement", "")),
+        NoFESTO=safe_string(piece_dict.get("NoFESTO")),
+    )
+
+
+def legacy_commande(piece_dict: dict) -> Commande:
+    fournisseur_principal = None
+    if piece_dict.get("fournisseur_principal_nom"):
+        fournisseur_principal = {
+            "RéfFournisseur": piece_dict.get("ref_four_principal"),
+            "NomFournisseur": safe_string(piece_dict.get("fournisseur_principal_nom", "")),
+            "NumSap": safe_string(piece_dict.get("fournisseur_principal_num_sap", "")),
+            "EstPrincipal": True,
+        }
+    tous_raw = piece_dict.get("tous_fournisseurs")
+    if tous_raw:
+        fournisseurs = [
+            {k: v for k, v in f.items() if k not in ("NuméroTél", "PrixUnitaire")}
+            for f in json.loads(tous_raw)
+        ]
+    else:
+        fournisseurs = [fournisseur_principal] if fournisseur_principal else []
+    return Commande(
+        RéfPièce=piece_dict["RéfPièce"],
+        Datecommande=piece_dict.get("Datecommande"),
+        NomPièce=safe_string(piece_dict.get("NomPièce", "")),
+        NumPièce=safe_string(piece_dict.get("NumPièce", "")),
+        Qtécommandée=safe_int(piece_dict.get("Qtécommandée", 0)),
+        Qtéreçue=safe_int(piece_dict.get("Qtéreçue", 0)),
+        Qtéarecevoir=safe_int(piece_dict.get("Qtéarecevoir", 0)),
+        Cmd_info=safe_string(piece_dict.get("Cmd_info", "")),
+        NumPièceAutreFournisseur=safe_string(piece_dict.get("NumPièceAutreFournisseur", "")),
+        DescriptionPièce=safe_string(piece_dict.get("DescriptionPièce", "")),
+        QtéenInventaire=safe_int(piece_dict.get("QtéenInventaire", 0)),
+        Qtéminimum=safe_int(piece_dict.get("Qtéminimum", 0)),
+        Qtéàcommander=safe_int(piece_dict.get("Qtéàcommander", 0)),
+        Prix_unitaire=safe_float(piece_dict.get("Prix unitaire", 0)),
+        fournisseur_principal=fournisseur_principal,
+        fournisseurs=fournisseurs,
+        NomFabricant=safe_string(piece_dict.get("NomFabricant", "")),
+        Soumission_LD=safe_string(piece_dict.get("Soumission LD", "")),
+        SoumDem=bool(piece_dict.get("SoumDem", False)),
+        devise=safe_string(piece_dict.get("devise", "CAD")) or "CAD",
+        RefDepartement=piece_dict.get("RefDepartement"),
+        NomDepartement="",
+    )
+
+
+def legacy_render(models: list, model) -> bytes:
+    """Chemin response_model de FastAPI : validation, dump JSON-compatible, JSONResponse"""
+    adapter = TypeAdapter(List[model])
+    content = adapter.dump_python(adapter.validate_python(models), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+# ── Après : lignes normalisées en SQL ────────────────────────
+# Émule le résultat des expressions de PIECE_FIELD_SQL / COMMANDE_FIELD_SQL.
+
+def sql_piece_row(r: dict) -> dict:
+    inv, mini = r["QtéenInventaire"] or 0, r["Qtéminimum"] or 0
+    principal = None
+    if r["fournisseur_principal_nom"]:
+        principal = json.dumps({
+            "RéfFournisseur": r["ref_four_principal"], "NomFournisseur": r["fournisseur_principal_nom"],
+            "NuméroTél": r["fournisseur_principal_tel"] or "", "NumSap": r["fournisseur_principal_numsap"] or "",
+            "EstPrincipal": True,
+        })
+    return {
+        "RéfPièce": r["RéfPièce"], "NomPièce": r["NomPièce"],
+        "DescriptionPièce": r["DescriptionPièce"] or "", "NumPièce": r["NumPièce"] or "",
+        "RefFabricant": r["RefFabricant"], "Lieuentreposage": r["Lieuentreposage"] or "",
+        "QtéenInventaire": inv, "Qtéminimum": mini, "Qtécommandée": r["Qtécommandée"] or 0,
+        "Datecommande": None, "Qtémax": r["Qtémax"] or 0,
+        "statut_stock": "critique" if inv < mini else "faible" if inv == mini else "ok",
+        "Prix_unitaire": float(r["Prix unitaire"] or 0), "Soumission_LD": r["Soumission LD"] or "",
+        "SoumDem": r["SoumDem"], "RTBS": r["RTBS"], "NoFESTO": r["NoFESTO"] or "", "Discontinué": "",
+        "devise": r["devise"] or "CAD", "RefDepartement": r["RefDepartement"],
+        "NomDepartement": r["NomDepartement"] or "",
+        "NumPièceAutreFournisseur": r["NumPièceAutreFournisseur"] or "",
+        "Created": r["Created"], "Modified": r["Modified"],
+        "fournisseurs": r["tous_fournisseurs"] or "[]", "fournisseur_principal": principal,
+        "NomFabricant": r["NomFabricant"] or "",
+        "Qtéàcommander": mini - inv if inv < mini and mini > 0 else 0,
+        "Qtéarecevoir": 0, "demandeur": None,
+    }
+
+
+def sql_commande_row(r: dict) -> dict:
+    principal = None
+    if r["fournisseur_principal_nom"]:
+        principal = json.dumps({
+            "RéfFournisseur": r["ref_four_principal"], "NomFournisseur": r["fournisseur_principal_nom"],
+            "NumSap": r["fournisseur_principal_num_sap"] or "", "EstPrincipal": True,
+        })
+    fournisseurs = [
+        {k: v for k, v in f.items() if k not in ("NuméroTél", "PrixUnitaire")}
+        for f in json.loads(r["tous_fournisseurs"] or "[]")
+    ]
+    return {
+        "RéfPièce": r["RéfPièce"], "NomPièce": r["NomPièce"] or "",
+        "DescriptionPièce": r["DescriptionPièce"] or "", "NumPièce": r["NumPièce"] or "",
+        "RéfFournisseur": None, "RéfAutreFournisseur": None, "RefFabricant": None,
+        "NumPièceAutreFournisseur": r["NumPièceAutreFournisseur"] or "", "Lieuentreposage": "",
+        "QtéenInventaire": r["QtéenInventaire"] or 0, "Qtéminimum": r["Qtéminimum"] or 0, "Qtémax": 100,
+        "Qtécommandée": r["Qtécommandée"] or 0, "Datecommande": r["Datecommande"],
+        "Qtéreçue": r["Qtéreçue"] or 0, "Qtéarecevoir": r["Qtéarecevoir"] or 0, "Cmd_info": r["Cmd_info"] or "",
+        "Qtéàcommander": 0, "Prix_unitaire": float(r["Prix unitaire"] or 0),
+        "fournisseurs": json.dumps(fournisseurs), "fournisseur_principal": principal,
+        "autre_fournisseur": None, "NomFabricant": r["NomFabricant"] or "",
+        "Soumission_LD": r["Soumission LD"] or "", "SoumDem": bool(r["SoumDem"]),
+        "RTBS": None, "NoFESTO": "", "NumSap": "", "devise": r["devise"] or "CAD",
+        "RefDepartement": r["RefDepartement"], "NomDepartement": "",
+    }
+
+
+# ── Mesure ──────────────────────────────────────────────────
+
+def _best_of(func, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(name: str, raw_rows: list, legacy_row, model, sql_row):
+    sql_rows = [sql_row(r) for r in raw_rows]
+
+    def before():
+        return legacy_render([legacy_row(r) for r in raw_rows], model)
+
+    def after():
+        return dumps(rows_to_dicts(sql_rows, ("fournisseurs", "fournisseur_principal")))
+
+    if before() != after():
+        raise SystemExit(f"❌ {name} : les deux chemins ne produisent pas le même JSON")
+
+    t_before, t_after = _best_of(before), _best_of(after)
+    count = len(raw_rows)
+    print(f"{name:<16} avant {count / t_before:>12,.0f} lignes/s   "
+          f"après {count / t_after:>12,.0f} lignes/s   (x{t_before / t_after:.1f})")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    raw_rows = make_raw_rows(count)
+    print(f"{count} lignes — encodeur : {'orjson' if orjson else 'json (standard)'}")
+    run("GET /pieces", raw_rows, legacy_piece, Piece, sql_piece_row)
+    run("GET /commande", raw_rows, legacy_commande, Commande, sql_commande_row)
+
+
+if __name__ == "__main__":
+    main()
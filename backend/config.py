@@ -11,11 +11,7 @@ def get_base_path():
     - Avec PyInstaller: dossier de l'exécutable
     """
     if getattr(sys, 'frozen', False):
-        base = Path(sys.executable).parent
-        print(f"🔧 Mode PyInstaller détecté")
-        print(f"📂 Chemin exe: {sys.executable}")
-        print(f"📂 Base directory: {base}")
-        return base
+        return Path(sys.executable).parent
     else:
         return Path(__file__).parent
 
@@ -37,21 +33,100 @@ POSTGRES_DB = os.environ['POSTGRES_DB']
 
 DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
 
+# Pool de connexions asyncpg
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '10'))
+# Secondes avant fermeture d'une connexion inutilisée (0 = jamais)
+DB_MAX_INACTIVE_CONNECTION_LIFETIME = float(os.environ.get('DB_MAX_INACTIVE_CONNECTION_LIFETIME', '300'))
+# Requêtes préparées gardées par connexion (0 = désactivé, ex. derrière pgbouncer en mode transaction)
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', '100'))
+# Avertissement dans le journal si une connexion est gardée plus longtemps (secondes, 0 = jamais)
+DB_HOLD_WARNING_SECONDS = float(os.environ.get('DB_HOLD_WARNING_SECONDS', '5'))
+
+# Profilage des requêtes HTTP : seuil (secondes) du journal des requêtes lentes (0 = désactivé)
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', '1'))
+# En-tête Server-Timing (temps DB / Python visibles dans les outils de développement du navigateur)
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '').lower() in ('1', 'true', 'yes', 'on')
+# Seuil (secondes) du journal des requêtes SQL lentes (0 = agrégats seulement)
+SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_SECONDS', '0.5'))
+# Jeton (Authorization: Bearer) du collecteur Prometheus pour /api/metrics ; sans lui,
+# la permission debug_access est requise
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 # Configuration CORS
 CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '*').split(',')
 GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY', '')
 GOOGLE_CSE_ID = os.environ.get('GOOGLE_CSE_ID', '')
 
-# Debug paths
-print(f"=" * 50)
-print(f"📍 Base directory: {BASE_DIR}")
-print(f"📍 Build directory: {BUILD_DIR}")
-print(f"📍 Build exists? {BUILD_DIR.exists()}")
-if BUILD_DIR.exists():
-    print(f"✅ Dossier 'build' trouvé!")
-    print(f"📁 Contenu du dossier build:")
-    for item in BUILD_DIR.iterdir():
-        print(f"  - {item.name}")
-else:
-    print(f"❌ Dossier 'build' INTROUVABLE")
-print(f"=" * 50)
\ No newline at end of file
+# Recherche des pièces : 'auto' (index mémoire si pg_trgm indisponible), 'memory' ou 'postgres'
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto').lower()
+
+# Durée de validité (secondes) des statistiques du tableau de bord gardées en mémoire
+STATS_CACHE_TTL = float(os.environ.get('STATS_CACHE_TTL', '60'))
+
+# Paramètres de l'application (AppSettings) gardés en mémoire, invalidés par LISTEN/NOTIFY ;
+# relus au plus tard après ce délai (secondes, 0 = seulement sur notification)
+APP_SETTINGS_CACHE_TTL = float(os.environ.get('APP_SETTINGS_CACHE_TTL', '300'))
+
+# Jetons : accès court (minutes), rafraîchissement à rotation (jours) ; réutilisation
+# tolérée d'un jeton de rafraîchissement pendant N secondes (onglets simultanés)
+ACCESS_TOKEN_TTL_MINUTES = float(os.environ.get('ACCESS_TOKEN_TTL_MINUTES', '15'))
+REFRESH_TOKEN_TTL_DAYS = int(os.environ.get('REFRESH_TOKEN_TTL_DAYS', '90'))
+REFRESH_TOKEN_REUSE_GRACE_SECONDS = float(os.environ.get('REFRESH_TOKEN_REUSE_GRACE_SECONDS', '30'))
+
+# Calculs bcrypt simultanés (threads dédiés) et calculs en attente avant refus 503 (0 = illimité)
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', str(min(os.cpu_count() or 1, 4))))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT', '64'))
+# Échecs de connexion tolérés par utilisateur et par adresse IP sur la fenêtre (secondes),
+# tous workers confondus (table "LoginFailures") ; 0 = sans limite
+LOGIN_MAX_FAILURES_PER_USER = int(os.environ.get('LOGIN_MAX_FAILURES_PER_USER', '5'))
+LOGIN_MAX_FAILURES_PER_IP = int(os.environ.get('LOGIN_MAX_FAILURES_PER_IP', '50'))
+LOGIN_RATE_WINDOW_SECONDS = float(os.environ.get('LOGIN_RATE_WINDOW_SECONDS', '300'))
+
+# Journalisation : niveau, fichier JSON avec rotation, copie texte sur la console
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FILE = os.environ.get('LOG_FILE', str(BASE_DIR / "InvRob.log"))
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', '5'))
+LOG_CONSOLE = os.environ.get('LOG_CONSOLE', '1').lower() in ('1', 'true', 'yes', 'on')
+
+# File d'envoi des emails ("EmailOutbox") : messages par connexion SMTP, intervalle de scrutation (secondes)
+EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get('EMAIL_OUTBOX_BATCH_SIZE', '50'))
+EMAIL_OUTBOX_POLL_SECONDS = float(os.environ.get('EMAIL_OUTBOX_POLL_SECONDS', '10'))
+# Tentatives avant abandon ; délai entre tentatives = base × 2^(tentative - 1)
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', '5'))
+EMAIL_OUTBOX_RETRY_SECONDS = float(os.environ.get('EMAIL_OUTBOX_RETRY_SECONDS', '60'))
+# Jours de conservation des emails envoyés (0 = jamais purgés)
+EMAIL_OUTBOX_RETENTION_DAYS = int(os.environ.get('EMAIL_OUTBOX_RETENTION_DAYS', '30'))
+
+# Regroupement des notifications "pièces à commander" / "pièce commandée" :
+# un seul email par utilisateur toutes les N secondes (0 = un email par événement)
+NOTIFICATION_DIGEST_SECONDS = float(os.environ.get('NOTIFICATION_DIGEST_SECONDS', '300'))
+
+# Connexions SMTP simultanées du processus (moteur d'envoi choisi dans les paramètres : email_backend)
+SMTP_CONCURRENCY = int(os.environ.get('SMTP_CONCURRENCY', '4'))
+# Dossier des fichiers .eml du moteur "file" (fixé par l'environnement, jamais par les paramètres)
+EMAIL_FILE_DIR = Path(os.environ.get('EMAIL_FILE_DIR', str(BASE_DIR / "mails")))
+
+# Serveur HTTP : adresse d'écoute et nombre de processus workers (1 = un seul processus)
+HOST = os.environ.get('HOST', '0.0.0.0')
+PORT = int(os.environ.get('PORT', '2549'))
+WEB_WORKERS = int(os.environ.get('WEB_WORKERS', '1'))
+# Connexions PostgreSQL pour l'ensemble des workers (0 = DB_POOL_MAX_SIZE par worker) ;
+# chaque worker en garde une pour LISTEN/NOTIFY, le reste est partagé entre leurs pools
+DB_CONNECTION_BUDGET = int(os.environ.get('DB_CONNECTION_BUDGET', '0'))
+# Redémarrage d'un worker après N requêtes (0 = jamais), délai accordé aux requêtes en cours à l'arrêt
+WORKER_MAX_REQUESTS = int(os.environ.get('WORKER_MAX_REQUESTS', '0'))
+GRACEFUL_SHUTDOWN_SECONDS = float(os.environ.get('GRACEFUL_SHUTDOWN_SECONDS', '30'))
+# Port local du collecteur de journaux du superviseur (renseigné par le lanceur multi-workers)
+LOG_SOCKET_PORT = int(os.environ.get('LOG_SOCKET_PORT', '0'))
+
+
+def log_paths(logger):
+    """Chemins détectés au démarrage (diagnostic PyInstaller / build frontend)"""
+    if getattr(sys, 'frozen', False):
+        logger.info(f"🔧 Mode PyInstaller détecté, exe: {sys.executable}")
+    logger.info(f"📍 Base directory: {BASE_DIR}")
+    logger.info(f"📍 Build directory: {BUILD_DIR} (existe: {BUILD_DIR.exists()})")
+    if BUILD_DIR.exists():
+        logger.debug("📁 Contenu du dossier build: %s", [item.name for item in BUILD_DIR.iterdir()])
\ No newline at end of file
@@ -1,26 +1,77 @@
 """Gestion de la connexion à la base de données"""
 import asyncpg
 import logging
+import time
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional
 from fastapi import Request
 
-from config import DATABASE_URL
-from utils.settings import ensure_app_settings_table
+from config import (
+    DATABASE_URL, SEARCH_BACKEND,
+    DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_MAX_INACTIVE_CONNECTION_LIFETIME, DB_STATEMENT_CACHE_SIZE,
+    DB_HOLD_WARNING_SECONDS, SLOW_QUERY_SECONDS, DB_CONNECTION_BUDGET, WEB_WORKERS,
+    EMAIL_OUTBOX_BATCH_SIZE, EMAIL_OUTBOX_POLL_SECONDS, EMAIL_OUTBOX_MAX_ATTEMPTS, EMAIL_OUTBOX_RETRY_SECONDS,
+    EMAIL_OUTBOX_RETENTION_DAYS, NOTIFICATION_DIGEST_SECONDS,
+)
+from utils.settings import (
+    ensure_app_settings_table, get_app_settings, settings_cache, on_settings_notification, SETTINGS_CHANNEL,
+)
+from utils.pg_listener import PgListener
+from utils.piece_sync import PIECES_CHANNEL, PieceChangeListener
+from utils.migrations import run_migrations, MIGRATIONS_LOCK_ID
+from utils.indexes import (
+    ensure_pieces_indexes, ensure_historique_indexes, ensure_fournisseurs_indexes, ensure_soumissions_indexes,
+)
+from utils.search import ensure_pieces_search_index, ensure_fournisseurs_search_index
+from utils.search_index import PieceSearchIndex
+from utils.metrics import InstrumentedPool, PoolMetrics, NO_ROUTE, route_label
+from utils.profiling import record_query
+from utils.slow_queries import SlowQueryRecorder, install_query_logger
+from utils.email_outbox import EmailOutboxWorker
+from notification_service import configure_digest, flush_due_digests
+from auth import on_token_notification, on_token_reconnect, load_revoked_tokens, TOKEN_CHANNEL
 
 logger = logging.getLogger("Inventaire-Robot")
 
+
+def pool_limits(workers: int = WEB_WORKERS, budget: int = DB_CONNECTION_BUDGET,
+                min_size: int = DB_POOL_MIN_SIZE, max_size: int = DB_POOL_MAX_SIZE):
+    """
+    (min_size, max_size) du pool d'un worker. Avec un budget global de connexions,
+    chaque worker en reçoit une part égale, moins sa connexion LISTEN/NOTIFY.
+    """
+    if budget > 0:
+        max_size = max(budget // max(workers, 1) - 1, 1)
+    return min(min_size, max_size), max_size
+
+
 @asynccontextmanager
 async def lifespan(app):
     """Gestion du cycle de vie de l'application (startup/shutdown)"""
     # STARTUP
+    app.state.search_capabilities = {"fts": False, "trgm": False}
+    app.state.piece_search_index = None
+    app.state.inventory_stats = None
+    app.state.query_recorder = recorder = SlowQueryRecorder(SLOW_QUERY_SECONDS)
+    app.state.email_outbox = None
+    app.state.pg_listener = None
+    configure_digest(NOTIFICATION_DIGEST_SECONDS)
+
+    async def init_connection(conn):
+        install_query_logger(conn, recorder)
+
     try:
-        app.state.pool = await asyncpg.create_pool(
+        min_size, max_size = pool_limits()
+        pool = await asyncpg.create_pool(
             DATABASE_URL,
-            min_size=1,
-            max_size=10
+            min_size=min_size,
+            max_size=max_size,
+            max_inactive_connection_lifetime=DB_MAX_INACTIVE_CONNECTION_LIFETIME,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            init=init_connection,
         )
-        logger.info(f"✅ Connexion PostgreSQL réussie")
+        app.state.pool = InstrumentedPool(pool, PoolMetrics(DB_HOLD_WARNING_SECONDS))
+        logger.info(f"✅ Connexion PostgreSQL réussie (pool {min_size}-{max_size})")
 
         async with app.state.pool.acquire() as conn:
             try:
@@ -29,11 +80,90 @@ async def lifespan(app):
             except Exception:
                 logger.info("⚠️ Table 'Pièce' introuvable")
 
+            # Plusieurs workers démarrent en même temps : un seul crée tables et index à la fois
+            await conn.execute('SELECT pg_advisory_lock($1)', MIGRATIONS_LOCK_ID)
             try:
-                await ensure_app_settings_table(conn)
-                logger.info("✅ Tables de paramètres et bons de commande prêtes")
-            except Exception as table_err:
-                logger.exception("❌ Impossible de créer les tables de paramètres : %s", table_err)
+                try:
+                    await ensure_app_settings_table(conn)
+                    await get_app_settings(conn)
+                    logger.info("✅ Tables de paramètres et bons de commande prêtes")
+                except Exception as table_err:
+                    logger.exception("❌ Impossible de créer les tables de paramètres : %s", table_err)
+
+                try:
+                    applied = await run_migrations(conn)
+                    logger.info(f"✅ Migrations de schéma à jour {applied or ''}")
+                except Exception as migration_err:
+                    logger.exception("❌ Échec des migrations de schéma : %s", migration_err)
+
+                try:
+                    await ensure_pieces_indexes(conn)
+                    logger.info("✅ Index de pagination des pièces prêts")
+                except Exception as index_err:
+                    logger.exception("❌ Impossible de créer les index des pièces : %s", index_err)
+
+                try:
+                    await ensure_historique_indexes(conn)
+                    logger.info("✅ Index de l'historique prêts")
+                except Exception as index_err:
+                    logger.exception("❌ Impossible de créer les index de l'historique : %s", index_err)
+
+                try:
+                    await ensure_fournisseurs_indexes(conn)
+                    logger.info("✅ Index des fournisseurs prêts")
+                except Exception as index_err:
+                    logger.exception("❌ Impossible de créer les index des fournisseurs : %s", index_err)
+
+                try:
+                    await ensure_soumissions_indexes(conn)
+                    logger.info("✅ Index des soumissions prêts")
+                except Exception as index_err:
+                    logger.exception("❌ Impossible de créer les index des soumissions : %s", index_err)
+
+                try:
+                    app.state.search_capabilities = await ensure_pieces_search_index(conn)
+                    await ensure_fournisseurs_search_index(conn)
+                    logger.info(f"✅ Index de recherche des pièces prêts : {app.state.search_capabilities}")
+                except Exception as search_err:
+                    logger.exception("❌ Impossible de créer l'index de recherche : %s", search_err)
+            finally:
+                await conn.execute('SELECT pg_advisory_unlock($1)', MIGRATIONS_LOCK_ID)
+
+            try:
+                await load_revoked_tokens(conn)
+            except Exception as revoked_err:
+                logger.exception("❌ Impossible de charger les jetons révoqués : %s", revoked_err)
+
+            use_memory_index = SEARCH_BACKEND == "memory" or (
+                SEARCH_BACKEND == "auto" and not app.state.search_capabilities.get("trgm")
+            )
+            if use_memory_index:
+                try:
+                    index = PieceSearchIndex()
+                    await index.build(conn)
+                    app.state.piece_search_index = index
+                    logger.info(f"✅ Index de recherche mémoire construit ({len(index)} pièces)")
+                except Exception as memory_err:
+                    logger.exception("❌ Impossible de construire l'index mémoire : %s", memory_err)
+
+        app.state.pg_listener = PgListener(DATABASE_URL)
+        app.state.pg_listener.listen(SETTINGS_CHANNEL, on_settings_notification, on_reconnect=settings_cache.invalidate)
+        app.state.pg_listener.listen(TOKEN_CHANNEL, on_token_notification, on_reconnect=on_token_reconnect(app.state.pool))
+        piece_listener = PieceChangeListener(app)
+        app.state.pg_listener.listen(PIECES_CHANNEL, piece_listener.on_notification, on_reconnect=piece_listener.on_reconnect)
+        await app.state.pg_listener.start()
+
+        app.state.email_outbox = EmailOutboxWorker(
+            app.state.pool,
+            batch_size=EMAIL_OUTBOX_BATCH_SIZE,
+            poll_interval=EMAIL_OUTBOX_POLL_SECONDS,
+            max_attempts=EMAIL_OUTBOX_MAX_ATTEMPTS,
+            retry_base=EMAIL_OUTBOX_RETRY_SECONDS,
+            retention_days=EMAIL_OUTBOX_RETENTION_DAYS,
+            jobs=[flush_due_digests],
+        )
+        app.state.email_outbox.start()
+        logger.info("✅ File d'envoi des emails démarrée")
     except Exception as e:
         logger.exception("❌ Erreur connexion PostgreSQL: %s", e)
         app.state.pool = None
@@ -41,22 +171,100 @@ async def lifespan(app):
     yield
 
     # SHUTDOWN
+    if app.state.email_outbox is not None:
+        await app.state.email_outbox.stop()
+
+    if app.state.pg_listener is not None:
+        await app.state.pg_listener.stop()
+
     if hasattr(app.state, 'pool') and app.state.pool:
         await app.state.pool.close()
         logger.info("Pool PostgreSQL fermé.")
 
 
-async def get_db_connection(request: Request) -> AsyncGenerator[asyncpg.Connection, None]:
-    """Dependency pour obtenir une connexion DB"""
-    pool = request.app.state.pool
-    conn = await pool.acquire()
+class LazyConnection:
+    """
+    Connexion du pool réservée seulement à la première requête SQL.
+
+    Les routes qui échouent avant d'interroger la base (validation, cache) ne
+    prennent donc pas de connexion. release() la rend au pool avant la
+    sérialisation d'une grosse réponse ; une requête ultérieure en reprend une.
+    """
+
+    def __init__(self, pool: InstrumentedPool, route: str = NO_ROUTE):
+        self._pool = pool
+        self._route = route
+        self._conn: Optional[asyncpg.Connection] = None
+
+    @property
+    def acquired(self) -> bool:
+        return self._conn is not None
+
+    async def acquire(self) -> asyncpg.Connection:
+        if self._conn is None:
+            self._conn = await self._pool.acquire(route=self._route)
+        return self._conn
+
+    async def release(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            await self._pool.release(conn)
+
+    async def _run(self, method: str, query: str, *args, **kwargs):
+        conn = await self.acquire()
+        start = time.perf_counter()
+        try:
+            return await getattr(conn, method)(query, *args, **kwargs)
+        finally:
+            record_query(query, time.perf_counter() - start)
+
+    async def execute(self, query: str, *args, **kwargs):
+        return await self._run("execute", query, *args, **kwargs)
+
+    async def executemany(self, query: str, *args, **kwargs):
+        return await self._run("executemany", query, *args, **kwargs)
+
+    async def fetch(self, query: str, *args, **kwargs):
+        return await self._run("fetch", query, *args, **kwargs)
+
+    async def fetchrow(self, query: str, *args, **kwargs):
+        return await self._run("fetchrow", query, *args, **kwargs)
+
+    async def fetchval(self, query: str, *args, **kwargs):
+        return await self._run("fetchval", query, *args, **kwargs)
+
+    def transaction(self, **kwargs):
+        return _LazyTransaction(self, kwargs)
+
+
+class _LazyTransaction:
+    """async with conn.transaction() : réserve la connexion à l'entrée du bloc"""
+
+    def __init__(self, lazy: LazyConnection, kwargs: dict):
+        self._lazy = lazy
+        self._kwargs = kwargs
+        self._transaction = None
+
+    async def __aenter__(self):
+        conn = await self._lazy.acquire()
+        self._transaction = conn.transaction(**self._kwargs)
+        return await self._transaction.__aenter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return await self._transaction.__aexit__(exc_type, exc, tb)
+
+
+async def get_db_connection(request: Request) -> AsyncGenerator[LazyConnection, None]:
+    """Dependency pour obtenir une connexion DB (réservée à la première utilisation)"""
+    conn = LazyConnection(request.app.state.pool, route_label(request.scope))
     try:
         yield conn
     except Exception:
-        try:
-            await conn.execute("ROLLBACK")
-        except Exception:
-            pass
+        if conn.acquired:
+            try:
+                await conn.execute("ROLLBACK")
+            except Exception:
+                pass
         raise
     finally:
-        await pool.release(conn)
\ No newline at end of file
+        await conn.release()
@@ -19,7 +19,80 @@ SMTP_SSL      = os.getenv("SMTP_SSL", "false").lower() == "true"   # SSL direct
 APP_URL       = os.getenv("APP_URL", "http://localhost:5173")
 
 
-from typing import Optional
+from typing import List, Optional, Tuple
+
+# Erreurs propres à un message : inutile de le renvoyer plus tard
+PERMANENT_ERRORS = (
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPSenderRefused,
+    smtplib.SMTPDataError,
+)
+
+
+def resolve_smtp_config(smtp_config: Optional[dict] = None) -> dict:
+    """Configuration SMTP effective : valeurs de smtp_config, sinon variables d'environnement."""
+    return {
+        "host": smtp_config.get('host') if smtp_config else SMTP_HOST,
+        "port": smtp_config.get('port') if smtp_config else SMTP_PORT,
+        "from": smtp_config.get('from') if smtp_config and smtp_config.get('from') else SMTP_FROM,
+        "user": smtp_config.get('user') if smtp_config else SMTP_USER,
+        "password": smtp_config.get('password') if smtp_config else SMTP_PASSWORD,
+        "tls": smtp_config.get('tls') if smtp_config and smtp_config.get('tls') is not None else SMTP_TLS,
+        "ssl": smtp_config.get('ssl') if smtp_config and smtp_config.get('ssl') is not None else SMTP_SSL,
+    }
+
+
+def build_message(sender: str, to: str, subject: str, body_html: str) -> MIMEMultipart:
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = subject
+    msg["From"] = sender
+    msg["To"] = to
+    msg.attach(MIMEText(body_html, "html", "utf-8"))
+    return msg
+
+
+class SmtpSession:
+    """
+    Connexion SMTP (TLS et authentification compris) ouverte une seule fois
+    pour plusieurs messages :
+
+        with SmtpSession(config) as session:
+            session.send(to, subject, body_html)
+    """
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.server: Optional[smtplib.SMTP] = None
+
+    def __enter__(self) -> "SmtpSession":
+        cfg = self.config
+        if cfg["ssl"]:
+            server = smtplib.SMTP_SSL(cfg["host"], cfg["port"], timeout=15)
+        else:
+            server = smtplib.SMTP(cfg["host"], cfg["port"], timeout=15)
+        try:
+            server.ehlo()
+            if cfg["tls"] and not cfg["ssl"]:
+                server.starttls()
+                server.ehlo()
+            if cfg["user"]:
+                server.login(cfg["user"], cfg["password"])
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+        return self
+
+    def send(self, to: str, subject: str, body_html: str):
+        msg = build_message(self.config["from"], to, subject, body_html)
+        self.server.sendmail(self.config["from"], [to], msg.as_string())
+
+    def __exit__(self, *exc):
+        try:
+            self.server.quit()
+        except Exception:
+            self.server.close()
+        self.server = None
 
 
 def send_email(to: str, subject: str, body_html: str, smtp_config: Optional[dict] = None) -> bool:
@@ -32,42 +105,17 @@ def send_email(to: str, subject: str, body_html: str, smtp_config: Optional[dict
         logger.warning("⚠️ send_email appelé sans destinataire — ignoré")
         return False
 
-    host = smtp_config.get('host') if smtp_config else SMTP_HOST
-    port = smtp_config.get('port') if smtp_config else SMTP_PORT
-    sender = smtp_config.get('from') if smtp_config and smtp_config.get('from') else SMTP_FROM
-    user = smtp_config.get('user') if smtp_config else SMTP_USER
-    password = smtp_config.get('password') if smtp_config else SMTP_PASSWORD
-    tls = smtp_config.get('tls') if smtp_config and smtp_config.get('tls') is not None else SMTP_TLS
-    ssl = smtp_config.get('ssl') if smtp_config and smtp_config.get('ssl') is not None else SMTP_SSL
-
+    cfg = resolve_smtp_config(smtp_config)
+    host, port = cfg["host"], cfg["port"]
     if not host or not port:
         logger.error("❌ Configuration SMTP incomplète")
         return False
 
     try:
-        msg = MIMEMultipart("alternative")
-        msg["Subject"] = subject
-        msg["From"] = sender
-        msg["To"] = to
-        msg.attach(MIMEText(body_html, "html", "utf-8"))
+        logger.info(f"📧 Tentative envoi → {to} | host={host}:{port} | tls={cfg['tls']} | ssl={cfg['ssl']} | auth={'oui' if cfg['user'] else 'non'}")
 
-        logger.info(f"📧 Tentative envoi → {to} | host={host}:{port} | tls={tls} | ssl={ssl} | auth={'oui' if user else 'non'}")
-
-        if ssl:
-            with smtplib.SMTP_SSL(host, port, timeout=15) as server:
-                server.ehlo()
-                if user:
-                    server.login(user, password)
-                server.sendmail(sender, [to], msg.as_string())
-        else:
-            with smtplib.SMTP(host, port, timeout=15) as server:
-                server.ehlo()
-                if tls:
-                    server.starttls()
-                    server.ehlo()
-                if user:
-                    server.login(user, password)
-                server.sendmail(sender, [to], msg.as_string())
+        with SmtpSession(cfg) as session:
+            session.send(to, subject, body_html)
 
         logger.info(f"✅ Email envoyé à {to} — {subject}")
         return True
@@ -76,22 +124,56 @@ def send_email(to: str, subject: str, body_html: str, smtp_config: Optional[dict
         logger.error(f"❌ Destinataire refusé {to}: {e}")
         return False
     except smtplib.SMTPSenderRefused as e:
-        logger.error(f"❌ Expéditeur refusé ({SMTP_FROM}): {e} — vérifiez SMTP_FROM dans .env")
+        logger.error(f"❌ Expéditeur refusé ({cfg['from']}): {e} — vérifiez SMTP_FROM dans .env")
         return False
     except smtplib.SMTPAuthenticationError as e:
         logger.error(f"❌ Authentification SMTP échouée: {e} — vérifiez SMTP_USER/SMTP_PASSWORD")
         return False
     except ConnectionRefusedError:
-        logger.error(f"❌ Connexion refusée à {SMTP_HOST}:{SMTP_PORT} — serveur inaccessible")
+        logger.error(f"❌ Connexion refusée à {host}:{port} — serveur inaccessible")
         return False
     except TimeoutError:
-        logger.error(f"❌ Timeout connexion SMTP {SMTP_HOST}:{SMTP_PORT}")
+        logger.error(f"❌ Timeout connexion SMTP {host}:{port}")
         return False
     except Exception as e:
         logger.error(f"❌ Erreur envoi email à {to}: {type(e).__name__}: {e}")
         return False
 
 
+def send_batch(
+        messages: List[Tuple[str, str, str]],
+        smtp_config: Optional[dict] = None,
+) -> List[Tuple[bool, Optional[str], bool]]:
+    """
+    Envoie une liste de (destinataire, sujet, corps HTML) sur une seule connexion SMTP.
+
+    Retourne, pour chaque message et dans le même ordre, (envoyé, erreur, permanente).
+    Une erreur de connexion est reportée sur tous les messages non envoyés ;
+    un destinataire refusé n'empêche pas l'envoi des suivants.
+    """
+    if not messages:
+        return []
+    cfg = resolve_smtp_config(smtp_config)
+    if not cfg["host"] or not cfg["port"]:
+        return [(False, "Configuration SMTP incomplète", False)] * len(messages)
+
+    results: List[Tuple[bool, Optional[str], bool]] = []
+    try:
+        with SmtpSession(cfg) as session:
+            for to, subject, body_html in messages:
+                try:
+                    session.send(to, subject, body_html)
+                    results.append((True, None, False))
+                except PERMANENT_ERRORS as e:
+                    results.append((False, f"{type(e).__name__}: {e}", True))
+    except Exception as e:
+        # Connexion perdue ou impossible : le reste du lot sera retenté
+        error = f"{type(e).__name__}: {e}"
+        logger.error(f"❌ Envoi SMTP interrompu ({cfg['host']}:{cfg['port']}): {error}")
+        results.extend([(False, error, False)] * (len(messages) - len(results)))
+    return results
+
+
 # ──────────────────────────────────────────────────────────────
 # Templates de notifications
 # ──────────────────────────────────────────────────────────────
@@ -114,8 +196,8 @@ def _base_template(title: str, content: str) -> str:
     """
 
 
-def send_password_reset_email(to: str, username: str, token: str) -> bool:
-    """Envoie le lien de réinitialisation de mot de passe."""
+def render_password_reset(username: str, token: str) -> Tuple[str, str]:
+    """Lien de réinitialisation de mot de passe. Retourne (sujet, corps HTML)."""
     reset_url = f"{APP_URL}/reset-password?token={token}"
     content = f"""
         <p>Bonjour <strong>{username}</strong>,</p>
@@ -132,11 +214,11 @@ def send_password_reset_email(to: str, username: str, token: str) -> bool:
             Si vous n'avez pas fait cette demande, ignorez cet email.
         </p>
     """
-    return send_email(to, "Réinitialisation de votre mot de passe", _base_template("Réinitialisation", content))
+    return "Réinitialisation de votre mot de passe", _base_template("Réinitialisation", content)
 
 
-def send_notification_pieces_a_commander(to: str, username: str, pieces: list) -> bool:
-    """Notifie qu'il y a des pièces à commander (seuil minimum atteint)."""
+def render_pieces_a_commander(username: str, pieces: list) -> Tuple[str, str]:
+    """Pièces à commander (seuil minimum atteint). Retourne (sujet, corps HTML)."""
     rows = "".join([
         f"""<tr>
           <td style="padding:8px 12px; border-bottom:1px solid #eee;">{p.get('NomPièce','')}</td>
@@ -169,11 +251,11 @@ def send_notification_pieces_a_commander(to: str, username: str, pieces: list) -
         </p>
     """
     nb = len(pieces)
-    return send_email(to, f"⚠️ {nb} pièce{'s' if nb>1 else ''} à commander", _base_template("Pièces à commander", content))
+    return f"⚠️ {nb} pièce{'s' if nb>1 else ''} à commander", _base_template("Pièces à commander", content)
 
 
-def send_notification_demande_approbation(to: str, username: str, piece_nom: str, piece_ref: int, demande_par: str) -> bool:
-    """Notifie un admin qu'une pièce est soumise pour approbation."""
+def render_demande_approbation(username: str, piece_nom: str, piece_ref: int, demande_par: str) -> Tuple[str, str]:
+    """Pièce soumise pour approbation (destiné aux admins). Retourne (sujet, corps HTML)."""
     content = f"""
         <p>Bonjour <strong>{username}</strong>,</p>
         <p>Une nouvelle pièce a été soumise pour approbation par <strong>{demande_par}</strong> :</p>
@@ -188,11 +270,11 @@ def send_notification_demande_approbation(to: str, username: str, piece_nom: str
           </a>
         </p>
     """
-    return send_email(to, f"📋 Demande d'approbation — {piece_nom}", _base_template("Demande d'approbation", content))
+    return f"📋 Demande d'approbation — {piece_nom}", _base_template("Demande d'approbation", content)
 
 
-def send_notification_approbation_result(to: str, username: str, piece_nom: str, statut: str, note: str = "") -> bool:
-    """Notifie l'utilisateur du résultat d'une approbation."""
+def render_approbation_result(username: str, piece_nom: str, statut: str, note: str = "") -> Tuple[str, str]:
+    """Résultat d'une approbation. Retourne (sujet, corps HTML)."""
     if statut == "approuvee":
         color = "#27ae60"
         icon = "✅"
@@ -219,11 +301,11 @@ def send_notification_approbation_result(to: str, username: str, piece_nom: str,
           </a>
         </p>
     """
-    return send_email(to, f"{icon} Approbation {label} — {piece_nom}", _base_template(f"Approbation {label}", content))
+    return f"{icon} Approbation {label} — {piece_nom}", _base_template(f"Approbation {label}", content)
 
 
-def send_notification_piece_commandee(to: str, username: str, piece_nom: str, qte: int) -> bool:
-    """Notifie qu'une pièce vient d'être commandée."""
+def render_piece_commandee(username: str, piece_nom: str, qte: int) -> Tuple[str, str]:
+    """Pièce qui vient d'être commandée. Retourne (sujet, corps HTML)."""
     content = f"""
         <p>Bonjour <strong>{username}</strong>,</p>
         <p>La commande suivante a été passée :</p>
@@ -238,4 +320,61 @@ def send_notification_piece_commandee(to: str, username: str, piece_nom: str, qt
           </a>
         </p>
     """
-    return send_email(to, f"🛒 Commande passée — {piece_nom}", _base_template("Commande passée", content))
\ No newline at end of file
+    return f"🛒 Commande passée — {piece_nom}", _base_template("Commande passée", content)
+
+
+def render_pieces_commandees(username: str, commandes: list) -> Tuple[str, str]:
+    """Résumé de plusieurs commandes (dicts NomPièce, Qté). Retourne (sujet, corps HTML)."""
+    if len(commandes) == 1:
+        return render_piece_commandee(username, commandes[0].get('NomPièce', ''), commandes[0].get('Qté', 0))
+    rows = "".join([
+        f"""<tr>
+          <td style="padding:8px 12px; border-bottom:1px solid #eee;">{c.get('NomPièce','')}</td>
+          <td style="padding:8px 12px; border-bottom:1px solid #eee; text-align:center; font-weight:bold;">{c.get('Qté',0)}</td>
+        </tr>"""
+        for c in commandes
+    ])
+    content = f"""
+        <p>Bonjour <strong>{username}</strong>,</p>
+        <p>Les commandes suivantes ont été passées :</p>
+        <table style="width:100%; border-collapse:collapse; margin:16px 0; font-size:13px;">
+          <thead>
+            <tr style="background:#f5f5f5;">
+              <th style="padding:10px 12px; text-align:left; border-bottom:2px solid #ddd;">Pièce</th>
+              <th style="padding:10px 12px; text-align:center; border-bottom:2px solid #ddd;">Quantité</th>
+            </tr>
+          </thead>
+          <tbody>{rows}</tbody>
+        </table>
+        <p>
+          <a href="{APP_URL}/commandes"
+             style="background:#27ae60; color:white; padding:10px 20px;
+                    text-decoration:none; border-radius:6px; font-size:14px;">
+            Voir les commandes
+          </a>
+        </p>
+    """
+    return f"🛒 {len(commandes)} commandes passées", _base_template("Commandes passées", content)
+
+
+# Envoi immédiat (synchrone) — les notifications passent par la file utils.email_outbox
+
+def send_password_reset_email(to: str, username: str, token: str) -> bool:
+    return send_email(to, *render_password_reset(username, token))
+
+
+def send_notification_pieces_a_commander(to: str, username: str, pieces: list) -> bool:
+    return send_email(to, *render_pieces_a_commander(username, pieces))
+
+
+def send_notification_demande_approbation(to: str, username: str, piece_nom: str, piece_ref: int, demande_par: str) -> bool:
+    return send_email(to, *render_demande_approbation(username, piece_nom, piece_ref, demande_par))
+
+
+def send_notification_approbation_result(to: str, username: str, piece_nom: str, statut: str, note: str = "") -> bool:
+    return send_email(to, *render_approbation_result(username, piece_nom, statut, note))
+
+
+def send_notification_piece_commandee(to: str, username: str, piece_nom: str, qte: int) -> bool:
+    return send_email(to, *render_piece_commandee(username, piece_nom, qte))
+
@@ -1,10 +1,13 @@
 """Export tous les modèles Pydantic"""
-from .piece import PieceBase, PieceCreate, PieceUpdate, Piece, ImageUrlRequest
+from .piece import PieceBase, PieceCreate, PieceUpdate, Piece, PieceSearchResult, ImageUrlRequest
 from .fournisseur import FournisseurBase, FournisseurCreate, Fournisseur, Contact, ContactCreate, ContactBase
 from .fabricant import FabricantBase, FabricantCreate
 from .historique import HistoriqueCreate, HistoriqueResponse
-from .commande import Commande, StatsResponse, ApprobationRequest
-from .soumission import SoumissionCreate, Soumission, PieceSoumission
+from .commande import Commande, DepartementStats, StatsResponse, ApprobationRequest
+from .soumission import (
+    SoumissionCreate, Soumission, PieceSoumission,
+    SoumissionsPiecesRequest, DerniereSoumissionPiece,
+)
 from .soumission_prix import SoumissionPrixBase, SoumissionPrixCreate, SoumissionPrix
 from .user import (
     LoginRequest, CreateUserRequest, UserResponse,
@@ -21,16 +24,17 @@ from .groupe import (
 )
 
 __all__ = [
-    'PieceBase', 'PieceCreate', 'PieceUpdate', 'Piece', 'ImageUrlRequest',
+    'PieceBase', 'PieceCreate', 'PieceUpdate', 'Piece', 'PieceSearchResult', 'ImageUrlRequest',
     'FournisseurBase', 'FournisseurCreate', 'Fournisseur', 'Contact', 'ContactCreate', 'ContactBase',
     'FabricantBase', 'FabricantCreate',
     'HistoriqueCreate', 'HistoriqueResponse',
-    'Commande', 'StatsResponse', 'ApprobationRequest',
+    'Commande', 'DepartementStats', 'StatsResponse', 'ApprobationRequest',
     'CategorieBase', 'CategorieCreate', 'Categorie',
     'GroupeBase', 'GroupeCreate', 'Groupe',
     'GroupePieceBase', 'GroupePieceCreate', 'GroupePiece',
     'GroupeComplet',
     'SoumissionCreate', 'Soumission', 'PieceSoumission',
+    'SoumissionsPiecesRequest', 'DerniereSoumissionPiece',
     'SoumissionPrixBase', 'SoumissionPrixCreate', 'SoumissionPrix',
     'LoginRequest', 'CreateUserRequest', 'UserResponse',
     'ForgotPasswordRequest', 'ResetPasswordRequest',
@@ -36,11 +36,20 @@ class Commande(BaseModel):
     RefDepartement: Optional[int] = None      # ← NOUVEAU
     NomDepartement: Optional[str] = None      # ← NOUVEAU
 
+class DepartementStats(BaseModel):
+    RefDepartement: Optional[int] = None
+    NomDepartement: Optional[str] = ""
+    total_pieces: int = 0
+    stock_critique: int = 0
+    valeur_stock: float = 0.0
+    pieces_a_commander: int = 0
+
 class StatsResponse(BaseModel):
     total_pieces: int
     stock_critique: int
     valeur_stock: float
     pieces_a_commander: int
+    par_departement: List[DepartementStats] = []
 
 class ApprobationRequest(BaseModel):
     note: Optional[str] = None
\ No newline at end of file
@@ -34,4 +34,5 @@ class FournisseurCreate(FournisseurBase):
     pass
 
 class Fournisseur(FournisseurBase):
-    RéfFournisseur: Optional[int] = None
\ No newline at end of file
+    RéfFournisseur: Optional[int] = None
+    nb_pieces: int = 0  # Nombre de pièces liées (PieceFournisseur)
\ No newline at end of file
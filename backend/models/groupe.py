@@ -44,4 +44,6 @@ class GroupePiece(GroupePieceBase):
 class GroupeComplet(Groupe):
     """Groupe avec sa catégorie et ses pièces"""
     categorie: Optional[Categorie] = None
-    pieces: List[GroupePiece] = []
\ No newline at end of file
+    pieces: List[GroupePiece] = []
+    cout_kit: float = 0.0              # Σ Quantite × prix unitaire
+    pieces_sous_minimum: int = 0       # pièces du kit dont le stock est sous le minimum
\ No newline at end of file
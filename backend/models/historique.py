@@ -14,7 +14,7 @@ class HistoriqueCreate(BaseModel):
     qtécommande: Optional[str] = None
     QtéSortie: Optional[str] = None
     nompiece: Optional[str] = None
-    RéfPièce: Optional[float] = None
+    RéfPièce: Optional[int] = None
     User: Optional[str] = None
     Delais: Optional[float] = None
 
@@ -28,7 +28,7 @@ class HistoriqueResponse(BaseModel):
     qtécommande: Optional[str]
     QtéSortie: Optional[str]
     nompiece: Optional[str]
-    RéfPièce: Optional[float]
+    RéfPièce: Optional[int]
     User: Optional[str]
     Delais: Optional[float]
 
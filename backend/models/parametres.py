@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Literal
 
 class FeaturesConfig(BaseModel):
     bon_de_commande: bool = True
@@ -23,6 +23,7 @@ class AppSettingsRequest(BaseModel):
     email_password: Optional[str] = None
     email_tls: Optional[bool] = None
     email_ssl: Optional[bool] = None
+    email_backend: Optional[Literal["auto", "aiosmtp", "thread", "file", "null"]] = None
     features: Optional[FeaturesConfig] = None
 
 class AppSettingsResponse(BaseModel):
@@ -39,4 +40,5 @@ class AppSettingsResponse(BaseModel):
     email_password: str
     email_tls: bool
     email_ssl: bool
+    email_backend: str = "auto"
     features: Dict[str, Any] = Field(default_factory=dict)
@@ -87,5 +87,9 @@ class Piece(PieceBase):
     Qtéarecevoir: Optional[int] = 0
     demandeur: Optional[str] = None
 
+class PieceSearchResult(Piece):
+    """Pièce retournée par la recherche classée, avec son score de pertinence"""
+    score: float = 0.0
+
 class ImageUrlRequest(BaseModel):
     image_url: str
\ No newline at end of file
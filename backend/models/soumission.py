@@ -1,5 +1,5 @@
 """Modèles Pydantic pour les soumissions"""
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 from typing import Optional, List, Dict
@@ -33,3 +33,19 @@ class Soumission(SoumissionCreate):
     NoteStatut: Optional[str] = None
     PieceJointe: Optional[str] = None
     prix_recus: Optional[List[Dict]] = []
+
+class SoumissionsPiecesRequest(BaseModel):
+    pieces: List[int] = Field(..., max_length=1000)
+
+class DerniereSoumissionPiece(BaseModel):
+    RéfPièce: int
+    RefSoumission: Optional[int] = None
+    Statut: Optional[str] = None
+    DateEnvoi: Optional[datetime] = None
+    RéfFournisseur: Optional[int] = None
+    fournisseur_nom: Optional[str] = None
+    meilleur_prix: Optional[float] = None
+    meilleur_prix_delai: Optional[str] = None
+    meilleur_prix_fournisseur: Optional[str] = None
+    meilleur_prix_date: Optional[datetime] = None
+    nb_prix: int = 0
@@ -1,16 +1,51 @@
 import logging
 import json as _json
-import asyncio
 import asyncpg
 from email_service import (
-    send_notification_pieces_a_commander,
-    send_notification_demande_approbation,
-    send_notification_approbation_result,
-    send_notification_piece_commandee,
+    render_pieces_a_commander,
+    render_demande_approbation,
+    render_approbation_result,
+    render_piece_commandee,
+    render_pieces_commandees,
 )
+from utils.email_outbox import enqueue_emails
 
 logger = logging.getLogger("Inventaire-Robot")
 
+# Notifications regroupées par utilisateur sur la fenêtre de configure_digest()
+# type → (clé de l'élément, fonction de rendu du résumé)
+DIGEST_KINDS = {
+    "pieces_a_commander": (
+        lambda p: str(p.get('RéfPièce') or p.get('NumPièce') or p.get('NomPièce', '')),
+        render_pieces_a_commander,
+    ),
+    "piece_commandee": (
+        lambda c: str(c.get('RéfPièce') or c.get('NomPièce', '')),
+        render_pieces_commandees,
+    ),
+}
+
+# Secondes de regroupement (0 = un email par événement)
+_digest_window = 0.0
+
+
+def configure_digest(window_seconds: float):
+    global _digest_window
+    _digest_window = max(float(window_seconds or 0), 0.0)
+
+
+def _pref_enabled(prefs_raw, pref_key: str) -> bool:
+    # Parser JSON si c'est une string, ou utiliser directement si c'est un dict
+    if isinstance(prefs_raw, str):
+        prefs = _json.loads(prefs_raw) if prefs_raw else {}
+    elif isinstance(prefs_raw, dict):
+        prefs = prefs_raw
+    else:
+        prefs = {}
+    # Par défaut True pour la plupart des notifs sauf piece_commandee
+    default = False if pref_key == "piece_commandee" else True
+    return bool(prefs.get(pref_key, default))
+
 
 async def _get_users_with_pref(conn: asyncpg.Connection, pref_key: str) -> list[dict]:
     """
@@ -21,21 +56,107 @@ async def _get_users_with_pref(conn: asyncpg.Connection, pref_key: str) -> list[
            FROM users
            WHERE email IS NOT NULL AND email != ''"""
     )
-    result = []
-    for row in rows:
-        # Parser JSON si c'est une string, ou utiliser directement si c'est un dict
-        prefs_raw = row['notification_prefs']
-        if isinstance(prefs_raw, str):
-            prefs = _json.loads(prefs_raw) if prefs_raw else {}
-        elif isinstance(prefs_raw, dict):
-            prefs = prefs_raw
-        else:
-            prefs = {}
-        # Par défaut True pour la plupart des notifs sauf piece_commandee
-        default = False if pref_key == "piece_commandee" else True
-        if prefs.get(pref_key, default):
-            result.append({"username": row['username'], "email": row['email']})
-    return result
+    return [
+        {"username": row['username'], "email": row['email']}
+        for row in rows
+        if _pref_enabled(row['notification_prefs'], pref_key)
+    ]
+
+
+async def _enqueue(conn: asyncpg.Connection, pref_key: str, messages: list):
+    """
+    Met les notifications dans la file d'envoi (utils.email_outbox) ; l'envoi SMTP
+    se fait ensuite par lots, hors de la requête. messages = [(user, (sujet, html))]
+    """
+    if not messages:
+        return
+    try:
+        await enqueue_emails(conn, [(u['email'], subject, html) for u, (subject, html) in messages])
+        logger.info(f"📧 Notif {pref_key} → {', '.join(u['username'] for u, _ in messages)}")
+    except Exception as e:
+        logger.error(f"❌ Notif {pref_key} : mise en file impossible: {e}")
+
+
+async def _add_to_digest(conn: asyncpg.Connection, kind: str, users: list[dict], items: list[dict]):
+    """
+    Ajoute les éléments au résumé en attente de chaque user. Un élément déjà
+    présent (même pièce) est remplacé par sa version la plus récente : une
+    pièce signalée plusieurs fois dans la fenêtre n'apparaît qu'une fois.
+    """
+    item_key = DIGEST_KINDS[kind][0]
+    rows = [
+        (u['username'], kind, item_key(item), _json.dumps(item, default=str))
+        for u in users
+        for item in items
+    ]
+    if not rows:
+        return
+    try:
+        await conn.executemany(
+            """INSERT INTO "NotificationDigest" ("username", "kind", "item_key", "payload")
+               VALUES ($1, $2, $3, $4::jsonb)
+               ON CONFLICT ("username", "kind", "item_key") DO UPDATE
+               SET "payload" = EXCLUDED."payload",
+                   "occurrences" = "NotificationDigest"."occurrences" + 1,
+                   "updated_at" = NOW()""",
+            rows
+        )
+        logger.info(f"📧 Notif {kind} → résumé de {', '.join(u['username'] for u in users)}")
+    except Exception as e:
+        logger.error(f"❌ Notif {kind} : ajout au résumé impossible: {e}")
+
+
+async def flush_due_digests(conn: asyncpg.Connection) -> int:
+    """
+    Transforme en emails (file d'envoi) les résumés dont le premier élément a
+    attendu toute la fenêtre : un email par user et par type. Les préférences
+    et l'adresse sont relues au moment de l'envoi. Retourne le nombre d'emails.
+    Appelé périodiquement par le worker de la file d'envoi.
+    """
+    async with conn.transaction():
+        # DELETE ... RETURNING : un autre processus ne peut pas reprendre les mêmes lignes
+        rows = await conn.fetch(
+            """WITH due AS (
+                   SELECT "username", "kind" FROM "NotificationDigest"
+                   GROUP BY "username", "kind"
+                   HAVING MIN("created_at") <= NOW() - make_interval(secs => $1)
+               )
+               DELETE FROM "NotificationDigest" d
+               USING due
+               WHERE d."username" = due."username" AND d."kind" = due."kind"
+               RETURNING d."username", d."kind", d."payload", d."created_at"
+            """,
+            _digest_window
+        )
+        if not rows:
+            return 0
+
+        grouped: dict[tuple, list] = {}
+        for row in sorted(rows, key=lambda r: r['created_at']):
+            payload = row['payload']
+            if isinstance(payload, str):
+                payload = _json.loads(payload)
+            grouped.setdefault((row['username'], row['kind']), []).append(payload)
+
+        users = await conn.fetch(
+            """SELECT username, email, notification_prefs FROM users
+               WHERE username = ANY($1::text[]) AND email IS NOT NULL AND email != ''""",
+            list({username for username, _ in grouped})
+        )
+        by_name = {u['username']: u for u in users}
+
+        messages = []
+        for (username, kind), items in grouped.items():
+            user = by_name.get(username)
+            if kind not in DIGEST_KINDS or not user or not _pref_enabled(user['notification_prefs'], kind):
+                continue
+            subject, html = DIGEST_KINDS[kind][1](username, items)
+            messages.append((user['email'], subject, html))
+
+        await enqueue_emails(conn, messages)
+    if messages:
+        logger.info(f"📧 {len(messages)} résumé(s) de notifications ({len(rows)} éléments)")
+    return len(messages)
 
 
 async def notify_pieces_a_commander(conn: asyncpg.Connection, pieces: list[dict]):
@@ -46,15 +167,12 @@ async def notify_pieces_a_commander(conn: asyncpg.Connection, pieces: list[dict]
     if not pieces:
         return
     users = await _get_users_with_pref(conn, "pieces_a_commander")
-    for u in users:
-        try:
-            # Exécuter l'envoi email en background sans bloquer la connection
-            asyncio.create_task(asyncio.to_thread(
-                send_notification_pieces_a_commander, u['email'], u['username'], pieces
-            ))
-            logger.info(f"📧 Notif pieces_a_commander → {u['username']} ({u['email']})")
-        except Exception as e:
-            logger.error(f"❌ Notif pieces_a_commander → {u['username']}: {e}")
+    if _digest_window:
+        await _add_to_digest(conn, "pieces_a_commander", users, pieces)
+        return
+    await _enqueue(conn, "pieces_a_commander", [
+        (u, render_pieces_a_commander(u['username'], pieces)) for u in users
+    ])
 
 
 async def notify_demande_approbation(conn: asyncpg.Connection, piece_nom: str, piece_ref: int, demande_par: str):
@@ -66,6 +184,7 @@ async def notify_demande_approbation(conn: asyncpg.Connection, piece_nom: str, p
            FROM users
            WHERE role = 'admin' AND email IS NOT NULL AND email != ''"""
     )
+    messages = []
     for row in rows:
         # Parser JSON si c'est une string, ou utiliser directement si c'est un dict
         prefs_raw = row['notification_prefs']
@@ -76,15 +195,8 @@ async def notify_demande_approbation(conn: asyncpg.Connection, piece_nom: str, p
         else:
             prefs = {}
         if prefs.get("demande_approbation", True):
-            try:
-                # Exécuter l'envoi email en background sans bloquer la connection
-                asyncio.create_task(asyncio.to_thread(
-                    send_notification_demande_approbation,
-                    row['email'], row['username'], piece_nom, piece_ref, demande_par
-                ))
-                logger.info(f"📧 Notif demande_approbation → {row['username']}")
-            except Exception as e:
-                logger.error(f"❌ Notif demande_approbation → {row['username']}: {e}")
+            messages.append((row, render_demande_approbation(row['username'], piece_nom, piece_ref, demande_par)))
+    await _enqueue(conn, "demande_approbation", messages)
 
 
 async def notify_approbation_result(
@@ -117,41 +229,25 @@ async def notify_approbation_result(
             else:
                 prefs = {}
             if prefs.get(pref_key, True):
-                try:
-                    # Exécuter l'envoi email en background sans bloquer la connection
-                    asyncio.create_task(asyncio.to_thread(
-                        send_notification_approbation_result,
-                        row['email'], row['username'], piece_nom, statut, note
-                    ))
-                    logger.info(f"📧 Notif {pref_key} → {row['username']}")
-                except Exception as e:
-                    logger.error(f"❌ Notif {pref_key} → {row['username']}: {e}")
+                await _enqueue(conn, pref_key, [
+                    (row, render_approbation_result(row['username'], piece_nom, statut, note))
+                ])
     else:
         users = await _get_users_with_pref(conn, pref_key)
-        for u in users:
-            try:
-                # Exécuter l'envoi email en background sans bloquer la connection
-                asyncio.create_task(asyncio.to_thread(
-                    send_notification_approbation_result,
-                    u['email'], u['username'], piece_nom, statut, note
-                ))
-                logger.info(f"📧 Notif {pref_key} → {u['username']}")
-            except Exception as e:
-                logger.error(f"❌ Notif {pref_key} → {u['username']}: {e}")
+        await _enqueue(conn, pref_key, [
+            (u, render_approbation_result(u['username'], piece_nom, statut, note)) for u in users
+        ])
 
 
-async def notify_piece_commandee(conn: asyncpg.Connection, piece_nom: str, qte: int):
+async def notify_piece_commandee(conn: asyncpg.Connection, piece_nom: str, qte: int, piece_ref: int = None):
     """
     Notifie les users qui veulent savoir quand une commande est passée.
     """
     users = await _get_users_with_pref(conn, "piece_commandee")
-    for u in users:
-        try:
-            # Exécuter l'envoi email en background sans bloquer la connection
-            asyncio.create_task(asyncio.to_thread(
-                send_notification_piece_commandee,
-                u['email'], u['username'], piece_nom, qte
-            ))
-            logger.info(f"📧 Notif piece_commandee → {u['username']}")
-        except Exception as e:
-            logger.error(f"❌ Notif piece_commandee → {u['username']}: {e}")
+    if _digest_window:
+        await _add_to_digest(conn, "piece_commandee", users, [{"RéfPièce": piece_ref, "NomPièce": piece_nom, "Qté": qte}])
+        return
+    await _enqueue(conn, "piece_commandee", [
+        (u, render_piece_commandee(u['username'], piece_nom, qte)) for u in users
+    ])
+
@@ -11,6 +11,8 @@ from .piece_images import router as piece_images_router
 from .uploads import router as uploads_router
 from .departements import router as departements_router
 from .parametres import router as parametres_router
+from .metrics import router as metrics_router
+from .debug import router as debug_router
 
 __all__ = [
     'auth_router',
@@ -25,4 +27,6 @@ __all__ = [
     'uploads_router',
     'departements_router',
     'parametres_router',
+    'metrics_router',
+    'debug_router',
 ]
\ No newline at end of file
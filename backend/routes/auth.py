@@ -1,10 +1,12 @@
 """Routes d'authentification et gestion des utilisateurs"""
 from datetime import datetime
 from typing import Optional
+import time
 import uuid
 import json as _json
 
 from fastapi import APIRouter, Depends, HTTPException, status, Response, Request, Body
+from jose import JWTError, jwt
 import asyncpg
 
 from database import get_db_connection
@@ -13,11 +15,23 @@ from auth import (
     require_admin,
     get_current_user,
     create_access_token,
+    access_token_claims,
     hash_password,
     verify_password,
     get_user_by_username,
-    pwd_context,
+    get_user_by_id,
+    token_versions,
+    revoke_user_tokens,
+    forget_user_tokens,
+    revoke_access_token,
+    issue_refresh_token,
+    rotate_refresh_token,
+    revoke_refresh_tokens,
+    login_limiter,
+    SECRET_KEY,
+    ALGORITHM,
     ACCESS_TOKEN_EXPIRE_MINUTES,
+    REFRESH_TOKEN_EXPIRE_DAYS,
 )
 from models.user import (
     LoginRequest,
@@ -29,7 +43,9 @@ from models.user import (
     UpdateGroupRequest,
     NotifPrefsRequest,
 )
-from email_service import send_password_reset_email, send_email
+from email_service import render_password_reset
+from utils.email_outbox import enqueue_email
+from utils.mail_backends import send_now
 from utils.settings import get_app_settings
 import secrets
 
@@ -45,55 +61,81 @@ VALID_NOTIF_KEYS = {
 }
 
 
+# Le jeton de rafraîchissement n'est envoyé qu'aux routes /api/auth
+REFRESH_COOKIE_PATH = "/api/auth"
+
+
+def _set_auth_cookies(response: Response, access_token: str, refresh: str):
+    response.set_cookie(
+        key="access_token",
+        value=access_token,
+        httponly=True,
+        samesite="lax",
+        secure=False,
+        max_age=int(ACCESS_TOKEN_EXPIRE_MINUTES * 60),
+    )
+    response.set_cookie(
+        key="refresh_token",
+        value=refresh,
+        httponly=True,
+        samesite="lax",
+        secure=False,
+        max_age=REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600,
+        path=REFRESH_COOKIE_PATH,
+    )
+
+
+def _access_token_from_request(request: Request) -> Optional[str]:
+    # Même résolution que get_current_user (HTTPBearer : schéma insensible à la casse)
+    scheme, _, value = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and value.strip():
+        return value.strip()
+    return request.cookies.get("access_token")
+
+
 # ==================== Routes d'authentification ====================
 
 @router.post('/login')
 async def login(
+        request: Request,
         data: LoginRequest = Body(...),
         response: Response = None,
         conn: asyncpg.Connection = Depends(get_db_connection)
 ):
     """Authentification: retourne un JWT si les identifiants sont valides"""
-    user = await get_user_by_username(conn, data.username)
-
-    if not user:
+    client_ip = request.client.host if request.client else None
+    retry_after = await login_limiter.retry_after(conn, data.username, client_ip)
+    if retry_after > 0:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Utilisateur ou mot de passe invalide"
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Trop de tentatives de connexion, réessayez plus tard",
+            headers={"Retry-After": str(int(retry_after) + 1)},
         )
 
-    if not verify_password(data.password, user['password_hash']):
+    user = await get_user_by_username(conn, data.username)
+    # Connexion rendue au pool pendant le calcul bcrypt
+    await conn.release()
+
+    if not user or not await verify_password(data.password, user['password_hash']):
+        await login_limiter.add_failure(conn, data.username, client_ip)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Utilisateur ou mot de passe invalide"
         )
+    await login_limiter.add_success(conn, data.username)
 
-    import json
-    raw_perms = user.get('group_permissions') or {}
-    if isinstance(raw_perms, str):
-        raw_perms = json.loads(raw_perms)
-
-    token = create_access_token({
-        "sub":         user['username'],
-        "role":        user['role'],
-        "id":          str(user['id']),
-        "group":       user.get('group_name') or user['role'],
-        "permissions": raw_perms,
-    })
+    claims = access_token_claims(user)
+    raw_perms = claims["permissions"]
+    token = create_access_token(claims)
+    refresh = await issue_refresh_token(conn, user['id'])
 
     if response is not None:
-        response.set_cookie(
-            key="access_token",
-            value=token,
-            httponly=True,
-            samesite="lax",
-            secure=False,
-            max_age=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
-        )
+        _set_auth_cookies(response, token, refresh)
 
     return {
         "access_token": token,
         "token_type": "bearer",
+        "expires_in": int(ACCESS_TOKEN_EXPIRE_MINUTES * 60),
         "user": {
             "id":          str(user['id']),
             "username":    user['username'],
@@ -107,14 +149,32 @@ async def login(
 
 @router.get('/me')
 async def me(user: dict = Depends(get_current_user)):
-    """Retourne l'utilisateur connecté avec ses permissions."""
-    return {"user": user}
+    """
+    Retourne l'utilisateur connecté avec ses permissions, et la durée de validité
+    restante (secondes) du jeton d'accès pour planifier son renouvellement.
+    """
+    user = dict(user)
+    exp = user.pop("exp", None) or 0
+    return {"user": user, "expires_in": max(int(exp - time.time()), 0)}
 
 
 @router.post('/logout')
-async def logout(response: Response):
-    """Supprime le cookie d'authentification"""
+async def logout(request: Request, response: Response):
+    """Révoque la session (jeton de rafraîchissement et jeton d'accès) et supprime les cookies"""
+    refresh = request.cookies.get('refresh_token')
+    access = _access_token_from_request(request)
+    pool = request.app.state.pool
+    if pool is not None and (refresh or access):
+        async with pool.acquire() as conn:
+            if refresh:
+                await revoke_refresh_tokens(conn, token=refresh)
+            if access:
+                try:
+                    await revoke_access_token(conn, jwt.decode(access, SECRET_KEY, algorithms=[ALGORITHM]))
+                except JWTError:
+                    pass
     response.delete_cookie('access_token')
+    response.delete_cookie('refresh_token', path=REFRESH_COOKIE_PATH)
     return {"msg": "Logged out"}
 
 
@@ -124,34 +184,27 @@ async def refresh_token(
         request: Request,
         conn: asyncpg.Connection = Depends(get_db_connection)
 ):
-    """Renouvelle le token si l'utilisateur a un token valide"""
-    from auth import get_current_user_from_token
-    token = request.cookies.get('access_token')
-
-    try:
-        user = await get_current_user_from_token(token, conn)
-    except HTTPException:
+    """
+    Échange le jeton de rafraîchissement (cookie) contre un nouveau jeton d'accès,
+    avec les droits actuels de l'utilisateur, et un nouveau jeton de rafraîchissement.
+    """
+    rotated = await rotate_refresh_token(conn, request.cookies.get('refresh_token'))
+    user = await get_user_by_id(conn, rotated[0]) if rotated else None
+    if user is None:
+        response.delete_cookie('refresh_token', path=REFRESH_COOKIE_PATH)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Impossible de rafraîchir le token"
         )
 
-    new_token = create_access_token({
-        "sub": user['username'],
-        "role": user['role'],
-        "id": user['id']
-    })
-
-    response.set_cookie(
-        key="access_token",
-        value=new_token,
-        httponly=True,
-        samesite="none",
-        secure=False,
-        max_age=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
-    )
+    new_token = create_access_token(access_token_claims(user))
+    _set_auth_cookies(response, new_token, rotated[1])
 
-    return {"access_token": new_token, "token_type": "bearer"}
+    return {
+        "access_token": new_token,
+        "token_type": "bearer",
+        "expires_in": int(ACCESS_TOKEN_EXPIRE_MINUTES * 60),
+    }
 
 
 @router.post('/forgot-password')
@@ -178,8 +231,8 @@ async def forgot_password(data: ForgotPasswordRequest, request: Request):
                VALUES ($1, $2, NOW() + INTERVAL '1 hour')""",
             user['id'], token
         )
+        await enqueue_email(conn, user['email'], *render_password_reset(user['username'], token))
 
-    send_password_reset_email(user['email'], user['username'], token)
     return {"msg": "Si cet email existe, un lien vous a été envoyé."}
 
 
@@ -205,15 +258,24 @@ async def reset_password(data: ResetPasswordRequest, request: Request):
         if len(data.new_password) < 8:
             raise HTTPException(status_code=400, detail="Le mot de passe doit contenir au moins 8 caractères")
 
-        new_hash = pwd_context.hash(data.new_password)
-        await conn.execute(
-            "UPDATE users SET password_hash = $1 WHERE id = $2",
-            new_hash, record['user_id']
-        )
-        await conn.execute(
-            "UPDATE password_reset_tokens SET used = TRUE WHERE token = $1",
-            data.token
-        )
+    # Calcul bcrypt sans garder de connexion du pool
+    new_hash = await hash_password(data.new_password)
+
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            # Le lien a pu être utilisé pendant le calcul : consommé une seule fois
+            if not await conn.fetchval(
+                "UPDATE password_reset_tokens SET used = TRUE WHERE token = $1 AND used IS NOT TRUE RETURNING TRUE",
+                data.token
+            ):
+                raise HTTPException(status_code=400, detail="Ce lien a déjà été utilisé")
+            username = await conn.fetchval(
+                "UPDATE users SET password_hash = $1 WHERE id = $2 RETURNING username",
+                new_hash, record['user_id']
+            )
+            if username:
+                await revoke_user_tokens(conn, username=username)
+                await revoke_refresh_tokens(conn, user_id=record['user_id'])
 
     return {"msg": "Mot de passe mis à jour avec succès"}
 
@@ -239,6 +301,8 @@ async def list_users(request: Request, user: dict = Depends(require_admin)):
 async def create_user(data: CreateUserRequest, request: Request, user: dict = Depends(require_admin)):
     """Crée un utilisateur avec email et groupe."""
     pool = request.app.state.pool
+    # Calcul bcrypt avant de prendre une connexion du pool
+    hashed = await hash_password(data.password)
     async with pool.acquire() as conn:
         existing = await conn.fetchrow(
             "SELECT id FROM users WHERE username = $1", data.username
@@ -247,7 +311,6 @@ async def create_user(data: CreateUserRequest, request: Request, user: dict = De
             raise HTTPException(status_code=400, detail="Utilisateur existe déjà")
 
         user_id = uuid.uuid4()
-        hashed = pwd_context.hash(data.password)
 
         group = await conn.fetchrow(
             "SELECT id FROM user_groups WHERE name = $1", data.role or 'user'
@@ -288,6 +351,8 @@ async def update_user(username: str, data: UpdateUserRequest, request: Request,
                 "UPDATE users SET role = $1 WHERE username = $2",
                 data.role, username
             )
+        if data.group_id is not None or data.role is not None:
+            await revoke_user_tokens(conn, username=username)
 
     return {"msg": f"Utilisateur {username} mis à jour"}
 
@@ -308,6 +373,7 @@ async def delete_user(
 
     try:
         await conn.execute("DELETE FROM users WHERE username = $1", username)
+        await forget_user_tokens(conn, existing_user['id'])
         return {"msg": f"Utilisateur {username} supprimé"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la suppression: {str(e)}")
@@ -328,14 +394,24 @@ async def change_password(
     if len(new_password) < 6:
         raise HTTPException(status_code=400, detail="Le mot de passe doit contenir au moins 6 caractères")
 
-    password_hash = hash_password(new_password)
+    await conn.release()
+    password_hash = await hash_password(new_password)
     try:
-        await conn.execute("UPDATE users SET password_hash = $1 WHERE username = $2", password_hash, username)
+        async with conn.transaction():
+            await conn.execute("UPDATE users SET password_hash = $1 WHERE username = $2", password_hash, username)
+            await revoke_user_tokens(conn, username=username)
+            await revoke_refresh_tokens(conn, user_id=existing_user['id'])
         return {"msg": f"Mot de passe de {username} modifié"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors de la modification: {str(e)}")
 
 
+@router.get('/users/cache')
+async def user_cache_stats(user: dict = Depends(require_admin)):
+    """(Admin seulement) Compteurs des versions de jetons et révocations gardées en mémoire."""
+    return token_versions.stats()
+
+
 # ==================== Gestion des groupes ====================
 
 @router.get('/groups')
@@ -392,6 +468,7 @@ async def update_group(
             json.dumps(data.permissions),
             group_id
         )
+        await revoke_user_tokens(conn, group_id=group_id)
     return {"msg": "Groupe mis à jour"}
 
 
@@ -500,6 +577,7 @@ async def test_email(
         row = await conn.fetchrow(
             "SELECT email FROM users WHERE username = $1", user['username']
         )
+        settings = await get_app_settings(conn)
 
     if not row or not row['email']:
         raise HTTPException(
@@ -507,21 +585,11 @@ async def test_email(
             detail="Aucun email configuré sur votre compte. Ajoutez-en un d'abord."
         )
 
-    settings = await get_app_settings(conn)
-    smtp_config = {
-        'host': settings.get('email_host'),
-        'port': settings.get('email_port'),
-        'from': settings.get('email_from'),
-        'user': settings.get('email_user'),
-        'password': settings.get('email_password'),
-        'tls': settings.get('email_tls'),
-        'ssl': settings.get('email_ssl'),
-    }
-    success = send_email(
+    success = await send_now(
+        settings,
         to=row['email'],
         subject="Test Email - Inventaire Robot",
         body_html="Ceci est un email de test envoyé depuis Inventaire Robot. La configuration SMTP fonctionne correctement.",
-        smtp_config=smtp_config
     )
     if not success:
         raise HTTPException(status_code=500, detail="Erreur envoi email : vérifiez la configuration SMTP")
@@ -1,15 +1,20 @@
 """Routes pour la gestion des commandes"""
+import logging
 import asyncpg
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
 from typing import List, Optional
 from datetime import datetime
 import httpx
 from database import get_db_connection
-from utils.helpers import safe_string, safe_int, safe_float, calculate_qty_to_order
 from utils.settings import get_app_settings
 from auth import require_admin, require_auth
 from models import Commande, StatsResponse, ApprobationRequest
 from utils.historique import log_mouvement
+from utils.search_index import sync_piece_search_index
+from utils.stats import get_inventory_stats, sync_piece_stats
+from utils.piece_sync import publish_piece_change
+from config import STATS_CACHE_TTL
+from utils.serialization import FastJSONResponse, rows_to_dicts, select_columns, stream_query
 import asyncio
 from notification_service import (
     notify_demande_approbation,
@@ -17,59 +22,12 @@ from notification_service import (
     notify_piece_commandee,
 )
 
+logger = logging.getLogger("Inventaire-Robot")
 router = APIRouter(tags=["commandes"])
 
 
-@router.get("/stats", response_model=StatsResponse)
-async def get_stats(conn: asyncpg.Connection = Depends(get_db_connection)):
-    """Récupère les statistiques d'inventaire"""
-    try:
-        # Total pièces
-        total_pieces = await conn.fetchval('SELECT COUNT(*) FROM "Pièce"') or 0
-
-        # Stock critique
-        stock_critique = await conn.fetchval(
-            'SELECT COUNT(*) FROM "Pièce" WHERE "QtéenInventaire" = 0 AND "Qtéminimum" > 0'
-        ) or 0
-
-        # Valeur stock (en CAD $)
-        valeur_stock = await conn.fetchval(
-            'SELECT COALESCE(SUM("QtéenInventaire" * COALESCE("Prix unitaire", 0)), 0) FROM "Pièce"'
-        ) or 0.0
-
-        # Pièces à commander (calculées automatiquement)
-        pieces_a_commander = await conn.fetchval(
-            '''
-            SELECT COUNT(*)
-            FROM "Pièce"
-            WHERE "Qtécommandée" <= 0
-              AND "QtéenInventaire" < "Qtéminimum"
-              AND "Qtéminimum" > 0
-            '''
-        ) or 0
-
-        return StatsResponse(
-            total_pieces=total_pieces,
-            stock_critique=stock_critique,
-            valeur_stock=float(valeur_stock),
-            pieces_a_commander=pieces_a_commander
-        )
-    except Exception as e:
-        print(f"❌ Erreur stats: {e}")
-        return StatsResponse(total_pieces=0, stock_critique=0, valeur_stock=0.0, pieces_a_commander=0)
-
-
-@router.get("/commande", response_model=List[Commande])
-async def get_commande(conn: asyncpg.Connection = Depends(get_db_connection)):
-    """Récupère les commandes en cours"""
-    try:
-        rows = await conn.fetch('''
-            SELECT p.*,
-                   f3."NomFabricant",
-                   fp."NomFournisseur"  AS fournisseur_principal_nom,
-                   fp."NumSap"          AS fournisseur_principal_num_sap,
-                   fp."RéfFournisseur"  AS ref_four_principal,
-                   (
+# Sous-requête JSON des fournisseurs d'une pièce (listes de commandes)
+_COMMANDE_FOURNISSEURS_SUBQUERY = '''COALESCE((
                        SELECT json_agg(json_build_object(
                            'RéfFournisseur',      fall."RéfFournisseur",
                            'NomFournisseur',      fall."NomFournisseur",
@@ -80,65 +38,115 @@ async def get_commande(conn: asyncpg.Connection = Depends(get_db_connection)):
                        FROM "PieceFournisseur" pfall
                        JOIN "Fournisseurs" fall ON fall."RéfFournisseur" = pfall."RéfFournisseur"
                        WHERE pfall."RéfPièce" = p."RéfPièce"
-                   ) AS tous_fournisseurs
-            FROM "Pièce" p
+                   ), '[]'::json)'''
+
+_COMMANDE_FOURNISSEUR_PRINCIPAL = '''CASE WHEN COALESCE(fp."NomFournisseur", '') <> '' THEN json_build_object(
+                       'RéfFournisseur', fp."RéfFournisseur",
+                       'NomFournisseur', fp."NomFournisseur",
+                       'NumSap',         COALESCE(fp."NumSap", ''),
+                       'EstPrincipal',   TRUE
+                   ) END'''
+
+_COMMANDE_FROM = '''FROM "Pièce" p
             LEFT JOIN "PieceFournisseur" pf_p ON pf_p."RéfPièce" = p."RéfPièce" AND pf_p."EstPrincipal" = TRUE
             LEFT JOIN "Fournisseurs" fp ON fp."RéfFournisseur" = pf_p."RéfFournisseur"
-            LEFT JOIN "Fabricant" f3 ON p."RefFabricant" = f3."RefFabricant"
-            LEFT JOIN "Departement" d ON p."RefDepartement" = d."RefDepartement"
-            WHERE COALESCE(p."Qtécommandée", 0) > 0
-        ''')
-
-        import json as _json
-        result = []
-        for row in rows:
-            piece_dict = dict(row)
-
-            fournisseur_principal = None
-            if piece_dict.get("fournisseur_principal_nom"):
-                fournisseur_principal = {
-                    "RéfFournisseur": piece_dict.get("ref_four_principal"),
-                    "NomFournisseur": safe_string(piece_dict.get("fournisseur_principal_nom", "")),
-                    "NumSap": safe_string(piece_dict.get("fournisseur_principal_num_sap", "")),
-                    "EstPrincipal": True,
-                }
-
-            tous_raw = piece_dict.get("tous_fournisseurs")
-            if tous_raw:
-                fournisseurs = _json.loads(tous_raw) if isinstance(tous_raw, str) else list(tous_raw)
-            else:
-                fournisseurs = [fournisseur_principal] if fournisseur_principal else []
-
-            commande = Commande(
-                RéfPièce=piece_dict["RéfPièce"],
-                Datecommande=piece_dict.get("Datecommande"),
-                NomPièce=safe_string(piece_dict.get("NomPièce", "")),
-                NumPièce=safe_string(piece_dict.get("NumPièce", "")),
-                Qtécommandée=safe_int(piece_dict.get("Qtécommandée", 0)),
-                Qtéreçue=safe_int(piece_dict.get("Qtéreçue", 0)),
-                Qtéarecevoir=safe_int(piece_dict.get("Qtéarecevoir", 0)),
-                Cmd_info=safe_string(piece_dict.get("Cmd_info", "")),
-                NumPièceAutreFournisseur=safe_string(piece_dict.get("NumPièceAutreFournisseur", "")),
-                DescriptionPièce=safe_string(piece_dict.get("DescriptionPièce", "")),
-                QtéenInventaire=safe_int(piece_dict.get("QtéenInventaire", 0)),
-                Qtéminimum=safe_int(piece_dict.get("Qtéminimum", 0)),
-                Qtéàcommander=safe_int(piece_dict.get("Qtéàcommander", 0)),
-                Prix_unitaire=safe_float(piece_dict.get("Prix unitaire", 0)),
-                fournisseur_principal=fournisseur_principal,
-                fournisseurs=fournisseurs,
-                NomFabricant=safe_string(piece_dict.get("NomFabricant", "")),
-                Soumission_LD=safe_string(piece_dict.get("Soumission LD", "")),
-                SoumDem=bool(piece_dict.get("SoumDem", False)),
-                devise=safe_string(piece_dict.get("devise", "CAD")) or "CAD",
-                RefDepartement=piece_dict.get("RefDepartement"),
-                NomDepartement=safe_string(piece_dict.get("NomDepartement", ""))
-            )
+            LEFT JOIN "Fabricant" f3 ON p."RefFabricant" = f3."RefFabricant"'''
+
+# Expression SQL de chaque champ de Commande pour GET /commande, dans l'ordre du modèle.
+# Les valeurs sont normalisées côté SQL : la ligne est directement la représentation
+# JSON de Commande (voir utils/serialization.py). Les champs non lus gardent leur défaut.
+COMMANDE_FIELD_SQL = {
+    "RéfPièce": 'p."RéfPièce"',
+    "NomPièce": 'COALESCE(p."NomPièce", \'\')',
+    "DescriptionPièce": 'COALESCE(p."DescriptionPièce", \'\')',
+    "NumPièce": 'COALESCE(p."NumPièce", \'\')',
+    "RéfFournisseur": 'NULL::integer',
+    "RéfAutreFournisseur": 'NULL::integer',
+    "RefFabricant": 'NULL::integer',
+    "NumPièceAutreFournisseur": 'COALESCE(p."NumPièceAutreFournisseur", \'\')',
+    "Lieuentreposage": "''",
+    "QtéenInventaire": 'COALESCE(p."QtéenInventaire", 0)',
+    "Qtéminimum": 'COALESCE(p."Qtéminimum", 0)',
+    "Qtémax": '100',
+    "Qtécommandée": 'COALESCE(p."Qtécommandée", 0)',
+    "Datecommande": 'p."Datecommande"',
+    "Qtéreçue": 'COALESCE(p."Qtéreçue", 0)',
+    "Qtéarecevoir": 'COALESCE(p."Qtéarecevoir", 0)',
+    "Cmd_info": 'COALESCE(p."Cmd_info", \'\')',
+    "Qtéàcommander": '0',
+    "Prix_unitaire": 'COALESCE(p."Prix unitaire", 0)::float8',
+    "fournisseurs": _COMMANDE_FOURNISSEURS_SUBQUERY,
+    "fournisseur_principal": _COMMANDE_FOURNISSEUR_PRINCIPAL,
+    "autre_fournisseur": 'NULL::json',
+    "NomFabricant": 'COALESCE(f3."NomFabricant", \'\')',
+    "Soumission_LD": 'COALESCE(p."Soumission LD", \'\')',
+    "SoumDem": 'COALESCE(p."SoumDem", FALSE)',
+    "RTBS": 'NULL::integer',
+    "NoFESTO": "''",
+    "NumSap": "''",
+    "devise": 'COALESCE(NULLIF(p."devise", \'\'), \'CAD\')',
+    "RefDepartement": 'p."RefDepartement"',
+    "NomDepartement": "''",
+}
+
+# GET /toorders : même forme, avec la quantité à commander calculée
+TOORDERS_FIELD_SQL = {
+    **COMMANDE_FIELD_SQL,
+    "Lieuentreposage": 'COALESCE(p."Lieuentreposage", \'\')',
+    "Qtécommandée": '0',
+    "Qtéreçue": '0',
+    "Qtéarecevoir": '0',
+    "Cmd_info": "''",
+    "Qtéàcommander": '''CASE
+                   WHEN COALESCE(p."QtéenInventaire", 0) < COALESCE(p."Qtéminimum", 0)
+                        AND COALESCE(p."Qtéminimum", 0) > 0
+                   THEN COALESCE(p."Qtéminimum", 0) - COALESCE(p."QtéenInventaire", 0)
+                   ELSE 0 END''',
+    "RTBS": 'p."RTBS"',
+    "NoFESTO": 'COALESCE(p."NoFESTO", \'\')',
+}
+
+COMMANDE_JSON_FIELDS = ("fournisseurs", "fournisseur_principal")
 
-            result.append(commande)
 
-        return result
+@router.get("/stats", response_model=StatsResponse)
+async def get_stats(request: Request, conn: asyncpg.Connection = Depends(get_db_connection)):
+    """
+    Récupère les statistiques d'inventaire, globales et par département.
+    Servies depuis la mémoire (utils/stats.py), recalculées au plus toutes les STATS_CACHE_TTL s.
+    """
+    try:
+        return await get_inventory_stats(request.app, conn, STATS_CACHE_TTL)
+    except Exception as e:
+        logger.exception("❌ Erreur stats: %s", e)
+        return StatsResponse(total_pieces=0, stock_critique=0, valeur_stock=0.0, pieces_a_commander=0)
+
+
+@router.get("/commande", response_model=List[Commande])
+async def get_commande(
+        request: Request,
+        conn: asyncpg.Connection = Depends(get_db_connection),
+        stream: Optional[str] = Query(None, pattern="^(json|ndjson)$")
+):
+    """
+    Récupère les commandes en cours.
+    stream=json|ndjson : diffusion en continu via un curseur serveur.
+    """
+    try:
+        query = f'''
+            SELECT {", ".join(select_columns(COMMANDE_FIELD_SQL))}
+            {_COMMANDE_FROM}
+            WHERE COALESCE(p."Qtécommandée", 0) > 0
+        '''
+        if stream:
+            return stream_query(request.app.state.pool, query, (), COMMANDE_JSON_FIELDS, stream)
+
+        rows = await conn.fetch(query)
+        # Connexion rendue au pool avant la sérialisation
+        await conn.release()
+        return FastJSONResponse(content=rows_to_dicts(rows, COMMANDE_JSON_FIELDS))
     except Exception as e:
-        print(f"❌ Erreur get_commande: {e}")
+        logger.exception("❌ Erreur get_commande: %s", e)
         return []
 
 
@@ -149,29 +157,9 @@ async def get_toorders(conn: asyncpg.Connection = Depends(get_db_connection)):
         settings = await get_app_settings(conn)
         approbation_enabled = bool(settings.get('features', {}).get('approbation', True))
 
-        query = '''
-            SELECT p.*,
-                   f3."NomFabricant",
-                   fp."NomFournisseur"  AS fournisseur_principal_nom,
-                   fp."NumSap"          AS fournisseur_principal_num_sap,
-                   fp."RéfFournisseur"  AS ref_four_principal,
-                   (
-                       SELECT json_agg(json_build_object(
-                           'RéfFournisseur',      fall."RéfFournisseur",
-                           'NomFournisseur',      fall."NomFournisseur",
-                           'NumSap',              fall."NumSap",
-                           'EstPrincipal',        pfall."EstPrincipal",
-                           'NumPièceFournisseur', pfall."NumPièceFournisseur"
-                       ) ORDER BY pfall."EstPrincipal" DESC)
-                       FROM "PieceFournisseur" pfall
-                       JOIN "Fournisseurs" fall ON fall."RéfFournisseur" = pfall."RéfFournisseur"
-                       WHERE pfall."RéfPièce" = p."RéfPièce"
-                   ) AS tous_fournisseurs
-            FROM "Pièce" p
-            LEFT JOIN "PieceFournisseur" pf_p ON pf_p."RéfPièce" = p."RéfPièce" AND pf_p."EstPrincipal" = TRUE
-            LEFT JOIN "Fournisseurs" fp ON fp."RéfFournisseur" = pf_p."RéfFournisseur"
-            LEFT JOIN "Fabricant" f3 ON p."RefFabricant" = f3."RefFabricant"
-            LEFT JOIN "Departement" d ON p."RefDepartement" = d."RefDepartement"
+        query = f'''
+            SELECT {", ".join(select_columns(TOORDERS_FIELD_SQL))}
+            {_COMMANDE_FROM}
             WHERE COALESCE(p."Qtécommandée", 0) <= 0
              AND p."QtéenInventaire" < p."Qtéminimum"
              AND p."Qtéminimum" > 0
@@ -180,68 +168,18 @@ async def get_toorders(conn: asyncpg.Connection = Depends(get_db_connection)):
             query += "\n             AND p.approbation_statut = 'approuvee'"
 
         rows = await conn.fetch(query)
-
-        import json as _json
-        result = []
-        for row in rows:
-            piece_dict = dict(row)
-
-            fournisseur_principal = None
-            if piece_dict.get("fournisseur_principal_nom"):
-                fournisseur_principal = {
-                    "RéfFournisseur": piece_dict.get("ref_four_principal"),
-                    "NomFournisseur": safe_string(piece_dict.get("fournisseur_principal_nom", "")),
-                    "NumSap": safe_string(piece_dict.get("fournisseur_principal_num_sap", "")),
-                    "EstPrincipal": True,
-                }
-
-            tous_raw = piece_dict.get("tous_fournisseurs")
-            if tous_raw:
-                fournisseurs = _json.loads(tous_raw) if isinstance(tous_raw, str) else list(tous_raw)
-            else:
-                fournisseurs = [fournisseur_principal] if fournisseur_principal else []
-
-            qty_a_commander = calculate_qty_to_order(
-                piece_dict.get("QtéenInventaire", 0),
-                piece_dict.get("Qtéminimum", 0),
-                piece_dict.get("Qtémax", 100)
-            )
-
-            commande = Commande(
-                RéfPièce=piece_dict["RéfPièce"],
-                Datecommande=piece_dict.get("Datecommande"),
-                NomPièce=safe_string(piece_dict.get("NomPièce", "")),
-                NumPièce=safe_string(piece_dict.get("NumPièce", "")),
-                RTBS=piece_dict.get("RTBS", None),
-                NumPièceAutreFournisseur=safe_string(piece_dict.get("NumPièceAutreFournisseur", "")),
-                DescriptionPièce=safe_string(piece_dict.get("DescriptionPièce", "")),
-                Lieuentreposage=safe_string(piece_dict.get("Lieuentreposage", "")),
-                QtéenInventaire=safe_int(piece_dict.get("QtéenInventaire", 0)),
-                Qtéminimum=safe_int(piece_dict.get("Qtéminimum", 0)),
-                Qtéàcommander=qty_a_commander,
-                Prix_unitaire=safe_float(piece_dict.get("Prix unitaire", 0)),
-                fournisseur_principal=fournisseur_principal,
-                fournisseurs=fournisseurs,
-                NomFabricant=safe_string(piece_dict.get("NomFabricant", "")),
-                Soumission_LD=safe_string(piece_dict.get("Soumission LD", "")),
-                SoumDem=bool(piece_dict.get("SoumDem", False)),
-                NoFESTO=safe_string(piece_dict.get("NoFESTO")),
-                devise=safe_string(piece_dict.get("devise", "CAD")) or "CAD",
-                RefDepartement=piece_dict.get("RefDepartement"),
-                NomDepartement=safe_string(piece_dict.get("NomDepartement", ""))
-            )
-
-            result.append(commande)
-
-        return result
+        # Connexion rendue au pool avant la sérialisation
+        await conn.release()
+        return FastJSONResponse(content=rows_to_dicts(rows, COMMANDE_JSON_FIELDS))
     except Exception as e:
-        print(f"❌ Erreur get_toorders: {e}")
+        logger.exception("❌ Erreur get_toorders: %s", e)
         return []
 
 
 @router.put("/ordersall/{piece_id}")
 async def receive_all_order(
         piece_id: int,
+        request: Request,
         conn: asyncpg.Connection = Depends(get_db_connection)
 ):
     """Réception totale d'une commande"""
@@ -283,6 +221,9 @@ async def receive_all_order(
 
         if result == "UPDATE 0":
             raise HTTPException(status_code=404, detail="Pièce non trouvée")
+        await sync_piece_search_index(request.app, conn, piece_id)
+        await sync_piece_stats(request.app, conn, piece_id)
+        await publish_piece_change(conn, piece_id)
 
         # 3. Mettre à jour l'historique (avec gestion d'erreur)
         try:
@@ -309,7 +250,7 @@ async def receive_all_order(
                         );
             """, now, piece_id)
         except Exception as hist_error:
-            print(f"⚠️ Erreur mise à jour historique (non bloquant): {hist_error}")
+            logger.warning("⚠️ Erreur mise à jour historique (non bloquant): %s", hist_error)
 
             # ── Log réception totale ────────────────────────────────────
             try:
@@ -339,7 +280,7 @@ async def receive_all_order(
                         delai=delai,
                     )
             except Exception as log_err:
-                print(f"⚠️  Log réception totale (non bloquant): {log_err}")
+                logger.warning("⚠️  Log réception totale (non bloquant): %s", log_err)
 
         return {
             "message": "Réception totale effectuée",
@@ -350,7 +291,7 @@ async def receive_all_order(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Erreur receive_all_order: {e}")
+        logger.exception("❌ Erreur receive_all_order: %s", e)
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Erreur lors de la réception: {str(e)}")
@@ -360,6 +301,7 @@ async def receive_all_order(
 async def receive_partial_order(
         piece_id: int,
         quantity_received: int,
+        request: Request,
         conn: asyncpg.Connection = Depends(get_db_connection)
 ):
     """Réception partielle d'une commande"""
@@ -389,6 +331,9 @@ async def receive_partial_order(
         '''
 
         result = await conn.execute(query, piece_id, quantity_received, datetime.utcnow())
+        await sync_piece_search_index(request.app, conn, piece_id)
+        await sync_piece_stats(request.app, conn, piece_id)
+        await publish_piece_change(conn, piece_id)
 
         # ── Log réception partielle ─────────────────────────────────
         try:
@@ -419,7 +364,7 @@ async def receive_partial_order(
                     delai=delai,
                 )
         except Exception as log_err:
-            print(f"⚠️  Log réception partielle (non bloquant): {log_err}")
+            logger.warning("⚠️  Log réception partielle (non bloquant): %s", log_err)
 
         if result == "UPDATE 0":
             raise HTTPException(status_code=404, detail="Pièce non trouvée")
@@ -428,7 +373,7 @@ async def receive_partial_order(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Erreur receive_partial_order: {e}")
+        logger.exception("❌ Erreur receive_partial_order: %s", e)
         raise HTTPException(status_code=500, detail="Erreur lors de la réception partielle")
 
 
@@ -459,8 +404,8 @@ async def submit_ereq(payload: dict, request: Request):
                     "Origin": "https://fip.remote.riotinto.com",
                 },
             )
-            print(f"🔑 Token response status: {token_resp.status_code}")
-            print(f"🔑 Token response headers: {dict(token_resp.headers)}")
+            logger.debug("🔑 Token response status: %s", token_resp.status_code)
+            logger.debug("🔑 Token response headers: %s", dict(token_resp.headers))
             csrf_token = token_resp.headers.get("x-csrf-token")
             if not csrf_token:
                 raise HTTPException(status_code=401,
@@ -522,12 +467,12 @@ async def submit_ereq(payload: dict, request: Request):
                 },
             )
 
-            print(f"📦 Batch response status: {batch_resp.status_code}")
-            print(f"📦 Batch response body: {batch_resp.text[:500]}")
+            logger.debug("📦 Batch response status: %s", batch_resp.status_code)
+            logger.debug("📦 Batch response body: %s", batch_resp.text[:500])
             return {"status": batch_resp.status_code, "body": batch_resp.text}
 
     except Exception as e:
-        print(f"❌ EREQ ERROR: {type(e).__name__}: {str(e)}")
+        logger.exception("❌ EREQ ERROR: %s: %s", type(e).__name__, str(e))
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=502, detail=f"Erreur: {type(e).__name__}: {str(e)}")
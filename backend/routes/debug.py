@@ -0,0 +1,31 @@
+"""Outils de diagnostic (permission debug_access)"""
+from fastapi import APIRouter, Depends, Query, Request
+
+from auth import require_permission
+
+router = APIRouter(prefix="/debug", tags=["debug"])
+
+
+@router.get("/slow-queries")
+async def get_slow_queries(
+        request: Request,
+        limit: int = Query(20, ge=1, le=200),
+        sort: str = Query("total", pattern="^(total|p95|max|count|slow)$"),
+        user: dict = Depends(require_permission("debug_access")),
+):
+    """Requêtes SQL les plus coûteuses depuis le démarrage, regroupées par empreinte"""
+    recorder = request.app.state.query_recorder
+    return {
+        "threshold_ms": round(recorder.threshold * 1000, 1),
+        "queries": recorder.top(limit, sort),
+    }
+
+
+@router.delete("/slow-queries")
+async def reset_slow_queries(
+        request: Request,
+        user: dict = Depends(require_permission("debug_access")),
+):
+    """Remet les compteurs à zéro (ex. avant une mesure)"""
+    request.app.state.query_recorder.reset()
+    return {"message": "Statistiques des requêtes réinitialisées"}
@@ -1,4 +1,5 @@
 """Routes pour la gestion des fabricants"""
+import logging
 import asyncpg
 from fastapi import APIRouter, Depends, HTTPException
 from typing import List
@@ -7,6 +8,7 @@ from database import get_db_connection
 from models import FabricantBase, FabricantCreate
 from utils.helpers import safe_string
 
+logger = logging.getLogger("Inventaire-Robot")
 router = APIRouter(prefix="/fabricant", tags=["fabricants"])
 
 @router.get("")
@@ -100,7 +102,7 @@ async def update_fabricant(
             Email=safe_string(row["Email"])
         )
     except Exception as e:
-        print(f"❌ Erreur update_fabricant: {e}")
+        logger.exception("❌ Erreur update_fabricant: %s", e)
         raise HTTPException(status_code=500, detail="Erreur lors de la modification du fabricant")
 
 
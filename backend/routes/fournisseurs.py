@@ -1,62 +1,114 @@
 """Routes pour la gestion des fournisseurs"""
+import logging
 import asyncpg
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query
+from typing import List, Optional
 
 from database import get_db_connection
 from models import Fournisseur, FournisseurCreate, Contact, ContactCreate
 from utils.helpers import safe_string, extract_domain_from_email
+from utils.pagination import encode_cursor, decode_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from utils.search import search_tokens, build_prefix_tsquery, escape_like
+from utils.serialization import rows_to_dicts
 import httpx
 
+logger = logging.getLogger("Inventaire-Robot")
 router = APIRouter(prefix="/fournisseurs", tags=["fournisseurs"])
 
 @router.get("", response_model=List[Fournisseur])
-async def get_fournisseurs(conn: asyncpg.Connection = Depends(get_db_connection)):
-    """Récupère tous les fournisseurs avec leurs contacts"""
-    try:
-        fournisseurs = await conn.fetch('SELECT * FROM "Fournisseurs" ORDER BY "NomFournisseur"')
-        result = []
+async def get_fournisseurs(
+    request: Request,
+    response: Response,
+    conn: asyncpg.Connection = Depends(get_db_connection),
+    search: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    """
+    Récupère les fournisseurs avec leurs contacts et leur nombre de pièces, en une requête.
 
-        for f in fournisseurs:
-            f_dict = dict(f)
+    - search : recherche par préfixe sur les mots du nom (index plein texte)
+    - limit / cursor : pagination keyset par nom, curseur suivant dans X-Next-Cursor
 
-            # Charger les contacts liés
-            contacts = await conn.fetch(
-                'SELECT * FROM "Contact" WHERE "RéfFournisseur" = $1',
-                f_dict["RéfFournisseur"]
+    Sans limit ni cursor, tous les fournisseurs sont retournés comme auparavant.
+    """
+    conditions = []
+    params = []
+    if search and search_tokens(search):
+        if request.app.state.search_capabilities.get("fts"):
+            params.append(build_prefix_tsquery(search))
+            conditions.append(
+                f"to_tsvector('simple', inv_search_normalize(f.\"NomFournisseur\")) @@ to_tsquery('simple', ${len(params)})"
             )
+        else:
+            params.append(f'%{escape_like(search)}%')
+            conditions.append(f'f."NomFournisseur" ILIKE ${len(params)}')
+
+    paginate = limit is not None or cursor is not None
+    if cursor:
+        last_nom, last_id = decode_cursor(cursor, (str, int))
+        params.extend([last_nom, last_id])
+        conditions.append(f'(f."NomFournisseur", f."RéfFournisseur") > (${len(params) - 1}, ${len(params)})')
+
+    query = f'''
+        SELECT f.*,
+               COALESCE((
+                   SELECT json_agg(json_build_object(
+                       'RéfContact',     c."RéfContact",
+                       'Nom',            COALESCE(c."Nom", ''),
+                       'Titre',          COALESCE(c."Titre", ''),
+                       'Email',          COALESCE(c."Email", ''),
+                       'Telephone',      COALESCE(c."Telephone", ''),
+                       'Cell',           COALESCE(c."Cell", ''),
+                       'RéfFournisseur', c."RéfFournisseur"
+                   ) ORDER BY c."RéfContact")
+                   FROM "Contact" c
+                   WHERE c."RéfFournisseur" = f."RéfFournisseur"
+               ), '[]'::json) AS contacts,
+               (
+                   SELECT COUNT(*) FROM "PieceFournisseur" pf
+                   WHERE pf."RéfFournisseur" = f."RéfFournisseur"
+               ) AS nb_pieces
+        FROM "Fournisseurs" f
+        {"WHERE " + " AND ".join(conditions) if conditions else ""}
+        ORDER BY f."NomFournisseur", f."RéfFournisseur"
+    '''
+    page_size = limit or DEFAULT_PAGE_SIZE
+    if paginate:
+        # Une ligne de plus pour savoir s'il existe une page suivante
+        params.append(page_size + 1)
+        query += f' LIMIT ${len(params)}'
 
-            contact_list = [
-                Contact(
-                    RéfContact=c["RéfContact"],
-                    Nom=safe_string(c.get("Nom", "")),
-                    Titre=safe_string(c.get("Titre", "")),
-                    Email=safe_string(c.get("Email", "")),
-                    Telephone=safe_string(c.get("Telephone", "")),
-                    Cell=safe_string(c.get("Cell", "")),
-                    RéfFournisseur=c.get("RéfFournisseur"),
-                ) for c in contacts
-            ]
-
-            result.append(Fournisseur(
-                RéfFournisseur=f_dict["RéfFournisseur"],
-                NomFournisseur=safe_string(f_dict.get("NomFournisseur", "")),
-                Adresse=safe_string(f_dict.get("Adresse", "")),
-                Ville=safe_string(f_dict.get("Ville", "")),
-                CodePostal=safe_string(f_dict.get("CodePostal", "")),
-                Pays=safe_string(f_dict.get("Pays", "")),
-                NuméroTél=safe_string(f_dict.get("NuméroTél", "")),
-                contacts=[c.model_dump() for c in contact_list],
-                Domaine=safe_string(f_dict.get("Domaine", "")),
-                Produit=safe_string(f_dict.get("Produit", "")),
-                Marque=safe_string(f_dict.get("Marque", "")),
-                NumSap=safe_string(f_dict.get("NumSap", ""))
-            ))
-
-        return result
+    try:
+        rows = await conn.fetch(query, *params)
     except Exception as e:
-        print(f"❌ Erreur get_fournisseurs: {e}")
+        logger.exception("❌ Erreur get_fournisseurs: %s", e)
         return []
+    # Connexion rendue au pool avant la construction et la sérialisation des modèles
+    await conn.release()
+
+    if paginate and len(rows) > page_size:
+        rows = rows[:page_size]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1]["NomFournisseur"], rows[-1]["RéfFournisseur"])
+
+    result = []
+    for f_dict in rows_to_dicts(rows, ("contacts",)):
+        result.append(Fournisseur(
+            RéfFournisseur=f_dict["RéfFournisseur"],
+            NomFournisseur=safe_string(f_dict.get("NomFournisseur", "")),
+            Adresse=safe_string(f_dict.get("Adresse", "")),
+            Ville=safe_string(f_dict.get("Ville", "")),
+            CodePostal=safe_string(f_dict.get("CodePostal", "")),
+            Pays=safe_string(f_dict.get("Pays", "")),
+            NuméroTél=safe_string(f_dict.get("NuméroTél", "")),
+            contacts=f_dict["contacts"],
+            Domaine=safe_string(f_dict.get("Domaine", "")),
+            Produit=safe_string(f_dict.get("Produit", "")),
+            Marque=safe_string(f_dict.get("Marque", "")),
+            NumSap=safe_string(f_dict.get("NumSap", "")),
+            nb_pieces=f_dict["nb_pieces"]
+        ))
+    return result
 
 
 @router.post("", response_model=Fournisseur)
@@ -181,7 +233,7 @@ async def update_fournisseur(
             contacts=[c.model_dump() for c in contact_list]
         )
     except Exception as e:
-        print(f"❌ Erreur update_fournisseur: {e}")
+        logger.exception("❌ Erreur update_fournisseur: %s", e)
         raise HTTPException(status_code=500, detail="Erreur lors de la modification du fournisseur")
 
 
@@ -228,7 +280,7 @@ async def create_contact(
 
         return Contact(**dict(row))
     except Exception as e:
-        print(f"❌ Erreur create_contact: {e}")
+        logger.exception("❌ Erreur create_contact: %s", e)
         raise HTTPException(status_code=500, detail="Erreur lors de l'ajout du contact")
 
 
@@ -257,7 +309,7 @@ async def update_contact(
             raise HTTPException(status_code=404, detail="Contact non trouvé")
         return Contact(**dict(row))
     except Exception as e:
-        print(f"❌ Erreur update_contact: {e}")
+        logger.exception("❌ Erreur update_contact: %s", e)
         raise HTTPException(status_code=500, detail="Erreur lors de la modification du contact")
 
 
@@ -271,7 +323,7 @@ async def delete_contact(
         await conn.execute('DELETE FROM "Contact" WHERE "RéfContact" = $1', contact_id)
         return {"message": "Contact supprimé"}
     except Exception as e:
-        print(f"❌ Erreur delete_contact: {e}")
+        logger.exception("❌ Erreur delete_contact: %s", e)
         raise HTTPException(status_code=500, detail="Erreur lors de la suppression du contact")
 
 @router.get("/sap/search")
@@ -330,14 +382,14 @@ async def search_fournisseurs_sap(
                 }
             )
 
-        print(f"🔍 SAP VendorMasterSet status: {resp.status_code}")
+        logger.debug("🔍 SAP VendorMasterSet status: %s", resp.status_code)
 
         if resp.status_code == 401:
             raise HTTPException(status_code=401, detail="Session SAP expirée — recopie le cookie SAP_SESSIONID_FIP_500")
         if resp.status_code == 403:
             raise HTTPException(status_code=403, detail="Accès refusé par SAP")
         if not resp.is_success:
-            print(f"❌ SAP error body: {resp.text[:500]}")
+            logger.error("❌ SAP error body: %s", resp.text[:500])
             raise HTTPException(status_code=502, detail=f"SAP a répondu {resp.status_code}")
 
         data = resp.json()
@@ -363,7 +415,7 @@ async def search_fournisseurs_sap(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ SAP VendorMasterSet error: {type(e).__name__}: {e}")
+        logger.exception("❌ SAP VendorMasterSet error: %s: %s", type(e).__name__, e)
         raise HTTPException(status_code=502, detail=f"Erreur SAP: {str(e)}")
 @router.post("/sap/import")
 async def import_fournisseurs_sap(
@@ -1,6 +1,7 @@
 
 """Routes pour la gestion des groupes de pièces"""
 import asyncpg
+from collections import defaultdict
 from fastapi import APIRouter, Depends, HTTPException
 from typing import List
 
@@ -10,7 +11,7 @@ from models import (
     Groupe, GroupeCreate, GroupeComplet,
     GroupePiece, GroupePieceCreate
 )
-from utils.helpers import safe_string, safe_int
+from utils.helpers import safe_string, safe_int, safe_float
 
 router = APIRouter(prefix="/groupes", tags=["groupes"])
 
@@ -69,93 +70,30 @@ async def delete_categorie(
 
 # ==================== GROUPES ====================
 
-@router.get("", response_model=List[GroupeComplet])
-async def get_groupes(conn: asyncpg.Connection = Depends(get_db_connection)):
-    """Récupère tous les groupes avec leurs catégories et pièces"""
-    groupes_rows = await conn.fetch('''
-        SELECT g.*, c."NomCategorie", c."Description" as "CategorieDescription"
-        FROM "Groupe" g
-        LEFT JOIN "Categorie" c ON g."RefCategorie" = c."RefCategorie"
-        ORDER BY c."NomCategorie", g."NomGroupe"
-    ''')
-    
-    result = []
-    for g in groupes_rows:
-        g_dict = dict(g)
-        
-        # Récupérer les pièces du groupe
-        pieces_rows = await conn.fetch('''
-            SELECT gp.*, p."NomPièce", p."NumPièce", p."Prix unitaire"
-            FROM "GroupePiece" gp
-            LEFT JOIN "Pièce" p ON gp."RéfPièce" = p."RéfPièce"
-            WHERE gp."RefGroupe" = $1
-            ORDER BY COALESCE(gp."Ordre", 999), gp."id"
-        ''', g_dict["RefGroupe"])
-        
-        pieces = []
-        for p in pieces_rows:
-            p_dict = dict(p)
-            pieces.append(GroupePiece(
-                id=p_dict["id"],
-                RefGroupe=p_dict["RefGroupe"],
-                RéfPièce=p_dict["RéfPièce"],
-                Quantite=p_dict["Quantite"],
-                piece_info={
-                    "NomPièce": safe_string(p_dict.get("NomPièce", "")),
-                    "NumPièce": safe_string(p_dict.get("NumPièce", "")),
-                    "Prix_unitaire": p_dict.get("Prix unitaire", 0)
-                }
-            ))
-        
-        groupe_complet = GroupeComplet(
-            RefGroupe=g_dict["RefGroupe"],
-            RefCategorie=g_dict["RefCategorie"],
-            NomGroupe=safe_string(g_dict.get("NomGroupe", "")),
-            Description=safe_string(g_dict.get("Description", "")),
-            Created=g_dict.get("Created"),
-            Modified=g_dict.get("Modified"),
-            categorie=Categorie(
-                RefCategorie=g_dict["RefCategorie"],
-                NomCategorie=safe_string(g_dict.get("NomCategorie", "")),
-                Description=safe_string(g_dict.get("CategorieDescription", ""))
-            ) if g_dict.get("NomCategorie") else None,
-            pieces=pieces
-        )
-        
-        result.append(groupe_complet)
-    
-    return result
+_SELECT_GROUPES = '''
+    SELECT g.*, c."NomCategorie", c."Description" as "CategorieDescription"
+    FROM "Groupe" g
+    LEFT JOIN "Categorie" c ON g."RefCategorie" = c."RefCategorie"
+'''
 
-@router.get("/{groupe_id}", response_model=GroupeComplet)
-async def get_groupe(
-    groupe_id: int,
-    conn: asyncpg.Connection = Depends(get_db_connection)
-):
-    """Récupère un groupe spécifique avec ses pièces"""
-    g = await conn.fetchrow('''
-        SELECT g.*, c."NomCategorie", c."Description" as "CategorieDescription"
-        FROM "Groupe" g
-        LEFT JOIN "Categorie" c ON g."RefCategorie" = c."RefCategorie"
-        WHERE g."RefGroupe" = $1
-    ''', groupe_id)
-    
-    if not g:
-        raise HTTPException(status_code=404, detail="Groupe non trouvé")
-    
-    g_dict = dict(g)
-    
-    # Récupérer les pièces
-    pieces_rows = await conn.fetch('''
-        SELECT gp.*, p."NomPièce", p."NumPièce", p."Prix unitaire"
-        FROM "GroupePiece" gp
-        LEFT JOIN "Pièce" p ON gp."RéfPièce" = p."RéfPièce"
-        WHERE gp."RefGroupe" = $1
-        ORDER BY COALESCE(gp."Ordre", 999), gp."id"
-    ''', g_dict["RefGroupe"])
+_SELECT_GROUPE_PIECES = '''
+    SELECT gp.*, p."NomPièce", p."NumPièce", p."Prix unitaire",
+           COALESCE(p."QtéenInventaire", 0) < COALESCE(p."Qtéminimum", 0) AS sous_minimum
+    FROM "GroupePiece" gp
+    LEFT JOIN "Pièce" p ON gp."RéfPièce" = p."RéfPièce"
+'''
 
+
+def _build_groupe_complet(g_dict: dict, pieces_rows) -> GroupeComplet:
+    """Assemble un groupe, ses pièces et ses totaux (coût du kit, pièces sous le minimum)"""
     pieces = []
+    cout_kit = 0.0
+    pieces_sous_minimum = 0
     for p in pieces_rows:
         p_dict = dict(p)
+        cout_kit += safe_int(p_dict["Quantite"]) * safe_float(p_dict.get("Prix unitaire"))
+        if p_dict.get("sous_minimum"):
+            pieces_sous_minimum += 1
         pieces.append(GroupePiece(
             id=p_dict["id"],
             RefGroupe=p_dict["RefGroupe"],
@@ -167,7 +105,7 @@ async def get_groupe(
                 "Prix_unitaire": p_dict.get("Prix unitaire", 0)
             }
         ))
-    
+
     return GroupeComplet(
         RefGroupe=g_dict["RefGroupe"],
         RefCategorie=g_dict["RefCategorie"],
@@ -180,9 +118,52 @@ async def get_groupe(
             NomCategorie=safe_string(g_dict.get("NomCategorie", "")),
             Description=safe_string(g_dict.get("CategorieDescription", ""))
         ) if g_dict.get("NomCategorie") else None,
-        pieces=pieces
+        pieces=pieces,
+        cout_kit=round(cout_kit, 2),
+        pieces_sous_minimum=pieces_sous_minimum
     )
 
+
+@router.get("", response_model=List[GroupeComplet])
+async def get_groupes(conn: asyncpg.Connection = Depends(get_db_connection)):
+    """Récupère tous les groupes avec leurs catégories, pièces et totaux (2 requêtes au total)"""
+    groupes_rows = await conn.fetch(_SELECT_GROUPES + '''
+        ORDER BY c."NomCategorie", g."NomGroupe"
+    ''')
+
+    # Toutes les pièces de tous les groupes, regroupées en mémoire
+    pieces_par_groupe = defaultdict(list)
+    for p in await conn.fetch(_SELECT_GROUPE_PIECES + '''
+        ORDER BY gp."RefGroupe", COALESCE(gp."Ordre", 999), gp."id"
+    '''):
+        pieces_par_groupe[p["RefGroupe"]].append(p)
+    await conn.release()
+
+    return [
+        _build_groupe_complet(dict(g), pieces_par_groupe.get(g["RefGroupe"], []))
+        for g in groupes_rows
+    ]
+
+@router.get("/{groupe_id}", response_model=GroupeComplet)
+async def get_groupe(
+    groupe_id: int,
+    conn: asyncpg.Connection = Depends(get_db_connection)
+):
+    """Récupère un groupe spécifique avec ses pièces"""
+    g = await conn.fetchrow(_SELECT_GROUPES + '''
+        WHERE g."RefGroupe" = $1
+    ''', groupe_id)
+
+    if not g:
+        raise HTTPException(status_code=404, detail="Groupe non trouvé")
+
+    pieces_rows = await conn.fetch(_SELECT_GROUPE_PIECES + '''
+        WHERE gp."RefGroupe" = $1
+        ORDER BY COALESCE(gp."Ordre", 999), gp."id"
+    ''', groupe_id)
+
+    return _build_groupe_complet(dict(g), pieces_rows)
+
 @router.post("", response_model=Groupe)
 async def create_groupe(
     groupe: GroupeCreate,
@@ -1,15 +1,50 @@
 """Routes pour la gestion de l'historique"""
 import asyncpg
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
 from typing import List, Optional
-from datetime import datetime
 import datetime
 import decimal
 from database import get_db_connection
 from models import HistoriqueCreate, HistoriqueResponse
+from utils.pagination import encode_cursor, decode_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from utils.serialization import FastJSONResponse, rows_to_dicts, select_columns, stream_query
 
 router = APIRouter(prefix="/historique", tags=["historique"])
 
+# Expression SQL de chaque champ de HistoriqueResponse, dans l'ordre du modèle
+# (DateCMD est une DATE exposée comme datetime, Delais NUMERIC comme float)
+HISTORIQUE_FIELD_SQL = {
+    "DateCMD": '"DateCMD"::timestamp',
+    "DateRecu": '"DateRecu"',
+    "Opération": '"Opération"',
+    "numpiece": '"numpiece"',
+    "description": '"description"',
+    "qtécommande": '"qtécommande"',
+    "QtéSortie": '"QtéSortie"',
+    "nompiece": '"nompiece"',
+    "RéfPièce": '"RéfPièce"::integer',
+    "User": '"User"',
+    "Delais": '"Delais"::float8',
+}
+
+# Clé de tri : date de réception, sinon de commande ; les entrées sans date
+# (-infinity) passent en dernier comme avec NULLS LAST.
+# Doit rester identique à l'expression indexée dans utils/indexes.py.
+HISTORIQUE_DATE_SQL = 'COALESCE("DateRecu", "DateCMD", \'-infinity\'::timestamp)'
+
+
+def _is_timestamp_text(value: str) -> bool:
+    """Clé de tri d'un curseur : texte d'un timestamp PostgreSQL (ou -infinity)"""
+    if value in ("-infinity", "infinity"):
+        return True
+    base, dot, fraction = value.partition(".")
+    try:
+        datetime.datetime.strptime(base, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return False
+    return not dot or (fraction.isdigit() and len(fraction) <= 6)
+
+
 def row_to_dict(row):
     d = dict(row)
     for k, v in list(d.items()):
@@ -24,14 +59,110 @@ def row_to_dict(row):
                 d[k] = v.tobytes()
     return d
 
+def _build_historique_filters(
+    date_debut: Optional[datetime.date],
+    date_fin: Optional[datetime.date],
+    operation: Optional[str],
+    user: Optional[str],
+    piece_id: Optional[int],
+):
+    """Construit la clause WHERE des filtres de l'historique"""
+    conditions = []
+    params = []
+
+    # Bornes de dates incluses, sur la même expression que le tri (indexée)
+    if date_debut:
+        params.append(datetime.datetime.combine(date_debut, datetime.time.min))
+        conditions.append(f'{HISTORIQUE_DATE_SQL} >= ${len(params)}')
+    if date_fin:
+        params.append(datetime.datetime.combine(date_fin + datetime.timedelta(days=1), datetime.time.min))
+        conditions.append(f'{HISTORIQUE_DATE_SQL} < ${len(params)}')
+
+    # Plusieurs opérations possibles, séparées par des virgules
+    if operation and operation != "tous":
+        params.append([op.strip() for op in operation.split(",") if op.strip()])
+        conditions.append(f'"Opération" = ANY(${len(params)}::text[])')
+
+    if user and user != "tous":
+        params.append(user)
+        conditions.append(f'"User" = ${len(params)}')
+
+    if piece_id is not None:
+        params.append(piece_id)
+        conditions.append(f'"RéfPièce" = ${len(params)}')
+
+    return " AND ".join(conditions) or "TRUE", params
+
+
 @router.get("", response_model=List[HistoriqueResponse])
-async def get_historique(conn: asyncpg.Connection = Depends(get_db_connection)):
-    """Récupère tout l'historique"""
-    rows = await conn.fetch('''
-        SELECT * FROM "historique" 
-        ORDER BY COALESCE("DateRecu", "DateCMD") DESC NULLS LAST, "id" DESC
-    ''')
-    return [HistoriqueResponse(**row_to_dict(r)) for r in rows]
+async def get_historique(
+    request: Request,
+    conn: asyncpg.Connection = Depends(get_db_connection),
+    date_debut: Optional[datetime.date] = None,
+    date_fin: Optional[datetime.date] = None,
+    operation: Optional[str] = None,
+    user: Optional[str] = None,
+    piece_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: Optional[str] = Query(None, pattern="^(json|ndjson)$")
+):
+    """
+    Récupère l'historique, du plus récent au plus ancien.
+
+    - date_debut / date_fin : bornes incluses (AAAA-MM-JJ) sur la date de réception,
+      ou de commande à défaut
+    - operation : une ou plusieurs opérations séparées par des virgules
+    - user, piece_id : filtres exacts
+    - limit / cursor : pagination keyset, curseur suivant dans l'en-tête X-Next-Cursor
+    - stream=json|ndjson : diffusion en continu via un curseur serveur
+
+    Sans limit ni cursor, tout l'historique filtré est retourné comme auparavant.
+    """
+    where, params = _build_historique_filters(date_debut, date_fin, operation, user, piece_id)
+    columns = ", ".join(select_columns(HISTORIQUE_FIELD_SQL))
+
+    if stream:
+        return stream_query(request.app.state.pool, f'''
+            SELECT {columns} FROM "historique"
+            WHERE {where}
+            ORDER BY {HISTORIQUE_DATE_SQL} DESC, "id" DESC
+        ''', params, fmt=stream)
+
+    # sort_key (texte, pour conserver -infinity) et id servent au curseur
+    query = f'''
+        SELECT {columns}, {HISTORIQUE_DATE_SQL}::text AS sort_key, "id"
+        FROM "historique"
+        WHERE {where}
+    '''
+    query_params = list(params)
+
+    paginate = limit is not None or cursor is not None
+    page_size = limit or DEFAULT_PAGE_SIZE
+
+    if cursor:
+        last_key, last_id = decode_cursor(cursor, (str, int))
+        if not _is_timestamp_text(last_key):
+            raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+        query_params.extend([last_key, last_id])
+        query += f''' AND ({HISTORIQUE_DATE_SQL}, "id") < (${len(query_params) - 1}::text::timestamp, ${len(query_params)})'''
+
+    query += f' ORDER BY {HISTORIQUE_DATE_SQL} DESC, "id" DESC'
+    if paginate:
+        # Une ligne de plus pour savoir s'il existe une page suivante
+        query_params.append(page_size + 1)
+        query += f' LIMIT ${len(query_params)}'
+
+    rows = await conn.fetch(query, *query_params)
+
+    headers = {}
+    if paginate and len(rows) > page_size:
+        rows = rows[:page_size]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1]["sort_key"], rows[-1]["id"])
+
+    # Connexion rendue au pool avant la sérialisation
+    await conn.release()
+    return FastJSONResponse(content=_historique_items(rows), headers=headers)
 
 
 @router.get("/{piece_id}", response_model=List[HistoriqueResponse])
@@ -40,12 +171,22 @@ async def get_historique_by_piece(
     conn: asyncpg.Connection = Depends(get_db_connection)
 ):
     """Récupère l'historique d'une pièce spécifique"""
-    rows = await conn.fetch('''
-        SELECT * FROM "historique" 
-        WHERE "RéfPièce" = $1 
-        ORDER BY COALESCE("DateRecu", "DateCMD") DESC NULLS LAST, "id" DESC
+    rows = await conn.fetch(f'''
+        SELECT {", ".join(select_columns(HISTORIQUE_FIELD_SQL))}
+        FROM "historique"
+        WHERE "RéfPièce" = $1
+        ORDER BY {HISTORIQUE_DATE_SQL} DESC, "id" DESC
     ''', piece_id)
-    return [HistoriqueResponse(**row_to_dict(row)) for row in rows]
+    await conn.release()
+    return FastJSONResponse(content=rows_to_dicts(rows))
+
+
+def _historique_items(rows) -> list:
+    """Lignes → dicts HistoriqueResponse (sans les colonnes de pagination)"""
+    items = rows_to_dicts(rows)
+    for item in items:
+        del item["sort_key"], item["id"]
+    return items
 
 
 @router.post("", response_model=HistoriqueResponse)
@@ -0,0 +1,39 @@
+"""Métriques internes au format texte Prometheus"""
+import secrets
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import PlainTextResponse
+from fastapi.security import HTTPAuthorizationCredentials
+
+from auth import security, get_current_user, require_permission
+from config import METRICS_TOKEN
+
+router = APIRouter(tags=["metrics"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_require_debug_access = require_permission("debug_access")
+
+
+async def require_metrics_access(
+        request: Request,
+        credentials: HTTPAuthorizationCredentials = Depends(security),
+):
+    """Jeton de collecte METRICS_TOKEN (Prometheus) ou utilisateur avec la permission debug_access"""
+    token = getattr(credentials, "credentials", None)
+    if METRICS_TOKEN and token and secrets.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        return
+    await _require_debug_access(await get_current_user(request, credentials))
+
+
+@router.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_metrics_access)])
+async def get_metrics(request: Request):
+    """Pool de connexions (taille, utilisation, attente, réservation) et profil des routes"""
+    lines = []
+    pool = getattr(request.app.state, "pool", None)
+    if pool is not None:
+        lines += pool.prometheus_lines()
+    request_metrics = getattr(request.app.state, "request_metrics", None)
+    if request_metrics is not None:
+        lines += request_metrics.prometheus_lines()
+    return PlainTextResponse("\n".join(lines) + "\n", media_type=PROMETHEUS_CONTENT_TYPE)
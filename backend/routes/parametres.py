@@ -4,7 +4,8 @@ from models import AppSettingsRequest, AppSettingsResponse
 from database import get_db_connection
 from auth import require_admin
 from utils.settings import get_app_settings, upsert_app_settings, ensure_app_settings_table
-from email_service import send_email
+from utils.mail_backends import send_now
+from utils.email_outbox import outbox_status
 
 router = APIRouter(prefix="/parametres", tags=["parametres"])
 
@@ -26,6 +27,12 @@ async def update_parametres(
     return AppSettingsResponse(**updated)
 
 
+@router.get("/email-outbox")
+async def get_email_outbox(conn: asyncpg.Connection = Depends(get_db_connection), user: dict = Depends(require_admin)):
+    """État de la file d'envoi des emails : messages par statut et dernières erreurs"""
+    return await outbox_status(conn)
+
+
 @router.post("/test-email")
 async def test_smtp(conn: asyncpg.Connection = Depends(get_db_connection), user: dict = Depends(require_admin)):
     settings = await get_app_settings(conn)
@@ -33,27 +40,13 @@ async def test_smtp(conn: asyncpg.Connection = Depends(get_db_connection), user:
     if not email:
         raise HTTPException(status_code=400, detail="Aucun email configuré sur votre compte. Ajoutez-en un e-mail dans votre profil.")
 
-    smtp_host = settings.get("email_host") or None
-    smtp_port = settings.get("email_port") or None
-    smtp_from = settings.get("email_from") or None
-    smtp_user = settings.get("email_user") or None
-    smtp_password = settings.get("email_password") or None
-    smtp_tls = bool(settings.get("email_tls", True))
-    smtp_ssl = bool(settings.get("email_ssl", False))
+    await conn.release()
 
-    success = send_email(
+    success = await send_now(
+        settings,
         to=email,
         subject="Test Email - Inventaire Robot",
         body_html="Ceci est un email de test envoyé depuis Inventaire Robot. La configuration SMTP fonctionne correctement.",
-        smtp_config={
-            "host": smtp_host,
-            "port": smtp_port,
-            "from": smtp_from,
-            "user": smtp_user,
-            "password": smtp_password,
-            "tls": smtp_tls,
-            "ssl": smtp_ssl,
-        }
     )
 
     if not success:
@@ -1,4 +1,5 @@
 """Routes pour la gestion des images de pièces"""
+import logging
 import os
 from pathlib import Path
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
@@ -11,6 +12,7 @@ from database import get_db_connection
 from config import BASE_DIR
 from models import ImageUrlRequest
 
+logger = logging.getLogger("Inventaire-Robot")
 router = APIRouter(prefix="/pieces", tags=["piece-images"])
 
 # Créer le dossier uploads si inexistant
@@ -25,7 +27,7 @@ async def search_images_google(search_term: str, num_results: int = 5):
     """Recherche des images via Google Custom Search API"""
 
     if not GOOGLE_API_KEY or not GOOGLE_CSE_ID:
-        print("⚠️ Google API non configurée")
+        logger.warning("⚠️ Google API non configurée")
         return []
 
     url = "https://www.googleapis.com/customsearch/v1"
@@ -57,11 +59,11 @@ async def search_images_google(search_term: str, num_results: int = 5):
 
         except httpx.HTTPStatusError as e:
             if e.response.status_code == 429:
-                print(f"⚠️ Quota Google API dépassé (429) - 100 requêtes/jour max")
+                logger.warning("⚠️ Quota Google API dépassé (429) - 100 requêtes/jour max")
             else:
-                print(f"❌ Erreur API Google ({e.response.status_code}): {e}")
+                logger.error("❌ Erreur API Google (%s): %s", e.response.status_code, e)
         except Exception as e:
-            print(f"❌ Erreur recherche Google: {e}")
+            logger.exception("❌ Erreur recherche Google: %s", e)
 
     return []
 
@@ -188,7 +190,7 @@ async def save_image_from_url(
         raise HTTPException(status_code=404, detail="Pièce non trouvée")
 
     try:
-        print(f"📥 Téléchargement image pour pièce {piece_id} depuis: {request.image_url}")
+        logger.info("📥 Téléchargement image pour pièce %s depuis: %s", piece_id, request.image_url)
 
         # Télécharger l'image
         async with httpx.AsyncClient(timeout=30.0, follow_redirects=True, verify=False) as client:
@@ -210,7 +212,7 @@ async def save_image_from_url(
             filename = f"piece_{piece_id}.{ext}"
             filepath = UPLOADS_DIR / filename
 
-            print(f"💾 Sauvegarde dans: {filepath}")
+            logger.debug("💾 Sauvegarde dans: %s", filepath)
 
             # Sauvegarder le fichier
             async with aiofiles.open(filepath, 'wb') as f:
@@ -225,7 +227,7 @@ async def save_image_from_url(
                 piece_id
             )
 
-            print(f"✅ Image sauvegardée: {filename}")
+            logger.info("✅ Image sauvegardée: %s", filename)
 
             return {
                 "message": "Image téléchargée et sauvegardée",
@@ -235,10 +237,10 @@ async def save_image_from_url(
             }
 
     except httpx.HTTPError as e:
-        print(f"❌ Erreur HTTP téléchargement: {e}")
+        logger.exception("❌ Erreur HTTP téléchargement: %s", e)
         raise HTTPException(status_code=500, detail=f"Erreur téléchargement: {str(e)}")
     except Exception as e:
-        print(f"❌ Erreur sauvegarde: {e}")
+        logger.exception("❌ Erreur sauvegarde: %s", e)
         raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
 
@@ -268,7 +270,7 @@ async def upload_piece_image(
     filename = f"piece_{piece_id}.{ext}"
     filepath = UPLOADS_DIR / filename
 
-    print(f"📤 Upload manuel: {filename}")
+    logger.info("📤 Upload manuel: %s", filename)
 
     # Sauvegarder le fichier
     content = await file.read()
@@ -284,7 +286,7 @@ async def upload_piece_image(
         piece_id
     )
 
-    print(f"✅ Upload réussi: {filename}")
+    logger.info("✅ Upload réussi: %s", filename)
 
     return {
         "message": "Image uploadée avec succès",
@@ -340,7 +342,7 @@ async def delete_piece_image(
         filepath = UPLOADS_DIR / piece["ImagePath"]
         if filepath.exists():
             os.remove(filepath)
-            print(f"🗑️ Image supprimée: {filepath}")
+            logger.info("🗑️ Image supprimée: %s", filepath)
 
     await conn.execute(
         'UPDATE "Pièce" SET "ImagePath" = NULL, "Modified" = NOW() WHERE "RéfPièce" = $1',
@@ -1,41 +1,35 @@
 """Routes pour la gestion des pièces"""
+import logging
 import asyncpg
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
 from typing import List, Optional
 from datetime import datetime
 from database import get_db_connection
-from models import Piece, PieceCreate, PieceUpdate, Fournisseur, Contact
+from models import Piece, PieceCreate, PieceUpdate, PieceSearchResult, Fournisseur, Contact
 from utils.helpers import (
     safe_string, safe_int, safe_float,
     calculate_qty_to_order, get_stock_status
 )
 from utils.historique import log_mouvement
 from auth import require_auth, get_username_from_request
-from notification_service import notify_demande_approbation, notify_piece_commandee
+from notification_service import notify_demande_approbation, notify_piece_commandee, notify_pieces_a_commander
 from utils.settings import create_bon_commande
+from utils.search_index import sync_piece_search_index, remove_from_piece_search_index
+from utils.stats import sync_piece_stats, remove_piece_stats
+from utils.piece_sync import publish_piece_change
+from utils.pagination import encode_cursor, decode_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from utils.serialization import FastJSONResponse, rows_to_dicts, select_columns, stream_query
+from utils.search import (
+    PIECE_SEARCH_TEXT_SQL, normalize_search_term, search_tokens,
+    build_prefix_tsquery, escape_like
+)
 
+logger = logging.getLogger("Inventaire-Robot")
 router = APIRouter(prefix="/pieces", tags=["pieces"])
 
 
-@router.get("", response_model=List[Piece])
-async def get_pieces(
-        conn: asyncpg.Connection = Depends(get_db_connection),
-        search: Optional[str] = None,
-        statut: Optional[str] = None,
-        stock: Optional[str] = None,
-        departement: Optional[int] = None
-):
-    """Récupère toutes les pièces avec filtrage optionnel"""
-    try:
-        base_query = '''
-            SELECT p.*,
-                   f3."NomFabricant",
-                   fp."RéfFournisseur"  as ref_four_principal,
-                   fp."NomFournisseur"  as fournisseur_principal_nom,
-                   fp."NuméroTél"       as fournisseur_principal_tel,
-                   fp."NumSap"          as fournisseur_principal_numsap,
-                   d."NomDepartement",
-                   (
+# Sous-requête JSON de tous les fournisseurs d'une pièce (liste GET /pieces)
+_TOUS_FOURNISSEURS_SUBQUERY = '''COALESCE((
                        SELECT json_agg(
                            json_build_object(
                                'RéfFournisseur',      fall."RéfFournisseur",
@@ -50,123 +44,351 @@ async def get_pieces(
                        FROM "PieceFournisseur" pfall
                        JOIN "Fournisseurs" fall ON fall."RéfFournisseur" = pfall."RéfFournisseur"
                        WHERE pfall."RéfPièce" = p."RéfPièce"
-                   ) as tous_fournisseurs
-            FROM "Pièce" p
-            LEFT JOIN "Fabricant" f3 ON p."RefFabricant" = f3."RefFabricant"
-             LEFT JOIN "Departement" d ON p."RefDepartement" = d."RefDepartement"
-            LEFT JOIN "PieceFournisseur" pf_principal ON (
+                   ), '[]'::json)'''
+
+_FOURNISSEUR_PRINCIPAL_OBJECT = '''CASE WHEN COALESCE(fp."NomFournisseur", '') <> '' THEN json_build_object(
+                       'RéfFournisseur', fp."RéfFournisseur",
+                       'NomFournisseur', fp."NomFournisseur",
+                       'NuméroTél',      COALESCE(fp."NuméroTél", ''),
+                       'NumSap',         COALESCE(fp."NumSap", ''),
+                       'EstPrincipal',   TRUE
+                   ) END'''
+
+_JOIN_FABRICANT = 'LEFT JOIN "Fabricant" f3 ON p."RefFabricant" = f3."RefFabricant"'
+_JOIN_DEPARTEMENT = 'LEFT JOIN "Departement" d ON p."RefDepartement" = d."RefDepartement"'
+_JOIN_FOURNISSEUR_PRINCIPAL = '''LEFT JOIN "PieceFournisseur" pf_principal ON (
                 pf_principal."RéfPièce" = p."RéfPièce" AND pf_principal."EstPrincipal" = TRUE
             )
-            LEFT JOIN "Fournisseurs" fp ON fp."RéfFournisseur" = pf_principal."RéfFournisseur"
-            WHERE 1=1
-        '''
+            LEFT JOIN "Fournisseurs" fp ON fp."RéfFournisseur" = pf_principal."RéfFournisseur"'''
+
+# Expression SQL de chaque champ de Piece, dans l'ordre du modèle.
+# Les valeurs sont normalisées côté SQL (COALESCE, calculs de stock) pour que la
+# ligne asyncpg soit directement la représentation JSON de Piece, sans passer par
+# Pydantic (voir utils/serialization.py). Les champs non lus par la liste gardent
+# leur valeur par défaut du modèle.
+PIECE_FIELD_SQL = {
+    "RéfPièce": 'p."RéfPièce"',
+    "NomPièce": 'p."NomPièce"',
+    "DescriptionPièce": 'COALESCE(p."DescriptionPièce", \'\')',
+    "NumPièce": 'COALESCE(p."NumPièce", \'\')',
+    "RefFabricant": 'p."RefFabricant"',
+    "Lieuentreposage": 'COALESCE(p."Lieuentreposage", \'\')',
+    "QtéenInventaire": 'COALESCE(p."QtéenInventaire", 0)',
+    "Qtéminimum": 'COALESCE(p."Qtéminimum", 0)',
+    "Qtécommandée": 'COALESCE(p."Qtécommandée", 0)',
+    "Datecommande": 'NULL::timestamp',
+    "Qtémax": 'COALESCE(p."Qtémax", 0)',
+    "statut_stock": '''CASE
+                   WHEN COALESCE(p."QtéenInventaire", 0) < COALESCE(p."Qtéminimum", 0) THEN 'critique'
+                   WHEN COALESCE(p."QtéenInventaire", 0) = COALESCE(p."Qtéminimum", 0) THEN 'faible'
+                   ELSE 'ok' END''',
+    "Prix_unitaire": 'COALESCE(p."Prix unitaire", 0)::float8',
+    "Soumission_LD": 'COALESCE(p."Soumission LD", \'\')',
+    "SoumDem": 'p."SoumDem"',
+    "RTBS": 'p."RTBS"',
+    "NoFESTO": 'COALESCE(p."NoFESTO", \'\')',
+    "Discontinué": "''",
+    "devise": 'COALESCE(NULLIF(p."devise", \'\'), \'CAD\')',
+    "RefDepartement": 'p."RefDepartement"',
+    "NomDepartement": 'COALESCE(d."NomDepartement", \'\')',
+    "NumPièceAutreFournisseur": 'COALESCE(p."NumPièceAutreFournisseur", \'\')',
+    "Created": 'p."Created"',
+    "Modified": 'p."Modified"',
+    "fournisseurs": _TOUS_FOURNISSEURS_SUBQUERY,
+    "fournisseur_principal": _FOURNISSEUR_PRINCIPAL_OBJECT,
+    "NomFabricant": 'COALESCE(f3."NomFabricant", \'\')',
+    "Qtéàcommander": '''CASE
+                   WHEN COALESCE(p."QtéenInventaire", 0) < COALESCE(p."Qtéminimum", 0)
+                        AND COALESCE(p."Qtéminimum", 0) > 0
+                   THEN COALESCE(p."Qtéminimum", 0) - COALESCE(p."QtéenInventaire", 0)
+                   ELSE 0 END''',
+    "Qtéarecevoir": '0',
+    "demandeur": 'NULL::text',
+}
+
+# Colonnes json à décoder avant sérialisation
+PIECE_JSON_FIELDS = ("fournisseurs", "fournisseur_principal")
+
+
+def _piece_select(fields) -> tuple:
+    """Liste SELECT et jointures nécessaires pour les champs demandés (ordre du modèle)"""
+    columns = select_columns(PIECE_FIELD_SQL, fields)
+    joins = []
+    if "NomFabricant" in fields:
+        joins.append(_JOIN_FABRICANT)
+    if "NomDepartement" in fields:
+        joins.append(_JOIN_DEPARTEMENT)
+    if "fournisseur_principal" in fields:
+        joins.append(_JOIN_FOURNISSEUR_PRINCIPAL)
+    return columns, joins
+
+
+# Clés de tri keyset (expressions identiques aux index de utils/indexes.py)
+PIECE_SORT_KEYS = {
+    "RéfPièce": 'p."RéfPièce"',
+    "NomPièce": 'COALESCE(p."NomPièce", \'\')',
+    "NumPièce": 'COALESCE(p."NumPièce", \'\')',
+    "Lieuentreposage": 'COALESCE(p."Lieuentreposage", \'\')',
+}
+
+
+def _build_piece_filters(
+        search: Optional[str],
+        statut: Optional[str],
+        stock: Optional[str],
+        departement: Optional[int],
+        capabilities: Optional[dict] = None,
+        search_ids: Optional[List[int]] = None
+):
+    """
+    Construit la clause WHERE partagée par la liste et le comptage des pièces.
+
+    search_ids : RéfPièce déjà trouvées par l'index mémoire (remplace le filtre SQL de search)
+    """
+    # Les pièces sans nom ne sont jamais retournées
+    conditions = ['COALESCE(p."NomPièce", \'\') <> \'\'']
+    params = []
+    param_idx = 1
+    capabilities = capabilities or {}
+
+    # Filtrage par recherche : IDs de l'index mémoire, sous-chaîne via l'index trigrammes,
+    # sinon préfixe par mot via l'index plein texte. Un LIKE '%terme%' ne peut pas utiliser
+    # l'index tsvector : avec lui seul, "123" ne trouve plus "PN-00123" (SEARCH_BACKEND=auto
+    # utilise l'index mémoire, par sous-chaîne, quand pg_trgm manque)
+    if search and search_ids is not None:
+        conditions.append(f'p."RéfPièce" = ANY(${param_idx}::int[])')
+        params.append(search_ids)
+        param_idx += 1
+    elif search and capabilities.get("trgm"):
+        conditions.append(f"{PIECE_SEARCH_TEXT_SQL} LIKE ${param_idx} ESCAPE '\\'")
+        params.append(f'%{escape_like(normalize_search_term(search))}%')
+        param_idx += 1
+    elif search and capabilities.get("fts") and search_tokens(search):
+        conditions.append(f"to_tsvector('simple', {PIECE_SEARCH_TEXT_SQL}) @@ to_tsquery('simple', ${param_idx})")
+        params.append(build_prefix_tsquery(search))
+        param_idx += 1
+    elif search:
+        conditions.append(f'(COALESCE(p."NomPièce", \'\') ILIKE ${param_idx} OR COALESCE(p."NumPièce", \'\') ILIKE ${param_idx} OR COALESCE(p."DescriptionPièce", \'\') ILIKE ${param_idx} OR COALESCE(p."NumPièceAutreFournisseur", \'\') ILIKE ${param_idx} OR COALESCE(p."Lieuentreposage", \'\') ILIKE ${param_idx} OR COALESCE(p."NoFESTO", \'\') ILIKE ${param_idx} OR COALESCE(CAST(p."RTBS" AS TEXT), \'\') ILIKE ${param_idx})')
+        params.append(f'%{search}%')
+        param_idx += 1
+
+    # Filtrage par statut (actif/obsolete/discontinue)
+    if statut and statut != "tous":
+        conditions.append(f'p."statut" = ${param_idx}')
+        params.append(statut)
+        param_idx += 1
+
+    # Filtrage par niveau de stock
+    if stock and stock != "tous":
+        if stock == "critique":
+            conditions.append('p."QtéenInventaire" < p."Qtéminimum"')
+        elif stock == "faible":
+            conditions.append('p."QtéenInventaire" = p."Qtéminimum"')
+        elif stock == "ok":
+            conditions.append('p."QtéenInventaire" > p."Qtéminimum"')
+
+    # Filtre Dep :
+    if departement:
+        conditions.append(f'p."RefDepartement" = ${param_idx}')
+        params.append(departement)
+        param_idx += 1
+
+    return " AND ".join(conditions), params
+
 
-        params = []
-        param_idx = 1
-
-        # Filtrage par recherche
-        if search:
-            base_query += f' AND (COALESCE(p."NomPièce", \'\') ILIKE ${param_idx} OR COALESCE(p."NumPièce", \'\') ILIKE ${param_idx} OR COALESCE(p."DescriptionPièce", \'\') ILIKE ${param_idx} OR COALESCE(p."NumPièceAutreFournisseur", \'\') ILIKE ${param_idx} OR COALESCE(p."Lieuentreposage", \'\') ILIKE ${param_idx} OR COALESCE(p."NoFESTO", \'\') ILIKE ${param_idx} OR COALESCE(CAST(p."RTBS" AS TEXT), \'\') ILIKE ${param_idx})'
-            params.append(f'%{search}%')
-            param_idx += 1
-
-        # Filtrage par statut (actif/obsolete/discontinue)
-        if statut and statut != "tous":
-            base_query += f' AND p."statut" = ${param_idx}'
-            params.append(statut)
-            param_idx += 1
-
-        # Filtrage par niveau de stock
-        if stock and stock != "tous":
-            if stock == "critique":
-                base_query += ' AND p."QtéenInventaire" < p."Qtéminimum"'
-            elif stock == "faible":
-                base_query += ' AND p."QtéenInventaire" = p."Qtéminimum"'
-            elif stock == "ok":
-                base_query += ' AND p."QtéenInventaire" > p."Qtéminimum"'
-
-        # Filtre Dep :
-        if departement:
-            base_query += f' AND p."RefDepartement" = ${param_idx}'
-            params.append(departement)
-            param_idx += 1
-
-        pieces = await conn.fetch(base_query, *params)
-
-        result = []
-        for piece in pieces:
-            piece_dict = dict(piece)
-
-            # Sécuriser les valeurs
-            nom_piece = safe_string(piece_dict.get("NomPièce", ""))
-            if not nom_piece:
-                continue
-
-            qty_inventaire = safe_int(piece_dict.get("QtéenInventaire", 0))
-            qty_minimum = safe_int(piece_dict.get("Qtéminimum", 0))
-            qty_max = safe_int(piece_dict.get("Qtémax", 100))
-
-            # Calculer la quantité à commander automatiquement
-            qty_a_commander = calculate_qty_to_order(qty_inventaire, qty_minimum, qty_max)
-            statut_stock = get_stock_status(qty_inventaire, qty_minimum)
-
-            # Préparer les informations des fournisseurs
-            fournisseur_principal = None
-            if piece_dict.get("fournisseur_principal_nom"):
-                fournisseur_principal = {
-                    "RéfFournisseur": piece_dict.get("ref_four_principal"),
-                    "NomFournisseur": safe_string(piece_dict.get("fournisseur_principal_nom", "")),
-                    "NuméroTél": safe_string(piece_dict.get("fournisseur_principal_tel", "")),
-                    "NumSap": safe_string(piece_dict.get("fournisseur_principal_numsap", "")),
-                    "EstPrincipal": True,
-                }
-
-            # Charger tous les fournisseurs depuis la subquery JSON
-            import json as _json
-            tous_raw = piece_dict.get("tous_fournisseurs")
-            if tous_raw:
-                if isinstance(tous_raw, str):
-                    tous_fournisseurs = _json.loads(tous_raw)
-                else:
-                    tous_fournisseurs = list(tous_raw)
+@router.get("", response_model=List[Piece])
+async def get_pieces(
+        request: Request,
+        conn: asyncpg.Connection = Depends(get_db_connection),
+        search: Optional[str] = None,
+        statut: Optional[str] = None,
+        stock: Optional[str] = None,
+        departement: Optional[int] = None,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        sort: str = "RéfPièce",
+        fields: Optional[str] = None,
+        export: bool = False,
+        stream: Optional[str] = Query(None, pattern="^(json|ndjson)$")
+):
+    """
+    Récupère les pièces avec filtrage optionnel.
+
+    - search : sous-chaîne (index mémoire, par mot ; index trigrammes) ou préfixe par mot
+      (index plein texte seul), insensible aux accents ; ILIKE sans index
+    - limit / cursor : pagination keyset. Le curseur de la page suivante est renvoyé
+      dans l'en-tête X-Next-Cursor ; X-Total-Count n'est calculé que sur la première page.
+    - sort : RéfPièce, NomPièce, NumPièce ou Lieuentreposage (préfixe '-' = décroissant)
+    - fields : champs à retourner, séparés par des virgules (seules ces colonnes sont lues)
+    - export : ignore limit/cursor et retourne tout le catalogue
+    - stream : json ou ndjson — diffuse tout le résultat via un curseur serveur
+      (ignore limit/cursor, mémoire constante quelle que soit la taille du catalogue)
+
+    Sans limit ni cursor, tout le catalogue est retourné comme auparavant.
+    Les lignes sont sérialisées directement (PIECE_FIELD_SQL), sans instancier de Piece.
+    """
+    paginate = not export and not stream and (limit is not None or cursor is not None)
+    page_size = limit or DEFAULT_PAGE_SIZE
+
+    descending = sort.startswith("-")
+    sort_name = sort.lstrip("-")
+    if sort_name not in PIECE_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Tri invalide : {sort}")
+    sort_expr = PIECE_SORT_KEYS[sort_name]
+
+    selected_fields = set(PIECE_FIELD_SQL)
+    if fields:
+        selected_fields = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = selected_fields - PIECE_FIELD_SQL.keys()
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Champs inconnus : {', '.join(sorted(unknown))}")
+        # RéfPièce et la clé de tri servent à construire le curseur
+        selected_fields.update({"RéfPièce", sort_name})
+
+    # Curseur validé avant le try : un curseur altéré donne un 400, pas une page vide
+    last_key = last_id = None
+    if paginate and cursor:
+        last_key, last_id = decode_cursor(cursor, (int if sort_name == "RéfPièce" else str, int))
+
+    try:
+        capabilities = request.app.state.search_capabilities
+        memory_index = request.app.state.piece_search_index
+        search_ids = None
+        if search and memory_index is not None and search_tokens(search):
+            # Index mémoire : IDs d'abord, les autres filtres et le tri restent en SQL
+            search_ids = sorted(memory_index.match(search, infix=True))
+        where, params = _build_piece_filters(search, statut, stock, departement, capabilities, search_ids)
+        columns, joins = _piece_select(selected_fields)
+
+        query = f'''
+            SELECT {", ".join(columns)}
+            FROM "Pièce" p
+            {" ".join(joins)}
+            WHERE {where}
+        '''
+        query_params = list(params)
+        direction = "DESC" if descending else "ASC"
+
+        if last_id is not None:
+            op = "<" if descending else ">"
+            if sort_name == "RéfPièce":
+                query_params.append(last_id)
+                query += f' AND p."RéfPièce" {op} ${len(query_params)}'
             else:
-                tous_fournisseurs = [fournisseur_principal] if fournisseur_principal else []
-
-            piece_response = Piece(
-                RéfPièce=piece_dict["RéfPièce"],
-                NomPièce=nom_piece,
-                DescriptionPièce=safe_string(piece_dict.get("DescriptionPièce", "")),
-                NumPièce=safe_string(piece_dict.get("NumPièce", "")),
-                NumPièceAutreFournisseur=safe_string(piece_dict.get("NumPièceAutreFournisseur", "")),
-                Lieuentreposage=safe_string(piece_dict.get("Lieuentreposage", "")),
-                QtéenInventaire=qty_inventaire,
-                Qtéminimum=qty_minimum,
-                Qtémax=qty_max,
-                Qtéàcommander=qty_a_commander,
-                Qtécommandée=safe_int(piece_dict.get("Qtécommandée")),
-                Prix_unitaire=safe_float(piece_dict.get("Prix unitaire", 0)),
-                Soumission_LD=safe_string(piece_dict.get("Soumission LD", "")),
-                SoumDem=piece_dict.get("SoumDem", ""),
-                fournisseur_principal=fournisseur_principal,
-                fournisseurs=tous_fournisseurs,
-                NomFabricant=safe_string(piece_dict.get("NomFabricant", "")),
-                RefFabricant=piece_dict.get("RefFabricant"),
-                statut_stock=statut_stock,
-                Created=piece_dict.get("Created"),
-                Modified=piece_dict.get("Modified"),
-                RTBS=piece_dict.get("RTBS"),
-                devise=safe_string(piece_dict.get("devise", "CAD")) or "CAD",
-                RefDepartement=piece_dict.get("RefDepartement"),
-                NomDepartement=safe_string(piece_dict.get("NomDepartement", "")),
-                NoFESTO=safe_string(piece_dict.get("NoFESTO"))
-            )
-            result.append(piece_response)
+                query_params.extend([last_key, last_id])
+                query += f' AND ({sort_expr}, p."RéfPièce") {op} (${len(query_params) - 1}, ${len(query_params)})'
+
+        query += f' ORDER BY {sort_expr} {direction}, p."RéfPièce" {direction}'
+        if paginate:
+            # Une ligne de plus pour savoir s'il existe une page suivante
+            query_params.append(page_size + 1)
+            query += f' LIMIT ${len(query_params)}'
+
+        if stream:
+            return stream_query(request.app.state.pool, query, query_params, PIECE_JSON_FIELDS, stream)
+
+        rows = await conn.fetch(query, *query_params)
+
+        headers = {}
+        if paginate:
+            if len(rows) > page_size:
+                rows = rows[:page_size]
+                last = rows[-1]
+                # Les colonnes de tri sont déjà normalisées comme PIECE_SORT_KEYS
+                headers["X-Next-Cursor"] = encode_cursor(last[sort_name], last["RéfPièce"])
+            if not cursor:
+                total = await conn.fetchval(f'SELECT COUNT(*) FROM "Pièce" p WHERE {where}', *params)
+                headers["X-Total-Count"] = str(total or 0)
+        else:
+            headers["X-Total-Count"] = str(len(rows))
+
+        # Connexion rendue au pool avant la sérialisation
+        await conn.release()
+        return FastJSONResponse(content=rows_to_dicts(rows, PIECE_JSON_FIELDS), headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("❌ Erreur get_pieces: %s", e)
+        return []
+
+
+@router.get("/search", response_model=List[PieceSearchResult])
+async def search_pieces(
+        request: Request,
+        q: str,
+        limit: int = Query(20, ge=1, le=100),
+        conn: asyncpg.Connection = Depends(get_db_connection)
+):
+    """
+    Recherche classée des pièces : préfixe par mot, insensible aux accents et à la casse,
+    sur le nom, les numéros, la description, l'entreposage, le no FESTO et le RTBS.
+    """
+    capabilities = request.app.state.search_capabilities
+    memory_index = request.app.state.piece_search_index
+    if not search_tokens(q):
+        return []
+
+    columns, joins = _piece_select(PIECE_FIELD_SQL)
+    columns, joins = ", ".join(columns), " ".join(joins)
 
-        return result
+    try:
+        if memory_index is not None:
+            # Index mémoire : la base ne sert qu'à hydrater la page d'IDs retenue
+            ids = memory_index.search(q, limit)
+            if not ids:
+                return []
+            rank = {piece_id: len(ids) - i for i, piece_id in enumerate(ids)}
+            rows = await conn.fetch(f'''
+                SELECT {columns}
+                FROM "Pièce" p
+                {joins}
+                WHERE p."RéfPièce" = ANY($1::int[])
+            ''', ids)
+            rows = sorted(
+                ({**dict(row), "score": rank[row["RéfPièce"]]} for row in rows),
+                key=lambda row: -row["score"]
+            )
+        elif capabilities.get("fts"):
+            params = [build_prefix_tsquery(q)]
+            match = f"to_tsvector('simple', {PIECE_SEARCH_TEXT_SQL}) @@ to_tsquery('simple', $1)"
+            score = f"ts_rank(to_tsvector('simple', {PIECE_SEARCH_TEXT_SQL}), to_tsquery('simple', $1))"
+            if capabilities.get("trgm"):
+                # Tolérance aux fautes de frappe via la similarité de mots (pg_trgm)
+                params.append(normalize_search_term(q))
+                match = f"({match} OR $2 <% {PIECE_SEARCH_TEXT_SQL})"
+                score = f"({score} + word_similarity($2, {PIECE_SEARCH_TEXT_SQL}))"
+            params.append(limit)
+            rows = await conn.fetch(f'''
+                SELECT {columns}, {score} AS score
+                FROM "Pièce" p
+                {joins}
+                WHERE COALESCE(p."NomPièce", '') <> '' AND {match}
+                ORDER BY score DESC, p."RéfPièce"
+                LIMIT ${len(params)}
+            ''', *params)
+        else:
+            # Index non disponible : ancien filtre ILIKE, sans classement
+            where, params = _build_piece_filters(q, None, None, None)
+            params.append(limit)
+            rows = await conn.fetch(f'''
+                SELECT {columns}, 0.0 AS score
+                FROM "Pièce" p
+                {joins}
+                WHERE {where}
+                ORDER BY COALESCE(p."NomPièce", ''), p."RéfPièce"
+                LIMIT ${len(params)}
+            ''', *params)
     except Exception as e:
-        print(f"❌ Erreur get_pieces: {e}")
+        logger.exception("❌ Erreur search_pieces: %s", e)
         return []
 
+    await conn.release()
+    result = rows_to_dicts(rows, PIECE_JSON_FIELDS)
+    for piece in result:
+        piece["score"] = float(piece["score"] or 0)
+    return FastJSONResponse(content=result)
+
+
 @router.get("/{piece_id}", response_model=Piece)
 async def get_piece(piece_id: int, request: Request):
     conn = await request.app.state.pool.acquire()
@@ -260,7 +482,7 @@ async def get_piece(piece_id: int, request: Request):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Erreur get_piece {piece_id}: {e}")
+        logger.exception("Erreur get_piece %s: %s", piece_id, e)
         raise HTTPException(status_code=500, detail="Erreur serveur")
     finally:
         await request.app.state.pool.release(conn)
@@ -350,6 +572,7 @@ async def remove_fournisseur_from_piece(
 @router.post("", response_model=Piece)
 async def create_piece(
     piece: PieceCreate,
+    request: Request,
     conn: asyncpg.Connection = Depends(get_db_connection),
     user: dict = Depends(require_auth)
 ):
@@ -396,6 +619,9 @@ async def create_piece(
     )
 
     piece_id = row["RéfPièce"]
+    await sync_piece_search_index(request.app, conn, piece_id)
+    await sync_piece_stats(request.app, conn, piece_id)
+    await publish_piece_change(conn, piece_id)
 
     # 2. Insérer les fournisseurs dans PieceFournisseur
     fournisseurs_input = piece.fournisseurs or []
@@ -463,7 +689,7 @@ async def create_piece(
         try:
             await notify_demande_approbation(conn, piece.NomPièce, piece_id, user.get('username', 'Système'))
         except Exception as notif_err:
-            print(f"⚠️ Erreur notification (non bloquant): {notif_err}")
+            logger.warning("⚠️ Erreur notification (non bloquant): %s", notif_err)
 
     piece_dict = dict(row)
     qty_a_commander = calculate_qty_to_order(
@@ -508,7 +734,7 @@ async def update_piece(piece_id: int, piece_update: PieceUpdate, request: Reques
     # ── Snapshot AVANT mise à jour (pour détecter les changements) ──
     username = get_username_from_request(request)
     old_row = await conn.fetchrow(
-        'SELECT "QtéenInventaire", "Qtécommandée", "NomPièce", "NumPièce" FROM "Pièce" WHERE "RéfPièce" = $1',
+        'SELECT "QtéenInventaire", "Qtécommandée", "Qtéminimum", "NomPièce", "NumPièce" FROM "Pièce" WHERE "RéfPièce" = $1',
         piece_id
     )
     # Construire la requête de mise à jour dynamiquement
@@ -562,6 +788,9 @@ async def update_piece(piece_id: int, piece_update: PieceUpdate, request: Reques
             WHERE "RéfPièce" = ${param_count}
         '''
     await conn.execute(query, *values)
+    await sync_piece_search_index(request.app, conn, piece_id)
+    await sync_piece_stats(request.app, conn, piece_id)
+    await publish_piece_change(conn, piece_id)
 
     # Notifier si une commande vient d'être passée (Qtécommandée > 0)
     update_dict_check = piece_update.dict(exclude_unset=True)
@@ -573,9 +802,32 @@ async def update_piece(piece_id: int, piece_update: PieceUpdate, request: Reques
         )
         if piece_nom_row:
             try:
-                await notify_piece_commandee(conn, piece_nom_row["NomPièce"], qte_commandee)
+                await notify_piece_commandee(conn, piece_nom_row["NomPièce"], qte_commandee, piece_ref=piece_id)
+            except Exception as notif_err:
+                logger.warning("⚠️ Erreur notification commande (non bloquant): %s", notif_err)
+
+    # Notifier si le stock vient de passer sous le minimum (une seule fois par franchissement)
+    if old_row and ("QtéenInventaire" in update_dict_check or "Qtéminimum" in update_dict_check):
+        stock_row = await conn.fetchrow(
+            'SELECT "NomPièce", "NumPièce", "QtéenInventaire", "Qtéminimum", "Qtémax" FROM "Pièce" WHERE "RéfPièce" = $1',
+            piece_id
+        )
+        was_below = safe_int(old_row["QtéenInventaire"]) < safe_int(old_row["Qtéminimum"])
+        if stock_row and not was_below and safe_int(stock_row["QtéenInventaire"]) < safe_int(stock_row["Qtéminimum"]):
+            try:
+                await notify_pieces_a_commander(conn, [{
+                    "RéfPièce": piece_id,
+                    "NomPièce": stock_row["NomPièce"],
+                    "NumPièce": stock_row["NumPièce"],
+                    "QtéenInventaire": safe_int(stock_row["QtéenInventaire"]),
+                    "Qtéàcommander": calculate_qty_to_order(
+                        safe_int(stock_row["QtéenInventaire"]),
+                        safe_int(stock_row["Qtéminimum"]),
+                        safe_int(stock_row["Qtémax"]),
+                    ),
+                }])
             except Exception as notif_err:
-                print(f"⚠️ Erreur notification commande (non bloquant): {notif_err}")
+                logger.warning("⚠️ Erreur notification pièces à commander (non bloquant): %s", notif_err)
 
     # Sauvegarder les fournisseurs si fournis dans la mise à jour
     update_dict = piece_update.dict(exclude_unset=True)
@@ -649,7 +901,7 @@ async def update_piece(piece_id: int, piece_update: PieceUpdate, request: Reques
                         ref_fournisseur=update_fields_log.get("RéfFournisseur")
                     )
                 except Exception as bc_err:
-                    print(f"⚠️ Impossible de créer le bon de commande : {bc_err}")
+                    logger.warning("⚠️ Impossible de créer le bon de commande : %s", bc_err)
 
     # Récupérer la pièce mise à jour avec ses fournisseurs via PieceFournisseur
     piece = await conn.fetchrow('''
@@ -736,8 +988,11 @@ async def update_piece(piece_id: int, piece_update: PieceUpdate, request: Reques
 
 
 @router.delete("/{piece_id}")
-async def delete_piece(piece_id: int, conn: asyncpg.Connection = Depends(get_db_connection)):
+async def delete_piece(piece_id: int, request: Request, conn: asyncpg.Connection = Depends(get_db_connection)):
     result = await conn.execute('DELETE FROM "Pièce" WHERE "RéfPièce" = $1', piece_id)
     if result == "DELETE 0":
         raise HTTPException(status_code=404, detail="Pièce non trouvée")
+    remove_from_piece_search_index(request.app, piece_id)
+    remove_piece_stats(request.app, piece_id)
+    await publish_piece_change(conn, piece_id, deleted=True)
     return {"message": "Pièce supprimée"}
\ No newline at end of file
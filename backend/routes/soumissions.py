@@ -1,4 +1,5 @@
 """Routes pour la gestion des soumissions"""
+import logging
 import asyncpg
 from fastapi import APIRouter, Depends
 from typing import List
@@ -8,7 +9,10 @@ from database import get_db_connection
 from models import Soumission, SoumissionCreate
 from utils.helpers import safe_string
 from models import SoumissionPrix, SoumissionPrixCreate
+from models import SoumissionsPiecesRequest, DerniereSoumissionPiece
+from utils.serialization import FastJSONResponse, rows_to_dicts
 
+logger = logging.getLogger("Inventaire-Robot")
 router = APIRouter(prefix="/soumissions", tags=["soumissions"])
 
 @router.post("", response_model=Soumission)
@@ -28,17 +32,26 @@ async def create_soumission(
     import json
     pieces_json = json.dumps([p.model_dump() for p in soumission.Pieces])
     
-    row = await conn.fetchrow(
-        query,
-        soumission.RéfFournisseur,
-        soumission.EmailsDestinataires,
-        soumission.Sujet,
-        soumission.MessageCorps,
-        pieces_json,
-        soumission.User,
-        soumission.Notes or "",
-        datetime.utcnow()
-    )
+    async with conn.transaction():
+        row = await conn.fetchrow(
+            query,
+            soumission.RéfFournisseur,
+            soumission.EmailsDestinataires,
+            soumission.Sujet,
+            soumission.MessageCorps,
+            pieces_json,
+            soumission.User,
+            soumission.Notes or "",
+            datetime.utcnow()
+        )
+
+        # Copie normalisée des pièces : dernière soumission d'une pièce par index
+        await conn.executemany(
+            '''INSERT INTO "SoumissionPiece" ("RéfPièce", "RefSoumission", "DateEnvoi", "Quantite")
+               VALUES ($1, $2, $3, $4)
+               ON CONFLICT DO NOTHING''',
+            [(p.RéfPièce, row["RefSoumission"], row["DateEnvoi"], p.Quantite) for p in soumission.Pieces]
+        )
     
     # Récupérer le nom du fournisseur
     fournisseur = await conn.fetchrow(
@@ -77,7 +90,7 @@ async def get_soumissions(conn: asyncpg.Connection = Depends(get_db_connection))
         pieces = json.loads(r["Pieces"]) if r["Pieces"] else []
 
         # 👀 DEBUG : Afficher le statut
-        print(f"📊 Soumission {r['RefSoumission']}: Statut = {r.get('Statut', 'NULL')}")
+        logger.debug("📊 Soumission %s: Statut = %s", r['RefSoumission'], r.get('Statut', 'NULL'))
 
         result.append(Soumission(
             RefSoumission=r["RefSoumission"],
@@ -250,28 +263,83 @@ async def get_derniere_soumission_piece(
         conn: asyncpg.Connection = Depends(get_db_connection)
 ):
     """Trouve la dernière soumission pour une pièce spécifique"""
-    import json
-
-    rows = await conn.fetch('''
-        SELECT s.*, f."NomFournisseur" as fournisseur_nom
-        FROM "Soumissions" s
+    # Parcours de idx_soumissionpiece_piece_date jusqu'à la première soumission ouverte
+    r = await conn.fetchrow('''
+        SELECT s."RefSoumission", s."Statut", s."RéfFournisseur", s."DateEnvoi",
+               f."NomFournisseur" as fournisseur_nom
+        FROM "SoumissionPiece" sp
+        JOIN "Soumissions" s ON s."RefSoumission" = sp."RefSoumission"
         LEFT JOIN "Fournisseurs" f ON s."RéfFournisseur" = f."RéfFournisseur"
-        WHERE s."Statut" IN ('Envoyée', 'Prix reçu')
-        ORDER BY s."DateEnvoi" DESC
-    ''')
-
-    # Filtrer celles qui contiennent cette pièce
-    for r in rows:
-        pieces = json.loads(r["Pieces"]) if r["Pieces"] else []
-        if any(p.get('RéfPièce') == piece_id for p in pieces):
-            # Retourner la première (= la plus récente)
-            return {
-                "RefSoumission": r["RefSoumission"],
-                "Statut": r.get("Statut", "Envoyée"),
-                "RéfFournisseur": r["RéfFournisseur"],
-                "fournisseur_nom": safe_string(r.get("fournisseur_nom", "")),
-                "DateEnvoi": r["DateEnvoi"]
-            }
+        WHERE sp."RéfPièce" = $1
+          AND s."Statut" IN ('Envoyée', 'Prix reçu')
+        ORDER BY sp."DateEnvoi" DESC
+        LIMIT 1
+    ''', piece_id)
 
     # Aucune soumission trouvée
-    return None
\ No newline at end of file
+    if not r:
+        return None
+
+    return {
+        "RefSoumission": r["RefSoumission"],
+        "Statut": r["Statut"],
+        "RéfFournisseur": r["RéfFournisseur"],
+        "fournisseur_nom": safe_string(r["fournisseur_nom"]),
+        "DateEnvoi": r["DateEnvoi"]
+    }
+
+
+@router.post("/pieces/dernieres", response_model=List[DerniereSoumissionPiece])
+async def get_dernieres_soumissions_pieces(
+        payload: SoumissionsPiecesRequest,
+        conn: asyncpg.Connection = Depends(get_db_connection)
+):
+    """
+    Dernière soumission ouverte et meilleur prix reçu de plusieurs pièces en une requête
+    (décoration des grilles de commandes et d'inventaire). Une ligne par pièce demandée,
+    dans l'ordre de la liste ; champs à null si la pièce n'a ni soumission ni prix.
+    """
+    piece_ids = list(dict.fromkeys(payload.pieces))
+    if not piece_ids:
+        return FastJSONResponse(content=[])
+
+    rows = await conn.fetch('''
+        SELECT ids.id AS "RéfPièce",
+               d."RefSoumission", d."Statut", d."DateEnvoi", d."RéfFournisseur",
+               d.fournisseur_nom,
+               b."PrixUnitaire"::float8 AS meilleur_prix,
+               b."DelaiLivraison" AS meilleur_prix_delai,
+               b.fournisseur_nom AS meilleur_prix_fournisseur,
+               b."DateSaisie" AS meilleur_prix_date,
+               COALESCE(n.nb_prix, 0)::integer AS nb_prix
+        FROM unnest($1::integer[]) WITH ORDINALITY AS ids(id, ordre)
+        LEFT JOIN LATERAL (
+            SELECT s."RefSoumission", s."Statut", s."DateEnvoi", s."RéfFournisseur",
+                   f."NomFournisseur" AS fournisseur_nom
+            FROM "SoumissionPiece" sp
+            JOIN "Soumissions" s ON s."RefSoumission" = sp."RefSoumission"
+            LEFT JOIN "Fournisseurs" f ON s."RéfFournisseur" = f."RéfFournisseur"
+            WHERE sp."RéfPièce" = ids.id
+              AND s."Statut" IN ('Envoyée', 'Prix reçu')
+            ORDER BY sp."DateEnvoi" DESC
+            LIMIT 1
+        ) d ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT p."PrixUnitaire", p."DelaiLivraison", p."DateSaisie",
+                   f."NomFournisseur" AS fournisseur_nom
+            FROM "SoumissionPrix" p
+            JOIN "Soumissions" s ON s."RefSoumission" = p."RefSoumission"
+            LEFT JOIN "Fournisseurs" f ON s."RéfFournisseur" = f."RéfFournisseur"
+            WHERE p."RéfPièce" = ids.id
+            ORDER BY p."PrixUnitaire" ASC, p."DateSaisie" DESC
+            LIMIT 1
+        ) b ON TRUE
+        LEFT JOIN LATERAL (
+            SELECT COUNT(*) AS nb_prix FROM "SoumissionPrix" p WHERE p."RéfPièce" = ids.id
+        ) n ON TRUE
+        ORDER BY ids.ordre
+    ''', piece_ids)
+
+    # Connexion rendue au pool avant la sérialisation
+    await conn.release()
+    return FastJSONResponse(content=rows_to_dicts(rows))
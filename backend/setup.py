@@ -100,6 +100,7 @@ CREATE TABLE IF NOT EXISTS users (
     role VARCHAR(50) DEFAULT 'user',
     group_id INTEGER,
     notification_prefs JSONB,
+    token_version INTEGER NOT NULL DEFAULT 0,
     created_at TIMESTAMP DEFAULT NOW()
 );
 
@@ -129,6 +130,35 @@ CREATE TABLE IF NOT EXISTS password_reset_tokens (
     created_at TIMESTAMP DEFAULT NOW()
 );
 
+-- Jetons de rafraîchissement (hachés), une "family" par session (auth.py)
+CREATE TABLE IF NOT EXISTS "RefreshTokens" (
+    "id"          BIGSERIAL PRIMARY KEY,
+    "user_id"     UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    "family"      UUID NOT NULL,
+    "token_hash"  TEXT NOT NULL UNIQUE,
+    "expires_at"  TIMESTAMPTZ NOT NULL,
+    "created_at"  TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    "used_at"     TIMESTAMPTZ,
+    "revoked_at"  TIMESTAMPTZ
+);
+CREATE INDEX IF NOT EXISTS "idx_refreshtokens_user" ON "RefreshTokens" ("user_id");
+CREATE INDEX IF NOT EXISTS "idx_refreshtokens_family" ON "RefreshTokens" ("family");
+
+-- Jetons d'accès révoqués à la déconnexion, gardés jusqu'à leur expiration (auth.py)
+CREATE TABLE IF NOT EXISTS "RevokedTokens" (
+    "jti"         TEXT PRIMARY KEY,
+    "expires_at"  TIMESTAMPTZ NOT NULL
+);
+CREATE INDEX IF NOT EXISTS "idx_revokedtokens_expires" ON "RevokedTokens" ("expires_at");
+
+-- Échecs de connexion par utilisateur / adresse IP, partagés par les workers (utils/rate_limit.py)
+CREATE TABLE IF NOT EXISTS "LoginFailures" (
+    "key"           TEXT PRIMARY KEY,
+    "window_start"  TIMESTAMPTZ NOT NULL,
+    "count"         INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS "idx_loginfailures_window" ON "LoginFailures" ("window_start");
+
 -- ============================================================
 -- FABRICANTS
 -- ============================================================
@@ -249,7 +279,8 @@ CREATE TABLE IF NOT EXISTS "historique" (
     "qtécommande" VARCHAR(50),
     "QtéSortie"   VARCHAR(50),
     "nompiece"    VARCHAR(300) DEFAULT '',
-    "RéfPièce"    NUMERIC,
+    -- Sans clé étrangère : l'historique garde le numéro des pièces supprimées
+    "RéfPièce"    INTEGER,
     "User"        VARCHAR(100),
     "Delais"      NUMERIC
 );
@@ -285,6 +316,47 @@ CREATE TABLE IF NOT EXISTS "SoumissionPrix" (
     "DateSaisie"     TIMESTAMP DEFAULT NOW()
 );
 
+-- Pièces d'une soumission (copie normalisée de "Soumissions"."Pieces"),
+-- pour retrouver la dernière soumission d'une pièce par index
+CREATE TABLE IF NOT EXISTS "SoumissionPiece" (
+    "RéfPièce"       INTEGER NOT NULL,
+    "RefSoumission"  INTEGER NOT NULL REFERENCES "Soumissions"("RefSoumission") ON DELETE CASCADE,
+    "DateEnvoi"      TIMESTAMP,
+    "Quantite"       INTEGER DEFAULT 0,
+    PRIMARY KEY ("RéfPièce", "RefSoumission")
+);
+CREATE INDEX IF NOT EXISTS "idx_soumissionpiece_piece_date"
+    ON "SoumissionPiece" ("RéfPièce", "DateEnvoi" DESC);
+
+-- File d'envoi des emails (utils/email_outbox.py)
+CREATE TABLE IF NOT EXISTS "EmailOutbox" (
+    "id"               BIGSERIAL PRIMARY KEY,
+    "recipient"        TEXT NOT NULL,
+    "subject"          TEXT NOT NULL,
+    "body_html"        TEXT NOT NULL,
+    "status"           TEXT NOT NULL DEFAULT 'pending',
+    "attempts"         INTEGER NOT NULL DEFAULT 0,
+    "next_attempt_at"  TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    "locked_at"        TIMESTAMPTZ,
+    "last_error"       TEXT,
+    "created_at"       TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    "sent_at"          TIMESTAMPTZ
+);
+CREATE INDEX IF NOT EXISTS "idx_emailoutbox_a_envoyer"
+    ON "EmailOutbox" ("next_attempt_at", "id") WHERE "status" IN ('pending', 'sending');
+
+-- Éléments en attente des résumés de notifications (notification_service.py)
+CREATE TABLE IF NOT EXISTS "NotificationDigest" (
+    "username"     TEXT NOT NULL,
+    "kind"         TEXT NOT NULL,
+    "item_key"     TEXT NOT NULL,
+    "payload"      JSONB NOT NULL,
+    "occurrences"  INTEGER NOT NULL DEFAULT 1,
+    "created_at"   TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    "updated_at"   TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY ("username", "kind", "item_key")
+);
+
 -- ============================================================
 -- GROUPES DE PIÈCES (entretiens)
 -- ============================================================
@@ -0,0 +1,230 @@
+"""
+File d'envoi des emails : les routes insèrent dans "EmailOutbox" (aucun appel SMTP
+pendant la requête), un seul worker par processus envoie par lots sur une connexion
+SMTP réutilisée, avec nouvelles tentatives espacées et suivi du statut.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Iterable, List, Optional, Sequence, Tuple
+
+import asyncpg
+
+from utils.mail_backends import get_mail_backend
+from utils.settings import get_app_settings
+
+logger = logging.getLogger("Inventaire-Robot")
+
+# Statuts d'un message
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+# Un message resté "sending" plus longtemps (processus arrêté pendant l'envoi) est repris
+SENDING_TIMEOUT_SECONDS = 600
+
+# Plafond du délai entre deux tentatives
+MAX_RETRY_DELAY_SECONDS = 6 * 3600
+
+# Intervalle entre deux purges des messages envoyés
+PURGE_INTERVAL_SECONDS = 3600
+
+# Worker du processus, réveillé par enqueue_emails()
+_worker: Optional["EmailOutboxWorker"] = None
+
+
+async def enqueue_emails(conn: asyncpg.Connection, messages: Iterable[Tuple[str, str, str]]) -> int:
+    """
+    Ajoute des (destinataire, sujet, corps HTML) à la file. Écrit dans la transaction
+    en cours s'il y en a une : un rollback annule aussi les emails.
+    Retourne le nombre de messages ajoutés.
+    """
+    rows = [(to, subject, body_html) for to, subject, body_html in messages if to]
+    if not rows:
+        return 0
+    await conn.executemany(
+        'INSERT INTO "EmailOutbox" ("recipient", "subject", "body_html") VALUES ($1, $2, $3)',
+        rows
+    )
+    if _worker is not None:
+        _worker.wake()
+    return len(rows)
+
+
+async def enqueue_email(conn: asyncpg.Connection, to: str, subject: str, body_html: str) -> bool:
+    return await enqueue_emails(conn, [(to, subject, body_html)]) == 1
+
+
+def retry_delay(attempts: int, base: float) -> float:
+    """Délai avant la tentative suivante : base, 2×base, 4×base... plafonné"""
+    return min(base * (2 ** max(attempts - 1, 0)), MAX_RETRY_DELAY_SECONDS)
+
+
+class EmailOutboxWorker:
+    """
+    Tâche de fond démarrée par database.lifespan.
+
+    Chaque lot est réservé avec FOR UPDATE SKIP LOCKED (plusieurs processus peuvent
+    tourner sans envoyer deux fois le même message), puis envoyé par le moteur
+    choisi dans AppSettings (utils.mail_backends), sur une seule connexion SMTP.
+    jobs : coroutines (conn) exécutées avant chaque lot, p. ex. la génération
+    des résumés de notifications qui alimentent la file.
+    """
+
+    def __init__(
+            self,
+            pool,
+            batch_size: int = 50,
+            poll_interval: float = 10,
+            max_attempts: int = 5,
+            retry_base: float = 60,
+            retention_days: int = 30,
+            jobs: Sequence[Callable[[asyncpg.Connection], Awaitable[object]]] = (),
+    ):
+        self.pool = pool
+        self.batch_size = max(batch_size, 1)
+        self.poll_interval = poll_interval
+        self.max_attempts = max(max_attempts, 1)
+        self.retry_base = retry_base
+        self.retention_days = retention_days
+        self.jobs = list(jobs)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._last_purge = 0.0
+
+    def start(self):
+        global _worker
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="email-outbox")
+            _worker = self
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def stop(self, timeout: float = 30):
+        """Termine le lot en cours (au plus timeout secondes) puis arrête le worker"""
+        global _worker
+        if _worker is self:
+            _worker = None
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ Worker email arrêté pendant un envoi — les messages seront repris au redémarrage")
+        except Exception:
+            logger.exception("❌ Arrêt du worker email")
+        self._task = None
+
+    async def _run(self):
+        while not self._stopping:
+            full_batch = False
+            try:
+                await self._run_jobs()
+                full_batch = await self.process_batch() >= self.batch_size
+                await self._purge_if_due()
+            except Exception as e:
+                logger.exception("❌ Erreur worker email: %s", e)
+            if full_batch or self._stopping:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _run_jobs(self):
+        if not self.jobs:
+            return
+        async with self.pool.acquire() as conn:
+            for job in self.jobs:
+                try:
+                    await job(conn)
+                except Exception as e:
+                    logger.exception("❌ Tâche de la file email %s: %s", getattr(job, "__name__", job), e)
+
+    async def process_batch(self) -> int:
+        """Réserve, envoie et met à jour un lot. Retourne le nombre de messages traités."""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch('''
+                UPDATE "EmailOutbox" o
+                SET "status" = $3, "locked_at" = NOW(), "attempts" = o."attempts" + 1
+                FROM (
+                    SELECT "id" FROM "EmailOutbox"
+                    WHERE ("status" = $4 AND "next_attempt_at" <= NOW())
+                       OR ("status" = $3 AND "locked_at" < NOW() - make_interval(secs => $2))
+                    ORDER BY "next_attempt_at", "id"
+                    LIMIT $1
+                    FOR UPDATE SKIP LOCKED
+                ) lot
+                WHERE o."id" = lot."id"
+                RETURNING o."id", o."recipient", o."subject", o."body_html", o."attempts"
+            ''', self.batch_size, float(SENDING_TIMEOUT_SECONDS), SENDING, PENDING)
+            if not rows:
+                return 0
+            backend = get_mail_backend(await get_app_settings(conn))
+
+        rows = sorted(rows, key=lambda r: r["id"])
+        messages = [(r["recipient"], r["subject"], r["body_html"]) for r in rows]
+        results = await backend.send_batch(messages)
+
+        sent_ids: List[int] = []
+        retries = []
+        for row, (ok, error, permanent) in zip(rows, results):
+            if ok:
+                sent_ids.append(row["id"])
+                continue
+            if permanent or row["attempts"] >= self.max_attempts:
+                status, delay = FAILED, 0.0
+                logger.error("❌ Email abandonné → %s après %s tentative(s): %s", row["recipient"], row["attempts"], error)
+            else:
+                status, delay = PENDING, retry_delay(row["attempts"], self.retry_base)
+            retries.append((row["id"], status, delay, (error or "")[:1000]))
+
+        async with self.pool.acquire() as conn:
+            if sent_ids:
+                await conn.execute('''
+                    UPDATE "EmailOutbox"
+                    SET "status" = $2, "sent_at" = NOW(), "locked_at" = NULL, "last_error" = NULL
+                    WHERE "id" = ANY($1::bigint[])
+                ''', sent_ids, SENT)
+            if retries:
+                await conn.executemany('''
+                    UPDATE "EmailOutbox"
+                    SET "status" = $2, "next_attempt_at" = NOW() + make_interval(secs => $3),
+                        "locked_at" = NULL, "last_error" = $4
+                    WHERE "id" = $1
+                ''', retries)
+
+        logger.info("📧 File email (%s) : %s envoyé(s), %s en échec sur %s", backend.name, len(sent_ids), len(retries), len(rows))
+        return len(rows)
+
+    async def _purge_if_due(self):
+        if not self.retention_days or time.monotonic() - self._last_purge < PURGE_INTERVAL_SECONDS:
+            return
+        self._last_purge = time.monotonic()
+        async with self.pool.acquire() as conn:
+            await conn.execute('''
+                DELETE FROM "EmailOutbox"
+                WHERE "status" = $1 AND "sent_at" < NOW() - make_interval(days => $2)
+            ''', SENT, self.retention_days)
+
+
+async def outbox_status(conn: asyncpg.Connection, limit: int = 20) -> dict:
+    """Nombre de messages par statut et derniers échecs"""
+    counts = await conn.fetch('SELECT "status", COUNT(*) AS n FROM "EmailOutbox" GROUP BY "status"')
+    failures = await conn.fetch('''
+        SELECT "id", "recipient", "subject", "status", "attempts", "last_error", "next_attempt_at", "created_at"
+        FROM "EmailOutbox"
+        WHERE "last_error" IS NOT NULL
+        ORDER BY "id" DESC
+        LIMIT $1
+    ''', limit)
+    return {
+        "counts": {r["status"]: r["n"] for r in counts},
+        "recent_errors": [dict(r) for r in failures],
+    }
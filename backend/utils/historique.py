@@ -1,6 +1,9 @@
 """Utilitaire centralisé pour logger les mouvements d'inventaire dans l'historique"""
+import logging
 from datetime import datetime
 
+logger = logging.getLogger("Inventaire-Robot")
+
 
 async def log_mouvement(
     conn,
@@ -17,7 +20,7 @@ async def log_mouvement(
 ) -> None:
     """
     Insère un enregistrement dans l'historique de manière silencieuse.
-    Ne lève jamais d'exception — les erreurs sont loggées en console uniquement.
+    Ne lève jamais d'exception — les erreurs sont seulement journalisées.
 
     Règles DateCMD / DateRecu :
       - "Commande"              → DateCMD = now,  DateRecu = None
@@ -48,10 +51,10 @@ async def log_mouvement(
             qty_cmd,
             qty_sortie,
             nom_piece or "",
-            float(piece_id),
+            int(piece_id),
             user or "Système",
             delai,
         )
-        print(f"📋 Historique [{operation}] pièce={piece_id} qty_cmd={qty_cmd} qty_sortie={qty_sortie} user={user}")
+        logger.debug("📋 Historique [%s] pièce=%s qty_cmd=%s qty_sortie=%s user=%s", operation, piece_id, qty_cmd, qty_sortie, user)
     except Exception as e:
-        print(f"⚠️  log_mouvement FAILED [{operation}] pièce={piece_id}: {e}")
+        logger.warning("⚠️  log_mouvement FAILED [%s] pièce=%s: %s", operation, piece_id, e)
@@ -0,0 +1,71 @@
+"""Création idempotente des index utilisés par les listes paginées"""
+import asyncpg
+
+
+async def ensure_pieces_indexes(conn: asyncpg.Connection):
+    # Index des clés de tri keyset de GET /pieces (expression identique à PIECE_SORT_KEYS)
+    await conn.execute('''
+        CREATE INDEX IF NOT EXISTS "idx_piece_nom_ref"
+        ON "Pièce" ((COALESCE("NomPièce", '')), "RéfPièce")
+    ''')
+    await conn.execute('''
+        CREATE INDEX IF NOT EXISTS "idx_piece_num_ref"
+        ON "Pièce" ((COALESCE("NumPièce", '')), "RéfPièce")
+    ''')
+    await conn.execute('''
+        CREATE INDEX IF NOT EXISTS "idx_piece_lieu_ref"
+        ON "Pièce" ((COALESCE("Lieuentreposage", '')), "RéfPièce")
+    ''')
+    # Filtres fréquents de la grille d'inventaire
+    await conn.execute('''
+        CREATE INDEX IF NOT EXISTS "idx_piece_departement"
+        ON "Pièce" ("RefDepartement")
+    ''')
+    await conn.execute('''
+        CREATE INDEX IF NOT EXISTS "idx_piecefournisseur_principal"
+        ON "PieceFournisseur" ("RéfPièce") WHERE "EstPrincipal" = TRUE
+    ''')
+
+
+async def ensure_historique_indexes(conn: asyncpg.Connection):
+    # Tri et filtre par dates de GET /historique (expression identique à HISTORIQUE_DATE_SQL)
+    await conn.execute('''
+        CREATE INDEX IF NOT EXISTS "idx_historique_date_id"
+        ON "historique" ((COALESCE("DateRecu", "DateCMD", '-infinity'::timestamp)) DESC, "id" DESC)
+    ''')
+    # Historique d'une pièce, déjà trié
+    await conn.execute('''
+        CREATE INDEX IF NOT EXISTS "idx_historique_piece_date"
+        ON "historique" ("RéfPièce", (COALESCE("DateRecu", "DateCMD", '-infinity'::timestamp)) DESC, "id" DESC)
+    ''')
+    # Dernière commande non reçue d'une pièce (réception dans routes/commandes.py)
+    await conn.execute('''
+        CREATE INDEX IF NOT EXISTS "idx_historique_commande_ouverte"
+        ON "historique" ("RéfPièce", (COALESCE("DateCMD", '1970-01-01')) DESC)
+        WHERE "DateRecu" IS NULL AND "Opération" IN ('Commande', 'Achat')
+    ''')
+
+
+async def ensure_fournisseurs_indexes(conn: asyncpg.Connection):
+    # Tri keyset de GET /fournisseurs
+    await conn.execute('''
+        CREATE INDEX IF NOT EXISTS "idx_fournisseurs_nom_ref"
+        ON "Fournisseurs" ("NomFournisseur", "RéfFournisseur")
+    ''')
+    # Sous-requêtes par fournisseur : contacts et nombre de pièces
+    await conn.execute('''
+        CREATE INDEX IF NOT EXISTS "idx_contact_fournisseur"
+        ON "Contact" ("RéfFournisseur")
+    ''')
+    await conn.execute('''
+        CREATE INDEX IF NOT EXISTS "idx_piecefournisseur_fournisseur"
+        ON "PieceFournisseur" ("RéfFournisseur")
+    ''')
+
+
+async def ensure_soumissions_indexes(conn: asyncpg.Connection):
+    # Meilleur prix reçu et nombre de prix d'une pièce (POST /soumissions/pieces/dernieres)
+    await conn.execute('''
+        CREATE INDEX IF NOT EXISTS "idx_soumissionprix_piece_prix"
+        ON "SoumissionPrix" ("RéfPièce", "PrixUnitaire", "DateSaisie" DESC)
+    ''')
@@ -0,0 +1,175 @@
+"""
+Journalisation structurée : les appels logging ne font qu'empiler l'enregistrement
+(QueueHandler), l'écriture disque/console se fait dans le thread d'un QueueListener.
+Fichier en lignes JSON avec rotation, console lisible, identifiant de requête HTTP.
+
+Avec plusieurs workers, seul le processus superviseur écrit le fichier (une rotation
+par plusieurs processus corromprait le journal) : les workers lui envoient leurs
+enregistrements en JSON sur une socket locale (start_log_receiver / socket_port).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import socketserver
+import struct
+import sys
+import threading
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+# Identifiant de la requête HTTP en cours (posé par le middleware de InvRobot.py)
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+# Attributs standards d'un LogRecord : tout le reste vient de extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+
+class RequestIdFilter(logging.Filter):
+    """Copie l'identifiant de requête dans l'enregistrement (dans le thread appelant)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par enregistrement, champs extra={...} inclus"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "pid": record.process,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Prépare l'enregistrement pour un autre thread sans le mettre en forme :
+    message résolu, trace d'exception convertie en texte (exc_text), extra conservés.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _TRACEBACK_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class _JsonSocketHandler(logging.handlers.SocketHandler):
+    """Envoie chaque enregistrement au superviseur : longueur (4 octets) + JSON, jamais de pickle"""
+
+    def makePickle(self, record: logging.LogRecord) -> bytes:
+        data = json.dumps(vars(record), ensure_ascii=False, default=str).encode("utf-8")
+        return struct.pack(">L", len(data)) + data
+
+
+class _LogRecordStreamHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            header = self.rfile.read(4)
+            if len(header) < 4:
+                return
+            data = self.rfile.read(struct.unpack(">L", header)[0])
+            try:
+                record = logging.makeLogRecord(json.loads(data.decode("utf-8")))
+            except ValueError:
+                continue
+            logging.getLogger(record.name).handle(record)
+
+
+class _LogReceiver(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+_TRACEBACK_FORMATTER = logging.Formatter()
+_listener: Optional[logging.handlers.QueueListener] = None
+_receiver: Optional[_LogReceiver] = None
+
+
+def start_log_receiver() -> int:
+    """
+    Superviseur multi-workers : reçoit les journaux des workers sur 127.0.0.1 et les
+    écrit avec ses propres handlers. Retourne le port (à transmettre aux workers).
+    """
+    global _receiver
+    if _receiver is None:
+        _receiver = _LogReceiver(("127.0.0.1", 0), _LogRecordStreamHandler)
+        threading.Thread(target=_receiver.serve_forever, name="log-receiver", daemon=True).start()
+    return _receiver.server_address[1]
+
+
+def setup_logging(
+        level: str = "INFO",
+        log_file: Optional[str] = None,
+        max_bytes: int = 10 * 1024 * 1024,
+        backup_count: int = 5,
+        console: bool = True,
+        socket_port: int = 0,
+) -> logging.handlers.QueueListener:
+    """
+    Configure le logger racine : QueueHandler seul côté application, fichier JSON
+    (RotatingFileHandler) et console texte côté QueueListener. Idempotent.
+    socket_port : worker d'un déploiement multi-processus, tout part au superviseur.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    handlers = []
+    if socket_port:
+        handlers.append(_JsonSocketHandler("127.0.0.1", socket_port))
+    elif log_file:
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+        )
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+    if console and not socket_port and sys.stderr is not None:
+        console_handler = logging.StreamHandler(sys.stderr)
+        console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Vide la file avant la sortie du processus
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
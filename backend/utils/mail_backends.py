@@ -0,0 +1,197 @@
+"""
+Moteurs d'envoi des emails, choisis par le paramètre "email_backend" de AppSettings :
+
+- aiosmtp : client SMTP asyncio (aiosmtplib), sans thread
+- thread  : smtplib dans un exécuteur dédié (pas le pool par défaut de to_thread)
+- auto    : aiosmtp si aiosmtplib est installé, sinon thread
+- file    : fichiers .eml écrits dans EMAIL_FILE_DIR (développement, tests)
+- null    : messages acceptés puis ignorés
+
+Le nombre de connexions SMTP simultanées du processus est borné par SMTP_CONCURRENCY.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from config import EMAIL_FILE_DIR, SMTP_CONCURRENCY
+from email_service import build_message, resolve_smtp_config, send_batch
+
+try:
+    import aiosmtplib
+except ImportError:  # dépendance optionnelle : repli sur smtplib dans un thread
+    aiosmtplib = None
+
+logger = logging.getLogger("Inventaire-Robot")
+
+BACKENDS = ("auto", "aiosmtp", "thread", "file", "null")
+
+# (envoyé, erreur, permanente) pour chaque message, comme email_service.send_batch
+Result = Tuple[bool, Optional[str], bool]
+Message = Tuple[str, str, str]
+
+_executor = ThreadPoolExecutor(max_workers=max(SMTP_CONCURRENCY, 1), thread_name_prefix="smtp")
+_semaphore = asyncio.Semaphore(max(SMTP_CONCURRENCY, 1))
+
+
+def smtp_config_from_settings(settings: Optional[dict]) -> dict:
+    """Serveur SMTP de AppSettings s'il est renseigné, sinon variables d'environnement"""
+    if not settings or not settings.get("email_host"):
+        return resolve_smtp_config(None)
+    return resolve_smtp_config({
+        "host": settings.get("email_host"),
+        "port": settings.get("email_port"),
+        "from": settings.get("email_from") or None,
+        "user": settings.get("email_user") or None,
+        "password": settings.get("email_password") or None,
+        "tls": bool(settings.get("email_tls", True)),
+        "ssl": bool(settings.get("email_ssl", False)),
+    })
+
+
+class NullBackend:
+    name = "null"
+
+    async def send_batch(self, messages: List[Message]) -> List[Result]:
+        for to, subject, _ in messages:
+            logger.debug("📭 Email ignoré (backend null) → %s — %s", to, subject)
+        return [(True, None, False)] * len(messages)
+
+
+class FileBackend:
+    """Un fichier .eml par message, lisible par n'importe quel client mail"""
+    name = "file"
+
+    def __init__(self, config: dict, directory: Path):
+        self.config = config
+        self.directory = Path(directory)
+
+    def _write(self, messages: List[Message]) -> List[Result]:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        results = []
+        for to, subject, body_html in messages:
+            try:
+                msg = build_message(self.config["from"], to, subject, body_html)
+                path = self.directory / f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.eml"
+                path.write_bytes(msg.as_bytes())
+                results.append((True, None, False))
+            except OSError as e:
+                results.append((False, f"{type(e).__name__}: {e}", False))
+        return results
+
+    async def send_batch(self, messages: List[Message]) -> List[Result]:
+        return await asyncio.get_running_loop().run_in_executor(_executor, self._write, messages)
+
+
+class ThreadSmtpBackend:
+    """smtplib (email_service.send_batch) dans l'exécuteur dédié du module"""
+    name = "thread"
+
+    def __init__(self, config: dict):
+        self.config = config
+
+    async def send_batch(self, messages: List[Message]) -> List[Result]:
+        async with _semaphore:
+            return await asyncio.get_running_loop().run_in_executor(_executor, send_batch, messages, self.config)
+
+
+class AioSmtpBackend:
+    """Client aiosmtplib : une connexion par lot, dans la boucle asyncio"""
+    name = "aiosmtp"
+
+    def __init__(self, config: dict):
+        self.config = config
+
+    async def send_batch(self, messages: List[Message]) -> List[Result]:
+        cfg = self.config
+        if not cfg["host"] or not cfg["port"]:
+            return [(False, "Configuration SMTP incomplète", False)] * len(messages)
+
+        results: List[Result] = []
+        async with _semaphore:
+            smtp = aiosmtplib.SMTP(
+                hostname=cfg["host"], port=int(cfg["port"]), timeout=15,
+                use_tls=bool(cfg["ssl"]), start_tls=False,
+            )
+            try:
+                await smtp.connect()
+                if cfg["tls"] and not cfg["ssl"]:
+                    await smtp.starttls()
+                if cfg["user"]:
+                    await smtp.login(cfg["user"], cfg["password"])
+                for to, subject, body_html in messages:
+                    msg = build_message(cfg["from"], to, subject, body_html)
+                    try:
+                        await smtp.sendmail(cfg["from"], [to], msg.as_string())
+                        results.append((True, None, False))
+                    except aiosmtplib.SMTPResponseException as e:
+                        # Refus propre à ce message (4xx : réessayer plus tard, 5xx : abandon)
+                        results.append((False, f"{type(e).__name__}: {e}", 500 <= e.code < 600))
+                        await smtp.rset()
+                    except aiosmtplib.SMTPRecipientsRefused as e:
+                        results.append((False, f"{type(e).__name__}: {e}", True))
+                        await smtp.rset()
+            except Exception as e:
+                # Connexion perdue ou impossible : le reste du lot sera retenté
+                error = f"{type(e).__name__}: {e}"
+                logger.error("❌ Envoi SMTP interrompu (%s:%s): %s", cfg["host"], cfg["port"], error)
+                results.extend([(False, error, False)] * (len(messages) - len(results)))
+            finally:
+                if smtp.is_connected:
+                    try:
+                        await smtp.quit()
+                    except Exception:
+                        smtp.close()
+        return results
+
+
+_backends: Dict[tuple, object] = {}
+
+
+def get_mail_backend(settings: Optional[dict] = None):
+    """
+    Moteur correspondant aux paramètres (AppSettings) ; réutilisé tant que la
+    configuration ne change pas.
+    """
+    settings = settings or {}
+    name = (settings.get("email_backend") or "auto").lower()
+    if name not in BACKENDS:
+        logger.warning("⚠️ email_backend inconnu '%s' — repli sur auto", name)
+        name = "auto"
+    if name == "auto":
+        name = "aiosmtp" if aiosmtplib is not None else "thread"
+    elif name == "aiosmtp" and aiosmtplib is None:
+        logger.warning("⚠️ aiosmtplib non installé — envoi SMTP par thread")
+        name = "thread"
+
+    config = smtp_config_from_settings(settings)
+    key = (name, *sorted(config.items()))
+    backend = _backends.get(key)
+    if backend is None:
+        if name == "null":
+            backend = NullBackend()
+        elif name == "file":
+            backend = FileBackend(config, EMAIL_FILE_DIR)
+        elif name == "aiosmtp":
+            backend = AioSmtpBackend(config)
+        else:
+            backend = ThreadSmtpBackend(config)
+        _backends.clear()
+        _backends[key] = backend
+    return backend
+
+
+async def send_now(settings: Optional[dict], to: str, subject: str, body_html: str) -> bool:
+    """Envoi immédiat d'un message (email de test) sans bloquer la boucle asyncio"""
+    if not to:
+        return False
+    backend = get_mail_backend(settings)
+    ok, error, _ = (await backend.send_batch([(to, subject, body_html)]))[0]
+    if ok:
+        logger.info("✅ Email envoyé à %s — %s (%s)", to, subject, backend.name)
+    else:
+        logger.error("❌ Erreur envoi email à %s: %s", to, error)
+    return ok
@@ -0,0 +1,218 @@
+"""Métriques internes (pool de connexions) exposées au format texte Prometheus"""
+import logging
+import time
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger("Inventaire-Robot")
+
+# Bornes (secondes) des histogrammes de durée
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Libellé des connexions prises hors d'une route (démarrage, tâches de fond)
+NO_ROUTE = "-"
+
+
+def route_label(scope, default: str = NO_ROUTE) -> str:
+    """Gabarit de la route FastAPI ayant traité la requête (ex. /api/pieces/{piece_id})"""
+    return getattr(scope.get("route"), "path", None) or default
+
+
+class Histogram:
+    """Histogramme cumulatif à bornes fixes (type histogram de Prometheus)"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def lines(self, name: str, labels: Optional[Dict[str, str]] = None) -> List[str]:
+        labels = labels or {}
+        out = [
+            f'{name}_bucket{format_labels({**labels, "le": _format_value(bound)})} {count}'
+            for bound, count in zip(self.buckets, self.counts)
+        ]
+        out.append(f'{name}_bucket{format_labels({**labels, "le": "+Inf"})} {self.count}')
+        out.append(f'{name}_sum{format_labels(labels)} {_format_value(self.sum)}')
+        out.append(f'{name}_count{format_labels(labels)} {self.count}')
+        return out
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def metric_header(name: str, kind: str, help_text: str) -> List[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+
+class PoolMetrics:
+    """
+    Attente de connexion, durée de réservation par route, connexions en cours
+    d'utilisation et requêtes en file d'attente du pool.
+    """
+
+    def __init__(self, hold_warning: float):
+        self.hold_warning = hold_warning
+        self.acquire_wait = Histogram()
+        self.hold: Dict[str, Histogram] = {}
+        self.hold_warnings: Dict[str, int] = {}
+        self.acquire_errors = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.max_waiting = 0
+
+    def acquire_started(self):
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+
+    def acquire_finished(self, wait: float, ok: bool):
+        self.waiting -= 1
+        if ok:
+            self.in_use += 1
+            self.acquire_wait.observe(wait)
+        else:
+            self.acquire_errors += 1
+
+    def released(self, route: str, held: float):
+        self.in_use -= 1
+        histogram = self.hold.get(route)
+        if histogram is None:
+            histogram = self.hold[route] = Histogram()
+        histogram.observe(held)
+        if self.hold_warning and held > self.hold_warning:
+            self.hold_warnings[route] = self.hold_warnings.get(route, 0) + 1
+            logger.warning("⚠️ Connexion DB gardée %.2fs (seuil %.2fs) par %s", held, self.hold_warning, route)
+
+    def prometheus_lines(self, pool=None) -> List[str]:
+        lines = []
+        if pool is not None:
+            for name, help_text, value in (
+                ("inv_db_pool_size", "Connexions ouvertes dans le pool", pool.get_size()),
+                ("inv_db_pool_idle", "Connexions ouvertes inutilisées", pool.get_idle_size()),
+                ("inv_db_pool_max_size", "Taille maximale du pool", pool.get_max_size()),
+            ):
+                lines += metric_header(name, "gauge", help_text)
+                lines.append(f"{name} {value}")
+
+        lines += metric_header("inv_db_pool_in_use", "gauge", "Connexions réservées par l'application")
+        lines.append(f"inv_db_pool_in_use {self.in_use}")
+        lines += metric_header("inv_db_pool_waiting", "gauge", "Demandes de connexion en attente")
+        lines.append(f"inv_db_pool_waiting {self.waiting}")
+        lines += metric_header("inv_db_pool_waiting_max", "gauge", "Plus longue file d'attente observée")
+        lines.append(f"inv_db_pool_waiting_max {self.max_waiting}")
+        lines += metric_header("inv_db_pool_acquire_errors_total", "counter", "Échecs d'obtention de connexion")
+        lines.append(f"inv_db_pool_acquire_errors_total {self.acquire_errors}")
+
+        lines += metric_header("inv_db_pool_acquire_wait_seconds", "histogram", "Attente d'une connexion libre")
+        lines += self.acquire_wait.lines("inv_db_pool_acquire_wait_seconds")
+
+        lines += metric_header("inv_db_connection_hold_seconds", "histogram", "Durée de réservation d'une connexion par route")
+        for route in sorted(self.hold):
+            lines += self.hold[route].lines("inv_db_connection_hold_seconds", {"route": route})
+
+        lines += metric_header("inv_db_connection_hold_warnings_total", "counter", "Connexions gardées au-delà du seuil")
+        for route in sorted(self.hold_warnings):
+            lines.append(f'inv_db_connection_hold_warnings_total{format_labels({"route": route})} {self.hold_warnings[route]}')
+        return lines
+
+
+class _AcquireContext:
+    """Équivalent de pool.acquire() : attendable ou « async with »"""
+
+    def __init__(self, pool: "InstrumentedPool", route: Optional[str], timeout: Optional[float]):
+        self._pool = pool
+        self._route = route
+        self._timeout = timeout
+        self._conn = None
+
+    def __await__(self):
+        return self._pool._acquire(self._route, self._timeout).__await__()
+
+    async def __aenter__(self):
+        self._conn = await self._pool._acquire(self._route, self._timeout)
+        return self._conn
+
+    async def __aexit__(self, exc_type, exc, tb):
+        conn, self._conn = self._conn, None
+        await self._pool.release(conn)
+
+
+class InstrumentedPool:
+    """
+    Enveloppe du pool asyncpg qui mesure chaque réservation de connexion.
+    Même interface que le pool pour le code de l'application (acquire, release,
+    fetch*, execute, close...).
+    """
+
+    def __init__(self, pool, metrics: PoolMetrics):
+        self._pool = pool
+        self.metrics = metrics
+        self._held: Dict[int, tuple] = {}
+
+    def acquire(self, *, route: Optional[str] = None, timeout: Optional[float] = None) -> _AcquireContext:
+        return _AcquireContext(self, route, timeout)
+
+    async def _acquire(self, route: Optional[str], timeout: Optional[float]):
+        self.metrics.acquire_started()
+        start = time.perf_counter()
+        ok = False
+        try:
+            conn = await self._pool.acquire(timeout=timeout)
+            ok = True
+        finally:
+            self.metrics.acquire_finished(time.perf_counter() - start, ok)
+        self._held[id(conn)] = (time.perf_counter(), route or NO_ROUTE)
+        return conn
+
+    async def release(self, conn, *, timeout: Optional[float] = None):
+        held = self._held.pop(id(conn), None)
+        try:
+            await self._pool.release(conn, timeout=timeout)
+        finally:
+            if held is not None:
+                self.metrics.released(held[1], time.perf_counter() - held[0])
+
+    async def execute(self, *args, **kwargs):
+        async with self.acquire() as conn:
+            return await conn.execute(*args, **kwargs)
+
+    async def executemany(self, *args, **kwargs):
+        async with self.acquire() as conn:
+            return await conn.executemany(*args, **kwargs)
+
+    async def fetch(self, *args, **kwargs):
+        async with self.acquire() as conn:
+            return await conn.fetch(*args, **kwargs)
+
+    async def fetchrow(self, *args, **kwargs):
+        async with self.acquire() as conn:
+            return await conn.fetchrow(*args, **kwargs)
+
+    async def fetchval(self, *args, **kwargs):
+        async with self.acquire() as conn:
+            return await conn.fetchval(*args, **kwargs)
+
+    def __getattr__(self, name):
+        # close(), get_size(), get_idle_size(), expire_connections()...
+        return getattr(self._pool, name)
+
+    def prometheus_lines(self) -> List[str]:
+        return self.metrics.prometheus_lines(self._pool)
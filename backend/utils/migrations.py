@@ -0,0 +1,243 @@
+"""Migrations de schéma versionnées, appliquées au démarrage"""
+from typing import Awaitable, Callable, List, Tuple
+
+import asyncpg
+
+from utils.indexes import ensure_historique_indexes
+
+# Verrou consultatif : un seul processus applique les migrations à la fois
+MIGRATIONS_LOCK_ID = 74_201_001
+
+# Taille des lots de remplissage (une transaction par lot)
+BACKFILL_BATCH_SIZE = 5000
+
+
+async def _historique_piece_integer(conn: asyncpg.Connection):
+    """
+    historique."RéfPièce" NUMERIC → INTEGER indexé.
+
+    La nouvelle colonne est remplie par lots (reprise possible après interruption),
+    puis échangée avec l'ancienne sous verrou après rattrapage des lignes insérées
+    entre-temps. Les valeurs non entières ou hors bornes deviennent NULL.
+    """
+    data_type = await conn.fetchval('''
+        SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'historique' AND column_name = 'RéfPièce'
+    ''')
+    if data_type is None or data_type == "integer":
+        return
+
+    await conn.execute('ALTER TABLE "historique" ADD COLUMN IF NOT EXISTS "RéfPièce_int" INTEGER')
+
+    convert = '''CASE
+        WHEN h."RéfPièce" = trunc(h."RéfPièce") AND h."RéfPièce" BETWEEN 1 AND 2147483647
+        THEN h."RéfPièce"::integer
+    END'''
+
+    last_id = 0
+    while True:
+        batch_last_id = await conn.fetchval(f'''
+            WITH lot AS (
+                SELECT "id" FROM "historique" WHERE "id" > $1 ORDER BY "id" LIMIT $2
+            ), maj AS (
+                UPDATE "historique" h SET "RéfPièce_int" = {convert}
+                FROM lot WHERE h."id" = lot."id"
+            )
+            SELECT max("id") FROM lot
+        ''', last_id, BACKFILL_BATCH_SIZE)
+        if batch_last_id is None:
+            break
+        last_id = batch_last_id
+
+    async with conn.transaction():
+        await conn.execute('LOCK TABLE "historique" IN ACCESS EXCLUSIVE MODE')
+        await conn.execute(f'''
+            UPDATE "historique" h SET "RéfPièce_int" = {convert} WHERE h."id" > $1
+        ''', last_id)
+        await conn.execute('ALTER TABLE "historique" DROP COLUMN "RéfPièce"')
+        await conn.execute('ALTER TABLE "historique" RENAME COLUMN "RéfPièce_int" TO "RéfPièce"')
+
+    # Les index sur l'ancienne colonne ont disparu avec elle
+    await ensure_historique_indexes(conn)
+
+
+async def _soumission_pieces(conn: asyncpg.Connection):
+    """
+    Table "SoumissionPiece" : une ligne par pièce de chaque soumission, remplie
+    par create_soumission. Les soumissions existantes sont reprises depuis le JSONB
+    "Pieces" par lots ; les entrées sans RéfPièce entière sont ignorées.
+    """
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS "SoumissionPiece" (
+            "RéfPièce"       INTEGER NOT NULL,
+            "RefSoumission"  INTEGER NOT NULL REFERENCES "Soumissions"("RefSoumission") ON DELETE CASCADE,
+            "DateEnvoi"      TIMESTAMP,
+            "Quantite"       INTEGER DEFAULT 0,
+            PRIMARY KEY ("RéfPièce", "RefSoumission")
+        )
+    ''')
+    await conn.execute('''
+        CREATE INDEX IF NOT EXISTS "idx_soumissionpiece_piece_date"
+        ON "SoumissionPiece" ("RéfPièce", "DateEnvoi" DESC)
+    ''')
+
+    last_id = 0
+    while True:
+        batch_last_id = await conn.fetchval('''
+            WITH lot AS (
+                SELECT "RefSoumission", "DateEnvoi", "Pieces" FROM "Soumissions"
+                WHERE "RefSoumission" > $1 ORDER BY "RefSoumission" LIMIT $2
+            ), ins AS (
+                INSERT INTO "SoumissionPiece" ("RéfPièce", "RefSoumission", "DateEnvoi", "Quantite")
+                SELECT (e ->> 'RéfPièce')::integer, lot."RefSoumission", lot."DateEnvoi",
+                       CASE WHEN e ->> 'Quantite' ~ '^-?[0-9]{1,9}$' THEN (e ->> 'Quantite')::integer ELSE 0 END
+                FROM lot
+                CROSS JOIN LATERAL jsonb_array_elements(
+                    CASE WHEN jsonb_typeof(lot."Pieces") = 'array' THEN lot."Pieces" ELSE '[]'::jsonb END
+                ) AS e
+                WHERE jsonb_typeof(e) = 'object' AND e ->> 'RéfPièce' ~ '^[0-9]{1,9}$'
+                ON CONFLICT DO NOTHING
+            )
+            SELECT max("RefSoumission") FROM lot
+        ''', last_id, BACKFILL_BATCH_SIZE)
+        if batch_last_id is None:
+            break
+        last_id = batch_last_id
+
+
+async def _email_outbox(conn: asyncpg.Connection):
+    """Table "EmailOutbox" : file d'envoi des emails (voir utils.email_outbox)"""
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS "EmailOutbox" (
+            "id"               BIGSERIAL PRIMARY KEY,
+            "recipient"        TEXT NOT NULL,
+            "subject"          TEXT NOT NULL,
+            "body_html"        TEXT NOT NULL,
+            "status"           TEXT NOT NULL DEFAULT 'pending',
+            "attempts"         INTEGER NOT NULL DEFAULT 0,
+            "next_attempt_at"  TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            "locked_at"        TIMESTAMPTZ,
+            "last_error"       TEXT,
+            "created_at"       TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            "sent_at"          TIMESTAMPTZ
+        )
+    ''')
+    await conn.execute('''
+        CREATE INDEX IF NOT EXISTS "idx_emailoutbox_a_envoyer"
+        ON "EmailOutbox" ("next_attempt_at", "id") WHERE "status" IN ('pending', 'sending')
+    ''')
+
+
+async def _notification_digest(conn: asyncpg.Connection):
+    """Table "NotificationDigest" : éléments en attente des résumés de notifications"""
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS "NotificationDigest" (
+            "username"     TEXT NOT NULL,
+            "kind"         TEXT NOT NULL,
+            "item_key"     TEXT NOT NULL,
+            "payload"      JSONB NOT NULL,
+            "occurrences"  INTEGER NOT NULL DEFAULT 1,
+            "created_at"   TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            "updated_at"   TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY ("username", "kind", "item_key")
+        )
+    ''')
+
+
+async def _refresh_tokens(conn: asyncpg.Connection):
+    """users.token_version et table "RefreshTokens" (jetons de rafraîchissement, hachés)"""
+    await conn.execute('ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0')
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS "RefreshTokens" (
+            "id"          BIGSERIAL PRIMARY KEY,
+            "user_id"     UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            "family"      UUID NOT NULL,
+            "token_hash"  TEXT NOT NULL UNIQUE,
+            "expires_at"  TIMESTAMPTZ NOT NULL,
+            "created_at"  TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            "used_at"     TIMESTAMPTZ,
+            "revoked_at"  TIMESTAMPTZ
+        )
+    ''')
+    await conn.execute('CREATE INDEX IF NOT EXISTS "idx_refreshtokens_user" ON "RefreshTokens" ("user_id")')
+    await conn.execute('CREATE INDEX IF NOT EXISTS "idx_refreshtokens_family" ON "RefreshTokens" ("family")')
+
+
+async def _revoked_tokens(conn: asyncpg.Connection):
+    """Table "RevokedTokens" : jetons d'accès révoqués à la déconnexion, jusqu'à leur expiration"""
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS "RevokedTokens" (
+            "jti"         TEXT PRIMARY KEY,
+            "expires_at"  TIMESTAMPTZ NOT NULL
+        )
+    ''')
+    await conn.execute('CREATE INDEX IF NOT EXISTS "idx_revokedtokens_expires" ON "RevokedTokens" ("expires_at")')
+
+
+async def _login_failures(conn: asyncpg.Connection):
+    """Table "LoginFailures" : échecs de connexion par clé, partagés par les workers (utils.rate_limit)"""
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS "LoginFailures" (
+            "key"           TEXT PRIMARY KEY,
+            "window_start"  TIMESTAMPTZ NOT NULL,
+            "count"         INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    await conn.execute('CREATE INDEX IF NOT EXISTS "idx_loginfailures_window" ON "LoginFailures" ("window_start")')
+
+
+async def _historique_piece_sans_fk(conn: asyncpg.Connection):
+    """
+    Retire la clé étrangère historique."RéfPièce" → "Pièce" ajoutée par la migration 1.
+
+    Son ON DELETE SET NULL effaçait le numéro de pièce de l'historique à chaque
+    suppression de pièce, alors que l'historique des pièces supprimées avant la
+    migration le gardait. Comme avant la migration, l'historique garde toujours le
+    numéro de la pièce ; la colonne reste INTEGER et indexée.
+    """
+    await conn.execute('ALTER TABLE "historique" DROP CONSTRAINT IF EXISTS "fk_historique_piece"')
+
+
+# (version, nom, fonction) — ne jamais renuméroter une migration publiée
+MIGRATIONS: List[Tuple[int, str, Callable[[asyncpg.Connection], Awaitable[None]]]] = [
+    (1, "historique_refpiece_integer", _historique_piece_integer),
+    (2, "soumission_pieces", _soumission_pieces),
+    (3, "email_outbox", _email_outbox),
+    (4, "notification_digest", _notification_digest),
+    (5, "refresh_tokens", _refresh_tokens),
+    (6, "revoked_tokens", _revoked_tokens),
+    (7, "login_failures", _login_failures),
+    (8, "historique_piece_sans_fk", _historique_piece_sans_fk),
+]
+
+
+async def run_migrations(conn: asyncpg.Connection) -> List[str]:
+    """
+    Applique, dans l'ordre, les migrations pas encore enregistrées dans "SchemaMigrations".
+    Chaque migration gère ses propres transactions et doit être rejouable sans effet
+    si elle a été interrompue. Retourne les noms des migrations appliquées.
+    """
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS "SchemaMigrations" (
+            "version" INTEGER PRIMARY KEY,
+            "name" TEXT NOT NULL,
+            "applied_at" TIMESTAMPTZ DEFAULT NOW()
+        )
+    ''')
+
+    applied = []
+    await conn.execute('SELECT pg_advisory_lock($1)', MIGRATIONS_LOCK_ID)
+    try:
+        done = {r["version"] for r in await conn.fetch('SELECT "version" FROM "SchemaMigrations"')}
+        for version, name, migration in MIGRATIONS:
+            if version in done:
+                continue
+            await migration(conn)
+            await conn.execute(
+                'INSERT INTO "SchemaMigrations" ("version", "name") VALUES ($1, $2)',
+                version, name
+            )
+            applied.append(name)
+    finally:
+        await conn.execute('SELECT pg_advisory_unlock($1)', MIGRATIONS_LOCK_ID)
+    return applied
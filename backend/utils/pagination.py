@@ -0,0 +1,46 @@
+"""Pagination par curseur (keyset) pour les listes volumineuses"""
+import base64
+import json
+from typing import Any, List, Sequence
+
+from fastapi import HTTPException
+
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+
+INT32_MIN, INT32_MAX = -2**31, 2**31 - 1
+
+
+def encode_cursor(*values: Any) -> str:
+    """
+    Encode les valeurs de la clé de tri de la dernière ligne d'une page
+    en un curseur opaque (base64 url-safe).
+    """
+    raw = json.dumps(list(values), ensure_ascii=False, default=str)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _valid_value(value: Any, expected: type) -> bool:
+    # bool est un int pour isinstance ; les clés entières sont des SERIAL (32 bits)
+    if expected is int:
+        return type(value) is int and INT32_MIN <= value <= INT32_MAX
+    return isinstance(value, expected)
+
+
+def decode_cursor(cursor: str, types: Sequence[type] = (str, int)) -> List[Any]:
+    """
+    Décode un curseur produit par encode_cursor ; types donne le type attendu de
+    chaque valeur. Lève une HTTPException 400 si le curseur est illisible ou altéré.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+    if (
+        not isinstance(values, list)
+        or len(values) != len(types)
+        or not all(_valid_value(value, expected) for value, expected in zip(values, types))
+    ):
+        raise HTTPException(status_code=400, detail="Curseur de pagination invalide")
+    return values
@@ -0,0 +1,110 @@
+"""
+Écoute PostgreSQL LISTEN/NOTIFY sur une connexion dédiée (hors pool), pour garder
+cohérents les caches en mémoire de plusieurs processus.
+
+Les notifications envoyées pendant une coupure sont perdues : à chaque
+(re)connexion, les on_reconnect des canaux sont appelés pour invalider les caches.
+"""
+import asyncio
+import logging
+import uuid
+from typing import Callable, Dict, List, Optional
+
+import asyncpg
+
+logger = logging.getLogger("Inventaire-Robot")
+
+# Identifiant de ce processus, envoyé en payload pour ignorer ses propres notifications
+INSTANCE_ID = uuid.uuid4().hex[:12]
+
+
+async def notify(conn: asyncpg.Connection, channel: str, payload: str = INSTANCE_ID):
+    """NOTIFY transactionnel : délivré aux autres processus au COMMIT seulement"""
+    await conn.execute("SELECT pg_notify($1, $2)", channel, payload)
+
+
+class PgListener:
+    """
+    listener = PgListener(DATABASE_URL)
+    listener.listen("canal", callback, on_reconnect=invalider)
+    await listener.start()
+
+    callback(payload) est appelé dans la boucle asyncio ; il doit être rapide.
+    """
+
+    def __init__(self, dsn: str, check_interval: float = 30, retry_delay: float = 5):
+        self.dsn = dsn
+        self.check_interval = check_interval
+        self.retry_delay = retry_delay
+        self._callbacks: Dict[str, List[Callable[[str], None]]] = {}
+        self._reconnect_hooks: List[Callable[[], None]] = []
+        self._conn: Optional[asyncpg.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closed = asyncio.Event()
+        self.connected = False
+
+    def listen(self, channel: str, callback: Callable[[str], None], on_reconnect: Optional[Callable[[], None]] = None):
+        self._callbacks.setdefault(channel, []).append(callback)
+        if on_reconnect is not None:
+            self._reconnect_hooks.append(on_reconnect)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="pg-listener")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._disconnect()
+
+    def _dispatch(self, connection, pid, channel, payload):
+        for callback in self._callbacks.get(channel, ()):
+            try:
+                callback(payload)
+            except Exception:
+                logger.exception("❌ Notification %s non traitée", channel)
+
+    async def _connect(self):
+        self._closed.clear()
+        self._conn = await asyncpg.connect(self.dsn)
+        self._conn.add_termination_listener(lambda conn: self._closed.set())
+        for channel in self._callbacks:
+            await self._conn.add_listener(channel, self._dispatch)
+        self.connected = True
+        for hook in self._reconnect_hooks:
+            hook()
+
+    async def _disconnect(self):
+        self.connected = False
+        conn, self._conn = self._conn, None
+        if conn is not None and not conn.is_closed():
+            try:
+                await asyncio.wait_for(conn.close(), 5)
+            except Exception:
+                conn.terminate()
+
+    async def _run(self):
+        while True:
+            try:
+                await self._connect()
+                logger.info("✅ Écoute LISTEN/NOTIFY : %s", ", ".join(self._callbacks))
+                while True:
+                    try:
+                        await asyncio.wait_for(self._closed.wait(), self.check_interval)
+                        break
+                    except asyncio.TimeoutError:
+                        # Détecte une connexion à moitié ouverte (réseau coupé sans fermeture)
+                        await asyncio.wait_for(self._conn.execute("SELECT 1"), self.check_interval)
+                logger.warning("⚠️ Connexion LISTEN/NOTIFY fermée — reconnexion")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("⚠️ Écoute LISTEN/NOTIFY indisponible (%s: %s) — nouvel essai dans %ss",
+                               type(e).__name__, e, self.retry_delay)
+            await self._disconnect()
+            await asyncio.sleep(self.retry_delay)
@@ -0,0 +1,80 @@
+"""
+Propagation des modifications de pièces aux autres processus : chaque worker garde
+son index de recherche mémoire et ses compteurs du tableau de bord, mis à jour
+localement par les routes et, pour les écritures des autres workers, par NOTIFY.
+"""
+import asyncio
+import logging
+from typing import Dict, Optional
+
+import asyncpg
+
+from utils.pg_listener import INSTANCE_ID, notify
+from utils.search_index import PieceSearchIndex, sync_piece_search_index, remove_from_piece_search_index
+from utils.stats import sync_piece_stats, remove_piece_stats
+
+logger = logging.getLogger("Inventaire-Robot")
+
+PIECES_CHANNEL = "pieces"
+
+
+async def publish_piece_change(conn: asyncpg.Connection, piece_id: int, deleted: bool = False):
+    """Signale aux autres processus (au COMMIT) qu'une pièce a été modifiée ou supprimée"""
+    await notify(conn, PIECES_CHANNEL, f"{INSTANCE_ID}:{'d' if deleted else 'u'}:{piece_id}")
+
+
+class PieceChangeListener:
+    """
+    Applique les notifications PIECES_CHANNEL des autres processus. Les rafales
+    (import, grosse sortie) sont regroupées : une pièce modifiée plusieurs fois
+    n'est relue qu'une fois, sur une seule connexion du pool.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._pending: Dict[int, bool] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._connected_once = False
+
+    def on_notification(self, payload: str):
+        instance, op, piece_id = payload.split(":", 2)
+        if instance == INSTANCE_ID:
+            return
+        self._pending[int(piece_id)] = op == "d"
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._drain())
+
+    def on_reconnect(self):
+        """Notifications perdues pendant la coupure : caches reconstruits"""
+        if not self._connected_once:
+            self._connected_once = True
+            return
+        self.app.state.inventory_stats = None
+        if getattr(self.app.state, "piece_search_index", None) is not None:
+            asyncio.create_task(self._rebuild_search_index())
+
+    async def _drain(self):
+        app = self.app
+        while self._pending:
+            pending, self._pending = self._pending, {}
+            try:
+                async with app.state.pool.acquire() as conn:
+                    for piece_id, deleted in pending.items():
+                        if deleted:
+                            remove_from_piece_search_index(app, piece_id)
+                            remove_piece_stats(app, piece_id)
+                        else:
+                            await sync_piece_search_index(app, conn, piece_id)
+                            await sync_piece_stats(app, conn, piece_id)
+            except Exception as e:
+                app.state.inventory_stats = None
+                logger.warning("⚠️ Synchronisation des pièces modifiées ailleurs (non bloquant): %s", e)
+
+    async def _rebuild_search_index(self):
+        try:
+            index = PieceSearchIndex()
+            async with self.app.state.pool.acquire() as conn:
+                await index.build(conn)
+            self.app.state.piece_search_index = index
+        except Exception as e:
+            logger.warning("⚠️ Reconstruction de l'index de recherche mémoire (non bloquant): %s", e)
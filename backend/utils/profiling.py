@@ -0,0 +1,105 @@
+"""Profilage par requête HTTP : latence par route, nombre de requêtes SQL et temps DB"""
+import re
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from utils.metrics import Histogram, format_labels, metric_header
+
+# Requêtes SQL gardées par requête HTTP pour le journal des requêtes lentes
+MAX_RECORDED_QUERIES = 50
+
+# Libellé des requêtes qui n'ont correspondu à aucune route (404)
+UNMATCHED_ROUTE = "(aucune route)"
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class RequestProfile:
+    """Requêtes SQL exécutées pendant une requête HTTP (via get_db_connection)"""
+
+    __slots__ = ("start", "db_time", "query_count", "queries")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_time = 0.0
+        self.query_count = 0
+        self.queries: List[Tuple[str, float]] = []
+
+    def record(self, query: str, duration: float):
+        self.db_time += duration
+        self.query_count += 1
+        if len(self.queries) < MAX_RECORDED_QUERIES:
+            self.queries.append((query, duration))
+
+
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+
+
+def record_query(query: str, duration: float):
+    """Ajoute une requête SQL au profil de la requête HTTP en cours (s'il y en a un)"""
+    profile = current_profile.get()
+    if profile is not None:
+        profile.record(query, duration)
+
+
+def compact_sql(query: str, limit: int = 300) -> str:
+    sql = _WHITESPACE.sub(" ", query).strip()
+    return sql if len(sql) <= limit else sql[:limit] + "…"
+
+
+def server_timing(profile: RequestProfile, total: float) -> str:
+    """Valeur de l'en-tête Server-Timing (durées en millisecondes)"""
+    db_ms = profile.db_time * 1000
+    total_ms = total * 1000
+    return (
+        f'db;dur={db_ms:.1f};desc="{profile.query_count} SQL", '
+        f'app;dur={max(total_ms - db_ms, 0.0):.1f}, '
+        f'total;dur={total_ms:.1f}'
+    )
+
+
+class _RouteStats:
+    __slots__ = ("latency", "db_time", "requests", "queries", "slow")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.db_time = Histogram()
+        self.requests = 0
+        self.queries = 0
+        self.slow = 0
+
+
+class RequestMetrics:
+    """Agrégats par (méthode, route) : latence, temps DB, requêtes SQL, requêtes lentes"""
+
+    def __init__(self):
+        self._routes: Dict[Tuple[str, str], _RouteStats] = {}
+
+    def observe(self, method: str, route: str, profile: RequestProfile, total: float, slow: bool):
+        stats = self._routes.get((method, route))
+        if stats is None:
+            stats = self._routes[(method, route)] = _RouteStats()
+        stats.latency.observe(total)
+        stats.db_time.observe(profile.db_time)
+        stats.requests += 1
+        stats.queries += profile.query_count
+        stats.slow += slow
+
+    def prometheus_lines(self) -> List[str]:
+        routes = sorted(self._routes.items())
+        lines = metric_header("inv_http_request_duration_seconds", "histogram", "Durée des requêtes HTTP par route")
+        for (method, route), stats in routes:
+            lines += stats.latency.lines("inv_http_request_duration_seconds", {"method": method, "route": route})
+        lines += metric_header("inv_http_request_db_seconds", "histogram", "Temps passé en base par requête HTTP")
+        for (method, route), stats in routes:
+            lines += stats.db_time.lines("inv_http_request_db_seconds", {"method": method, "route": route})
+        for name, attr, help_text in (
+            ("inv_http_requests_total", "requests", "Requêtes HTTP traitées"),
+            ("inv_http_sql_queries_total", "queries", "Requêtes SQL exécutées par les requêtes HTTP"),
+            ("inv_http_slow_requests_total", "slow", "Requêtes HTTP au-delà du seuil de lenteur"),
+        ):
+            lines += metric_header(name, "counter", help_text)
+            for (method, route), stats in routes:
+                lines.append(f'{name}{format_labels({"method": method, "route": route})} {getattr(stats, attr)}')
+        return lines
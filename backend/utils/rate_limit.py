@@ -0,0 +1,82 @@
+"""
+Limitation des tentatives de connexion, partagée par tous les processus (table "LoginFailures").
+
+Seuls les échecs sont comptés, par nom d'utilisateur et par adresse IP, sur une
+fenêtre fixe ouverte par le premier échec : une clé bloquée est refusée avant
+tout calcul bcrypt. Une connexion réussie remet le compteur de l'utilisateur à zéro.
+"""
+from typing import Optional
+
+# Nombre d'échecs d'une clé, 0 si sa fenêtre est expirée ; secondes restantes de la fenêtre
+_SELECT_FAILURES = '''
+    SELECT "key", "count",
+           EXTRACT(EPOCH FROM ("window_start" + make_interval(secs => $2) - NOW()))::float8 AS "remaining"
+    FROM "LoginFailures"
+    WHERE "key" = ANY($1::text[]) AND "window_start" > NOW() - make_interval(secs => $2)
+'''
+
+_UPSERT_FAILURE = '''
+    INSERT INTO "LoginFailures" ("key", "window_start", "count") VALUES ($1, NOW(), 1)
+    ON CONFLICT ("key") DO UPDATE SET
+        "count" = CASE WHEN "LoginFailures"."window_start" > NOW() - make_interval(secs => $2)
+                       THEN "LoginFailures"."count" + 1 ELSE 1 END,
+        "window_start" = CASE WHEN "LoginFailures"."window_start" > NOW() - make_interval(secs => $2)
+                              THEN "LoginFailures"."window_start" ELSE NOW() END
+'''
+
+
+class LoginRateLimiter:
+    """
+    Limites combinées par utilisateur (bas) et par IP (plus haut : postes partagés).
+    Une limite à 0 désactive la clé correspondante.
+    """
+
+    def __init__(self, max_per_user: int, max_per_ip: int, window: float):
+        self.max_per_user = max_per_user
+        self.max_per_ip = max_per_ip
+        self.window = window
+        # Refus de ce processus (les compteurs eux-mêmes sont en base)
+        self.rejected = 0
+
+    def _keys(self, username: str, ip: Optional[str]) -> dict:
+        """Clé en base → limite"""
+        keys = {}
+        if self.max_per_user > 0:
+            keys["u:" + (username or "").strip().lower()] = self.max_per_user
+        if self.max_per_ip > 0:
+            keys["ip:" + (ip or "-")] = self.max_per_ip
+        return keys
+
+    async def retry_after(self, conn, username: str, ip: Optional[str]) -> float:
+        """Secondes avant une nouvelle tentative autorisée (0 = autorisée)"""
+        keys = self._keys(username, ip)
+        if not keys:
+            return 0.0
+        rows = await conn.fetch(_SELECT_FAILURES, list(keys), float(self.window))
+        retry = max((row["remaining"] for row in rows if row["count"] >= keys[row["key"]]), default=0.0)
+        if retry > 0:
+            self.rejected += 1
+        return max(retry, 0.0)
+
+    async def add_failure(self, conn, username: str, ip: Optional[str]):
+        keys = self._keys(username, ip)
+        if not keys:
+            return
+        await conn.execute(
+            'DELETE FROM "LoginFailures" WHERE "window_start" < NOW() - make_interval(secs => $1)',
+            float(self.window)
+        )
+        for key in keys:
+            await conn.execute(_UPSERT_FAILURE, key, float(self.window))
+
+    async def add_success(self, conn, username: str):
+        if self.max_per_user > 0:
+            await conn.execute('DELETE FROM "LoginFailures" WHERE "key" = $1', "u:" + (username or "").strip().lower())
+
+    def stats(self) -> dict:
+        return {
+            "rejected": self.rejected,
+            "max_per_user": self.max_per_user,
+            "max_per_ip": self.max_per_ip,
+            "window": self.window,
+        }
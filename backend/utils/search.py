@@ -0,0 +1,102 @@
+"""Index de recherche des pièces (plein texte + trigrammes, insensible aux accents)"""
+import re
+import unicodedata
+from typing import Dict
+
+import asyncpg
+
+# Caractères accentués courants en français → équivalent sans accent.
+# La même table est utilisée côté SQL (translate) et côté Python pour que
+# le terme recherché soit normalisé exactement comme l'index.
+_ACCENTS_FROM = "àâäáãåçéèêëíìîïñóòôöõúùûüýÿ"
+_ACCENTS_TO = "aaaaaaceeeeiiiinooooouuuuyy"
+
+# Expression indexée : doit rester identique dans les index et les requêtes
+PIECE_SEARCH_TEXT_SQL = (
+    'inv_piece_search_text(p."NomPièce", p."NumPièce", p."DescriptionPièce", '
+    'p."NumPièceAutreFournisseur", p."Lieuentreposage", p."NoFESTO", p."RTBS")'
+)
+
+_PIECE_SEARCH_TEXT_INDEX_SQL = (
+    'inv_piece_search_text("NomPièce", "NumPièce", "DescriptionPièce", '
+    '"NumPièceAutreFournisseur", "Lieuentreposage", "NoFESTO", "RTBS")'
+)
+
+
+async def ensure_pieces_search_index(conn: asyncpg.Connection) -> Dict[str, bool]:
+    """
+    Crée (de façon idempotente) les fonctions et index de recherche des pièces.
+
+    Retourne les capacités disponibles :
+      - fts  : index plein texte (aucune extension requise)
+      - trgm : index trigrammes (nécessite l'extension pg_trgm)
+    """
+    capabilities = {"fts": False, "trgm": False}
+
+    await conn.execute(f'''
+        CREATE OR REPLACE FUNCTION inv_search_normalize(t text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT translate(lower(coalesce(t, '')), '{_ACCENTS_FROM}', '{_ACCENTS_TO}')
+        $$
+    ''')
+    await conn.execute('''
+        CREATE OR REPLACE FUNCTION inv_piece_search_text(
+            nom text, num text, descr text, num_autre text, lieu text, festo text, rtbs integer
+        ) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT inv_search_normalize(
+                coalesce(nom, '') || ' ' || coalesce(num, '') || ' ' ||
+                coalesce(descr, '') || ' ' || coalesce(num_autre, '') || ' ' ||
+                coalesce(lieu, '') || ' ' || coalesce(festo, '') || ' ' ||
+                coalesce(rtbs::text, '')
+            )
+        $$
+    ''')
+    await conn.execute(f'''
+        CREATE INDEX IF NOT EXISTS "idx_piece_search_fts"
+        ON "Pièce" USING GIN (to_tsvector('simple', {_PIECE_SEARCH_TEXT_INDEX_SQL}))
+    ''')
+    capabilities["fts"] = True
+
+    try:
+        await conn.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        await conn.execute(f'''
+            CREATE INDEX IF NOT EXISTS "idx_piece_search_trgm"
+            ON "Pièce" USING GIN ({_PIECE_SEARCH_TEXT_INDEX_SQL} gin_trgm_ops)
+        ''')
+        capabilities["trgm"] = True
+    except asyncpg.PostgresError:
+        # Extension non installable (droits insuffisants) : recherche plein texte seulement
+        pass
+
+    return capabilities
+
+
+async def ensure_fournisseurs_search_index(conn: asyncpg.Connection):
+    """Index plein texte du nom des fournisseurs (après ensure_pieces_search_index)"""
+    await conn.execute('''
+        CREATE INDEX IF NOT EXISTS "idx_fournisseurs_search_fts"
+        ON "Fournisseurs" USING GIN (to_tsvector('simple', inv_search_normalize("NomFournisseur")))
+    ''')
+
+
+def normalize_search_term(term: str) -> str:
+    """Normalise un terme comme inv_search_normalize (minuscules, sans accents)"""
+    term = (term or "").lower().translate(str.maketrans(_ACCENTS_FROM, _ACCENTS_TO))
+    # Accents hors de la table française : décomposition Unicode
+    return "".join(c for c in unicodedata.normalize("NFKD", term) if not unicodedata.combining(c))
+
+
+def search_tokens(term: str) -> list:
+    """Découpe un terme normalisé en jetons alphanumériques"""
+    return re.findall(r"[0-9a-z]+", normalize_search_term(term))
+
+
+def build_prefix_tsquery(term: str) -> str:
+    """Construit une tsquery 'simple' où chaque jeton est recherché par préfixe"""
+    return " & ".join(f"{token}:*" for token in search_tokens(term))
+
+
+def escape_like(term: str) -> str:
+    """Échappe les caractères spéciaux de LIKE"""
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
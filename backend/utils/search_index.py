@@ -0,0 +1,164 @@
+"""Index inversé en mémoire des pièces (repli quand pg_trgm n'est pas disponible)"""
+import bisect
+import heapq
+import logging
+from typing import Dict, Iterable, List, Optional, Set
+
+import asyncpg
+
+from utils.search import search_tokens
+
+logger = logging.getLogger("Inventaire-Robot")
+
+# Colonnes tokenisées (les mêmes que le filtre search de GET /pieces)
+_INDEXED_COLUMNS = (
+    "NomPièce", "NumPièce", "DescriptionPièce", "NumPièceAutreFournisseur", "NoFESTO", "Lieuentreposage", "RTBS",
+)
+
+_SELECT_INDEXED = '''
+    SELECT "RéfPièce", "NomPièce", "NumPièce", "DescriptionPièce", "NumPièceAutreFournisseur",
+           "NoFESTO", "Lieuentreposage", "RTBS"
+    FROM "Pièce"
+'''
+
+
+class PieceSearchIndex:
+    """
+    Index inversé jeton → RéfPièce, avec recherche par préfixe (classée) ou par
+    sous-chaîne de jeton (filtre de la grille : "123" trouve "PN-00123").
+
+    Toutes les opérations sont synchrones et s'exécutent sur la boucle asyncio :
+    aucun verrou n'est nécessaire tant que l'index n'est pas partagé entre processus.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Set[int]] = {}
+        self._doc_tokens: Dict[int, Set[str]] = {}
+        self._doc_names: Dict[int, Set[str]] = {}
+        self._sorted_tokens: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._doc_tokens)
+
+    # ── Construction / mises à jour ────────────────────────────
+
+    async def build(self, conn: asyncpg.Connection):
+        """(Re)construit l'index complet depuis la base"""
+        self.__init__()
+        rows = await conn.fetch(_SELECT_INDEXED)
+        for row in rows:
+            self.upsert(dict(row))
+
+    async def refresh(self, conn: asyncpg.Connection, piece_id: int):
+        """Relit une pièce depuis la base et met à jour son entrée (ou la retire)"""
+        row = await conn.fetchrow(_SELECT_INDEXED + ' WHERE "RéfPièce" = $1', piece_id)
+        if row:
+            self.upsert(dict(row))
+        else:
+            self.remove(piece_id)
+
+    def upsert(self, row: dict):
+        """Ajoute ou remplace une pièce à partir d'une ligne de "Pièce" """
+        piece_id = row["RéfPièce"]
+        if not row.get("NomPièce"):
+            self.remove(piece_id)
+            return
+
+        tokens = set()
+        for column in _INDEXED_COLUMNS:
+            value = row.get(column)
+            if value is not None:
+                tokens.update(search_tokens(str(value)))
+
+        old_tokens = self._doc_tokens.get(piece_id, set())
+        for token in old_tokens - tokens:
+            self._discard_posting(token, piece_id)
+        for token in tokens - old_tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                bisect.insort(self._sorted_tokens, token)
+            postings.add(piece_id)
+
+        self._doc_tokens[piece_id] = tokens
+        self._doc_names[piece_id] = set(search_tokens(str(row.get("NomPièce") or "")))
+
+    def remove(self, piece_id: int):
+        """Retire une pièce de l'index"""
+        for token in self._doc_tokens.pop(piece_id, set()):
+            self._discard_posting(token, piece_id)
+        self._doc_names.pop(piece_id, None)
+
+    def _discard_posting(self, token: str, piece_id: int):
+        postings = self._postings.get(token)
+        if postings is None:
+            return
+        postings.discard(piece_id)
+        if not postings:
+            del self._postings[token]
+            i = bisect.bisect_left(self._sorted_tokens, token)
+            if i < len(self._sorted_tokens) and self._sorted_tokens[i] == token:
+                self._sorted_tokens.pop(i)
+
+    # ── Recherche ──────────────────────────────────────────────
+
+    def _prefix_tokens(self, prefix: str) -> Iterable[str]:
+        i = bisect.bisect_left(self._sorted_tokens, prefix)
+        while i < len(self._sorted_tokens) and self._sorted_tokens[i].startswith(prefix):
+            yield self._sorted_tokens[i]
+            i += 1
+
+    def _infix_tokens(self, fragment: str) -> Iterable[str]:
+        # Parcours de tous les jetons distincts : linéaire, mais sans lecture en base
+        return (token for token in self._sorted_tokens if fragment in token)
+
+    def match(self, query: str, infix: bool = False) -> Set[int]:
+        """
+        RéfPièce contenant tous les mots de la requête, sans classement : au début
+        d'un jeton, ou n'importe où dans un jeton si infix (comme l'ancien ILIKE).
+        """
+        expand = self._infix_tokens if infix else self._prefix_tokens
+        # Intersection, par mot, de l'union des listes des jetons correspondants
+        candidates: Optional[Set[int]] = None
+        for qt in sorted(set(search_tokens(query)), key=len, reverse=True):
+            matched: Set[int] = set()
+            for token in expand(qt):
+                matched |= self._postings[token]
+            candidates = matched if candidates is None else candidates & matched
+            if not candidates:
+                return set()
+        return candidates or set()
+
+    def search(self, query: str, limit: int = 20) -> List[int]:
+        """
+        Retourne les RéfPièce correspondant à tous les mots de la requête (préfixe),
+        classées par pertinence : mot exact > préfixe, bonus si le mot est dans le nom.
+        """
+        query_tokens = search_tokens(query)
+        candidates = self.match(query)
+
+        def score(piece_id: int) -> tuple:
+            tokens = self._doc_tokens[piece_id]
+            nom = self._doc_names[piece_id]
+            points = sum((2 if qt in tokens else 1) + (1 if qt in nom else 0) for qt in query_tokens)
+            return points, -piece_id
+
+        return heapq.nlargest(limit, candidates, key=score)
+
+
+async def sync_piece_search_index(app, conn: asyncpg.Connection, piece_id: int):
+    """Met à jour l'index mémoire après une modification de pièce (sans effet s'il est inactif)"""
+    index = getattr(app.state, "piece_search_index", None)
+    if index is None:
+        return
+    try:
+        await index.refresh(conn, piece_id)
+    except Exception as e:
+        logger.warning("⚠️ Mise à jour de l'index de recherche (non bloquant) pièce=%s: %s", piece_id, e)
+
+
+def remove_from_piece_search_index(app, piece_id: int):
+    """Retire une pièce supprimée de l'index mémoire (sans effet s'il est inactif)"""
+    index = getattr(app.state, "piece_search_index", None)
+    if index is not None:
+        index.remove(piece_id)
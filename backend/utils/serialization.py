@@ -0,0 +1,144 @@
+"""Sérialisation JSON rapide des listes volumineuses (orjson si disponible) et diffusion en continu"""
+import json
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from fastapi.responses import Response, StreamingResponse
+
+try:
+    import orjson
+except ImportError:  # dépendance optionnelle : repli sur le module json standard
+    orjson = None
+
+logger = logging.getLogger("Inventaire-Robot")
+
+
+def _default(value: Any):
+    """Types non natifs JSON rencontrés dans les lignes asyncpg"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Type non sérialisable : {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Sérialise en JSON compact UTF-8 (même format que JSONResponse)"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_default
+    ).encode("utf-8")
+
+
+def loads(raw):
+    """Décode une colonne json renvoyée sous forme de texte par asyncpg"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+class FastJSONResponse(Response):
+    """
+    Réponse JSON brute : contourne la validation/sérialisation Pydantic du response_model.
+    Le contenu doit déjà avoir la forme exacte du modèle (colonnes normalisées en SQL).
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def select_columns(field_sql: Dict[str, str], fields: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Liste SELECT « expression AS "champ" » dans l'ordre de field_sql (ordre du modèle),
+    éventuellement restreinte aux champs demandés.
+    """
+    if fields is not None:
+        fields = set(fields)
+    return [
+        f'{expr} AS "{name}"' for name, expr in field_sql.items()
+        if fields is None or name in fields
+    ]
+
+
+def row_to_dict(row, json_fields: Sequence[str] = ()) -> dict:
+    """Convertit une ligne asyncpg en dict en décodant les colonnes json_fields"""
+    item = dict(row)
+    for field in json_fields:
+        raw = item.get(field)
+        if isinstance(raw, (str, bytes)):
+            item[field] = loads(raw)
+    return item
+
+
+def rows_to_dicts(rows: Iterable, json_fields: Sequence[str] = ()) -> List[dict]:
+    """
+    Convertit des lignes asyncpg en dicts, dans l'ordre des colonnes du SELECT.
+    Les colonnes de json_fields (json_agg / json_build_object) sont décodées.
+    """
+    if not json_fields:
+        return [dict(row) for row in rows]
+    return [row_to_dict(row, json_fields) for row in rows]
+
+
+# ── Diffusion en continu (curseur serveur) ────────────────────
+
+STREAM_FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+STREAM_BATCH_SIZE = 500
+
+
+def stream_query(
+        pool,
+        query: str,
+        params: Sequence[Any] = (),
+        json_fields: Sequence[str] = (),
+        fmt: str = "json",
+        headers: Optional[Dict[str, str]] = None,
+        batch_size: int = STREAM_BATCH_SIZE,
+) -> StreamingResponse:
+    """
+    Diffuse le résultat d'une requête sans le charger en mémoire.
+
+    Les lignes sont lues par lots via un curseur serveur (transaction en lecture seule
+    sur une connexion dédiée du pool, libérée à la fin du flux ou à la déconnexion du
+    client) et encodées au fil de l'eau : tableau JSON (fmt="json") ou une ligne JSON
+    par enregistrement (fmt="ndjson").
+    """
+    ndjson = fmt == "ndjson"
+
+    async def body():
+        yielded = False
+        if not ndjson:
+            yield b"["
+        try:
+            async with pool.acquire() as conn:
+                async with conn.transaction(readonly=True):
+                    chunk = []
+                    async for record in conn.cursor(query, *params, prefetch=batch_size):
+                        chunk.append(dumps(row_to_dict(record, json_fields)))
+                        if len(chunk) >= batch_size:
+                            yield _join_chunk(chunk, ndjson, yielded)
+                            yielded = True
+                            chunk = []
+                    if chunk:
+                        yield _join_chunk(chunk, ndjson, yielded)
+        except Exception as e:
+            # Les en-têtes sont déjà partis : on coupe le flux (JSON tronqué = erreur côté client)
+            logger.exception("❌ Erreur diffusion en continu: %s", e)
+            raise
+        if not ndjson:
+            yield b"]"
+
+    return StreamingResponse(body(), media_type=STREAM_FORMATS[fmt], headers=headers)
+
+
+def _join_chunk(chunk: List[bytes], ndjson: bool, continued: bool) -> bytes:
+    if ndjson:
+        return b"\n".join(chunk) + b"\n"
+    return (b"," if continued else b"") + b",".join(chunk)
@@ -1,8 +1,12 @@
 import asyncpg
+import time
 from datetime import datetime
 from typing import Any, Dict, Optional
 import json
 
+from config import APP_SETTINGS_CACHE_TTL
+from utils.pg_listener import INSTANCE_ID, notify
+
 DEFAULT_APP_SETTINGS = {
     "site_name": "Inventaire Robots",
     "site_description": "Système de gestion d'inventaire robotisé",
@@ -17,6 +21,8 @@ DEFAULT_APP_SETTINGS = {
     "email_password": "",
     "email_tls": True,
     "email_ssl": False,
+    # Moteur d'envoi : auto, aiosmtp, thread, file ou null (voir utils.mail_backends)
+    "email_backend": "auto",
     "features": {
         "bon_de_commande": True,
         "ereq_sap": True,
@@ -28,6 +34,67 @@ DEFAULT_APP_SETTINGS = {
 }
 
 
+# Canal NOTIFY envoyé à chaque modification de "AppSettings"
+SETTINGS_CHANNEL = "app_settings"
+
+
+class SettingsCache:
+    """
+    Paramètres fusionnés avec DEFAULT_APP_SETTINGS, gardés en mémoire.
+
+    Invalidé par upsert_app_settings, par les notifications des autres processus
+    (SETTINGS_CHANNEL) et au plus tard après ttl secondes (0 = jamais), au cas
+    où une notification serait perdue.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._value: Optional[Dict[str, Any]] = None
+        self._loaded_at = 0.0
+        # Incrémenté à chaque invalidation : un chargement commencé avant est ignoré
+        self.generation = 0
+
+    def get(self) -> Optional[Dict[str, Any]]:
+        if self._value is None:
+            return None
+        if self.ttl and time.monotonic() - self._loaded_at > self.ttl:
+            self._value = None
+            return None
+        return self._value
+
+    def set(self, value: Dict[str, Any], generation: Optional[int] = None):
+        if generation is not None and generation != self.generation:
+            return
+        self._value = value
+        self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        self.generation += 1
+        self._value = None
+
+
+settings_cache = SettingsCache(APP_SETTINGS_CACHE_TTL)
+
+
+def on_settings_notification(payload: str):
+    """Callback LISTEN (utils.pg_listener) : un autre processus a modifié les paramètres"""
+    if payload != INSTANCE_ID:
+        settings_cache.invalidate()
+
+
+def _merge_settings(settings: Any) -> Dict[str, Any]:
+    # JSONB lu sans codec : asyncpg retourne le texte JSON
+    if isinstance(settings, str):
+        settings = json.loads(settings) if settings else None
+    if not isinstance(settings, dict):
+        return DEFAULT_APP_SETTINGS.copy()
+    merged = DEFAULT_APP_SETTINGS.copy()
+    merged.update(settings)
+    if 'features' in settings and isinstance(settings['features'], dict):
+        merged['features'] = {**DEFAULT_APP_SETTINGS['features'], **settings['features']}
+    return merged
+
+
 async def ensure_app_settings_table(conn: asyncpg.Connection):
     await conn.execute('''
         CREATE TABLE IF NOT EXISTS "AppSettings" (
@@ -61,33 +128,36 @@ async def ensure_app_settings_table(conn: asyncpg.Connection):
 
 
 async def get_app_settings(conn: asyncpg.Connection) -> Dict[str, Any]:
+    """
+    Paramètres de l'application, depuis le cache mémoire si possible.
+    Le dict retourné est partagé : le copier avant de le modifier.
+    """
+    cached = settings_cache.get()
+    if cached is not None:
+        return cached
+
+    generation = settings_cache.generation
     row = await conn.fetchrow('SELECT "value" FROM "AppSettings" WHERE "key" = $1', 'default')
-    if row and row.get('value'):
-        settings = row['value']
-        if not isinstance(settings, dict):
-            settings = DEFAULT_APP_SETTINGS.copy()
-        merged = DEFAULT_APP_SETTINGS.copy()
-        merged.update(settings)
-        if 'features' in settings and isinstance(settings['features'], dict):
-            merged['features'] = {**DEFAULT_APP_SETTINGS['features'], **settings['features']}
-        return merged
-    return DEFAULT_APP_SETTINGS.copy()
+    merged = _merge_settings(row['value'] if row and row.get('value') else None)
+    settings_cache.set(merged, generation)
+    return merged
 
 
 async def upsert_app_settings(conn: asyncpg.Connection, settings: Dict[str, Any]) -> Dict[str, Any]:
-    merged = DEFAULT_APP_SETTINGS.copy()
-    merged.update(settings or {})
-    if 'features' in settings and isinstance(settings['features'], dict):
-        merged['features'] = {**DEFAULT_APP_SETTINGS['features'], **settings['features']}
+    merged = _merge_settings(settings or {})
 
-    await conn.execute(
-        '''
-        INSERT INTO "AppSettings" ("key", "value") VALUES ($1, $2)
-        ON CONFLICT ("key") DO UPDATE SET "value" = EXCLUDED."value"
-        ''',
-        'default',
-        json.dumps(merged)
-    )
+    async with conn.transaction():
+        await conn.execute(
+            '''
+            INSERT INTO "AppSettings" ("key", "value") VALUES ($1, $2)
+            ON CONFLICT ("key") DO UPDATE SET "value" = EXCLUDED."value"
+            ''',
+            'default',
+            json.dumps(merged)
+        )
+        await notify(conn, SETTINGS_CHANNEL)
+    settings_cache.invalidate()
+    settings_cache.set(merged)
     return merged
 
 
@@ -108,7 +178,10 @@ async def reserve_next_bc_sequence(conn: asyncpg.Connection) -> int:
     )
     if not row or not row.get('value'):
         raise RuntimeError('Impossible de réserver la séquence du bon de commande')
-    value = row['value']
+    value = _merge_settings(row['value'])
+    await notify(conn, SETTINGS_CHANNEL)
+    settings_cache.invalidate()
+    settings_cache.set(value)
     current_seq = int(value.get('bc_next_sequence', 1)) - 1
     if current_seq < 1:
         current_seq = 1
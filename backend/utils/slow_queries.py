@@ -0,0 +1,126 @@
+"""Agrégation des requêtes SQL par empreinte (littéraux normalisés) et journal des requêtes lentes"""
+import logging
+import math
+import re
+from collections import deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("Inventaire-Robot")
+
+# Durées conservées par empreinte pour le calcul du p95
+SAMPLES_PER_FINGERPRINT = 500
+
+# Au-delà, les nouvelles empreintes sont regroupées sous OVERFLOW_FINGERPRINT
+MAX_FINGERPRINTS = 1000
+OVERFLOW_FINGERPRINT = "(autres requêtes)"
+
+# Textes SQL déjà normalisés (les requêtes de l'application sont en nombre fini)
+_FINGERPRINT_CACHE_SIZE = 4096
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"(?<![\w$\"])\d+(?:\.\d+)?(?![\w\"])")
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(query: str) -> str:
+    """
+    Forme normalisée d'une requête : commentaires retirés, littéraux (chaînes,
+    nombres) remplacés par ?, listes IN (?, ?, ...) réduites, espaces compactés.
+    Les paramètres $1, $2... et les identifiants "entre guillemets" sont conservés.
+    """
+    sql = _COMMENTS.sub(" ", query)
+    sql = _STRINGS.sub("?", sql)
+    sql = _NUMBERS.sub("?", sql)
+    sql = _IN_LISTS.sub("(?...)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+class _FingerprintStats:
+    __slots__ = ("count", "total", "max", "slow", "errors", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+        self.errors = 0
+        self.samples = deque(maxlen=SAMPLES_PER_FINGERPRINT)
+
+    def p95(self) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[max(math.ceil(len(ordered) * 0.95) - 1, 0)]
+
+
+class SlowQueryRecorder:
+    """
+    Reçoit toutes les requêtes exécutées sur le pool (query logger asyncpg) et tient,
+    par empreinte : nombre d'exécutions, temps total, maximum, p95 (sur les
+    SAMPLES_PER_FINGERPRINT dernières), requêtes lentes et erreurs.
+    Les requêtes au-delà de threshold secondes sont aussi écrites dans le journal.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self._stats: Dict[str, _FingerprintStats] = {}
+        self._fingerprints: Dict[str, str] = {}
+
+    def log_query(self, record):
+        """Callback de Connection.add_query_logger (asyncpg.connection.LoggedQuery)"""
+        self.record(record.query, record.elapsed, record.exception is not None)
+
+    def record(self, query: str, elapsed: float, failed: bool = False):
+        key = self._fingerprints.get(query)
+        if key is None:
+            key = fingerprint(query)
+            if len(self._fingerprints) >= _FINGERPRINT_CACHE_SIZE:
+                self._fingerprints.clear()
+            self._fingerprints[query] = key
+
+        stats = self._stats.get(key)
+        if stats is None:
+            if len(self._stats) >= MAX_FINGERPRINTS:
+                key = OVERFLOW_FINGERPRINT
+                stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _FingerprintStats()
+
+        stats.count += 1
+        stats.total += elapsed
+        stats.max = max(stats.max, elapsed)
+        stats.samples.append(elapsed)
+        stats.errors += failed
+        if self.threshold and elapsed > self.threshold:
+            stats.slow += 1
+            logger.warning("🐢 Requête SQL lente (%.0f ms) : %s", elapsed * 1000, key[:500])
+
+    def top(self, limit: int = 20, sort: str = "total") -> List[dict]:
+        """Empreintes les plus coûteuses (sort : total, p95, max, count ou slow)"""
+        report = [
+            {
+                "fingerprint": key,
+                "count": s.count,
+                "total_ms": round(s.total * 1000, 2),
+                "mean_ms": round(s.total / s.count * 1000, 2) if s.count else 0.0,
+                "p95_ms": round(s.p95() * 1000, 2),
+                "max_ms": round(s.max * 1000, 2),
+                "slow": s.slow,
+                "errors": s.errors,
+            }
+            for key, s in self._stats.items()
+        ]
+        sort_key = {"total": "total_ms", "p95": "p95_ms", "max": "max_ms"}.get(sort, sort)
+        report.sort(key=lambda item: item[sort_key], reverse=True)
+        return report[:limit]
+
+    def reset(self):
+        self._stats.clear()
+
+
+def install_query_logger(conn, recorder: Optional[SlowQueryRecorder]):
+    """Branche le recorder sur une connexion (init du pool) ; sans effet avant asyncpg 0.29"""
+    if recorder is not None and hasattr(conn, "add_query_logger"):
+        conn.add_query_logger(recorder.log_query)
@@ -0,0 +1,189 @@
+"""Statistiques d'inventaire agrégées en mémoire, mises à jour pièce par pièce"""
+import logging
+import time
+from decimal import Decimal
+from typing import Dict, NamedTuple, Optional
+
+import asyncpg
+
+logger = logging.getLogger("Inventaire-Robot")
+
+# Totaux par département en une seule lecture de "Pièce" (agrégat, une ligne par département).
+# Mêmes conditions que les anciennes requêtes de GET /stats (NULL → non compté).
+_SELECT_TOTALS = '''
+    SELECT t.*, d."NomDepartement"
+    FROM (
+        SELECT p."RefDepartement",
+               COUNT(*) AS total_pieces,
+               COUNT(*) FILTER (WHERE p."QtéenInventaire" = 0 AND p."Qtéminimum" > 0) AS stock_critique,
+               COALESCE(SUM(p."QtéenInventaire" * COALESCE(p."Prix unitaire", 0)), 0) AS valeur_stock,
+               COUNT(*) FILTER (
+                   WHERE p."Qtécommandée" <= 0
+                     AND p."QtéenInventaire" < p."Qtéminimum"
+                     AND p."Qtéminimum" > 0
+               ) AS pieces_a_commander
+        FROM "Pièce" p
+        GROUP BY p."RefDepartement"
+    ) t
+    LEFT JOIN "Departement" d ON t."RefDepartement" = d."RefDepartement"
+'''
+
+# Contribution d'une pièce aux compteurs (mêmes conditions), pour les mises à jour incrémentales
+_SELECT_CONTRIBUTIONS = '''
+    SELECT p."RéfPièce",
+           p."RefDepartement",
+           d."NomDepartement",
+           COALESCE(p."QtéenInventaire" = 0 AND p."Qtéminimum" > 0, FALSE) AS critique,
+           COALESCE(p."QtéenInventaire" * COALESCE(p."Prix unitaire", 0), 0) AS valeur,
+           COALESCE(
+               p."Qtécommandée" <= 0
+               AND p."QtéenInventaire" < p."Qtéminimum"
+               AND p."Qtéminimum" > 0,
+               FALSE
+           ) AS a_commander
+    FROM "Pièce" p
+    LEFT JOIN "Departement" d ON p."RefDepartement" = d."RefDepartement"
+'''
+
+
+class _Contribution(NamedTuple):
+    departement: Optional[int]
+    critique: bool
+    valeur: Decimal
+    a_commander: bool
+
+
+class InventoryStats:
+    """
+    Compteurs du tableau de bord (total, stock critique, valeur, à commander),
+    globaux et par département.
+
+    Construits par un agrégat GROUP BY, puis tenus à jour par refresh()/remove() à
+    chaque modification de pièce. Les contributions par pièce, nécessaires au calcul
+    des différences, ne sont lues qu'à la première modification. Au-delà de ttl
+    secondes, les compteurs sont considérés périmés et reconstruits.
+    """
+
+    def __init__(self):
+        # None tant que les contributions par pièce n'ont pas été lues
+        self._pieces: Optional[Dict[int, _Contribution]] = None
+        self._departements: Dict[Optional[int], dict] = {}
+        self._noms: Dict[Optional[int], str] = {}
+        self.loaded_at = 0.0
+
+    def is_stale(self, ttl: float) -> bool:
+        return time.monotonic() - self.loaded_at > ttl
+
+    async def build(self, conn: asyncpg.Connection):
+        """(Re)calcule tous les compteurs depuis la base"""
+        rows = await conn.fetch(_SELECT_TOTALS)
+        self.__init__()
+        for row in rows:
+            if row["NomDepartement"] is not None:
+                self._noms[row["RefDepartement"]] = row["NomDepartement"]
+            self._departements[row["RefDepartement"]] = {
+                "total_pieces": row["total_pieces"],
+                "stock_critique": row["stock_critique"],
+                "valeur_stock": Decimal(row["valeur_stock"] or 0),
+                "pieces_a_commander": row["pieces_a_commander"],
+            }
+        self.loaded_at = time.monotonic()
+
+    async def _load_contributions(self, conn: asyncpg.Connection):
+        # La pièce modifiée l'est déjà en base : les totaux sont recalculés à partir
+        # des mêmes lignes pour rester cohérents avec les contributions
+        rows = await conn.fetch(_SELECT_CONTRIBUTIONS)
+        self._pieces = {}
+        self._departements = {}
+        for row in rows:
+            self._apply(row)
+
+    async def refresh(self, conn: asyncpg.Connection, piece_id: int):
+        """Relit une pièce et remplace sa contribution (ou la retire si supprimée)"""
+        if self._pieces is None:
+            await self._load_contributions(conn)
+        row = await conn.fetchrow(_SELECT_CONTRIBUTIONS + ' WHERE p."RéfPièce" = $1', piece_id)
+        self.remove(piece_id)
+        if row:
+            self._apply(row)
+
+    def remove(self, piece_id: int):
+        if self._pieces is None:
+            # Ancienne contribution inconnue : reconstruction au prochain GET /stats
+            self.loaded_at = float("-inf")
+            return
+        old = self._pieces.pop(piece_id, None)
+        if old is not None:
+            self._add(old, -1)
+
+    def _apply(self, row):
+        contribution = _Contribution(
+            departement=row["RefDepartement"],
+            critique=row["critique"],
+            valeur=Decimal(row["valeur"] or 0),
+            a_commander=row["a_commander"],
+        )
+        if row["NomDepartement"] is not None:
+            self._noms[contribution.departement] = row["NomDepartement"]
+        self._pieces[row["RéfPièce"]] = contribution
+        self._add(contribution, 1)
+
+    def _add(self, c: _Contribution, sign: int):
+        totals = self._departements.setdefault(c.departement, {
+            "total_pieces": 0, "stock_critique": 0, "valeur_stock": Decimal(0), "pieces_a_commander": 0,
+        })
+        totals["total_pieces"] += sign
+        totals["stock_critique"] += sign * c.critique
+        totals["valeur_stock"] += sign * c.valeur
+        totals["pieces_a_commander"] += sign * c.a_commander
+        if totals["total_pieces"] == 0:
+            del self._departements[c.departement]
+
+    def summary(self) -> dict:
+        """Totaux globaux + ventilation par département (forme de StatsResponse)"""
+        par_departement = []
+        result = {"total_pieces": 0, "stock_critique": 0, "valeur_stock": 0.0, "pieces_a_commander": 0}
+        for departement, totals in sorted(self._departements.items(), key=lambda item: (item[0] is None, item[0] or 0)):
+            for key in ("total_pieces", "stock_critique", "pieces_a_commander"):
+                result[key] += totals[key]
+            result["valeur_stock"] += float(totals["valeur_stock"])
+            par_departement.append({
+                "RefDepartement": departement,
+                "NomDepartement": self._noms.get(departement, "") if departement is not None else "",
+                "total_pieces": totals["total_pieces"],
+                "stock_critique": totals["stock_critique"],
+                "valeur_stock": float(totals["valeur_stock"]),
+                "pieces_a_commander": totals["pieces_a_commander"],
+            })
+        result["par_departement"] = par_departement
+        return result
+
+
+async def get_inventory_stats(app, conn: asyncpg.Connection, ttl: float) -> dict:
+    """Compteurs du tableau de bord, reconstruits s'ils sont absents ou périmés"""
+    stats = getattr(app.state, "inventory_stats", None)
+    if stats is None or stats.is_stale(ttl):
+        stats = InventoryStats()
+        await stats.build(conn)
+        app.state.inventory_stats = stats
+    return stats.summary()
+
+
+async def sync_piece_stats(app, conn: asyncpg.Connection, piece_id: int):
+    """Met à jour les compteurs après une modification de pièce (sans effet s'ils ne sont pas chargés)"""
+    stats = getattr(app.state, "inventory_stats", None)
+    if stats is None:
+        return
+    try:
+        await stats.refresh(conn, piece_id)
+    except Exception as e:
+        # Compteurs incertains : reconstruction complète au prochain GET /stats
+        app.state.inventory_stats = None
+        logger.warning("⚠️ Mise à jour des statistiques (non bloquant) pièce=%s: %s", piece_id, e)
+
+
+def remove_piece_stats(app, piece_id: int):
+    """Retire une pièce supprimée des compteurs (sans effet s'ils ne sont pas chargés)"""
+    stats = getattr(app.state, "inventory_stats", None)
+    if stats is not None:
+        stats.remove(piece_id)
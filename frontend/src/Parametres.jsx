@@ -190,6 +190,22 @@ export default function Parametres() {
                 <Switch checked={form.email_ssl} onCheckedChange={val => updateField('email_ssl', val)} />
               </div>
             </div>
+            <div className="grid grid-cols-2 gap-4">
+              <div>
+                <Label>Moteur d'envoi</Label>
+                <select
+                  value={form.email_backend || 'auto'}
+                  onChange={e => updateField('email_backend', e.target.value)}
+                  className="w-full mt-1 border rounded-md px-3 py-2 text-sm bg-white dark:bg-gray-800 dark:text-white"
+                >
+                  <option value="auto">Automatique</option>
+                  <option value="aiosmtp">SMTP asynchrone (aiosmtplib)</option>
+                  <option value="thread">SMTP classique (thread)</option>
+                  <option value="file">Fichiers .eml (tests)</option>
+                  <option value="null">Aucun envoi</option>
+                </select>
+              </div>
+            </div>
           </CardContent>
         </Card>
 
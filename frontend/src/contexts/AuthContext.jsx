@@ -1,4 +1,5 @@
-import React, { createContext, useContext, useEffect, useState } from 'react';
+import React, { createContext, useContext, useEffect, useRef, useState } from 'react';
+import { refreshAccessToken } from '../lib/utils';
 
 const AuthContext = createContext(null);
 
@@ -15,14 +16,36 @@ export function useAuth() {
 export function AuthProvider({ children }) {
   const [user, setUser] = useState(null);
   const [loading, setLoading] = useState(true);
+  const refreshTimer = useRef(null);
+
+  // Jeton d'accès de courte durée : renouvelé une minute avant son expiration
+  function scheduleRefresh(expiresIn) {
+    clearTimeout(refreshTimer.current);
+    if (expiresIn == null) return;
+    refreshTimer.current = setTimeout(async () => {
+      const data = await refreshAccessToken();
+      if (data) {
+        scheduleRefresh(data.expires_in);
+      } else {
+        localStorage.removeItem('access_token');
+        setUser(null);
+      }
+    }, Math.max(expiresIn - 60, 10) * 1000);
+  }
 
   async function fetchMe() {
     try {
-      const res = await fetch(`${API_BASE}/api/auth/me`, { credentials: 'include' });
+      let res = await fetch(`${API_BASE}/api/auth/me`, { credentials: 'include' });
+      if (res.status === 401 && await refreshAccessToken()) {
+        res = await fetch(`${API_BASE}/api/auth/me`, { credentials: 'include' });
+      }
       if (res.ok) {
         const data = await res.json();
         // data.user contient maintenant username, role, group, permissions
         setUser(data.user);
+        // Toujours planifier le renouvellement : les appels fetch() directs ne
+        // réessaient pas après un 401 (jeton encore valide au rechargement de la page)
+        scheduleRefresh(data.expires_in);
       } else {
         setUser(null);
       }
@@ -34,7 +57,10 @@ export function AuthProvider({ children }) {
     }
   }
 
-  useEffect(() => { fetchMe(); }, []);
+  useEffect(() => {
+    fetchMe();
+    return () => clearTimeout(refreshTimer.current);
+  }, []);
 
   async function login(username, password) {
     const res = await fetch(`${API_BASE}/api/auth/login`, {
@@ -54,6 +80,7 @@ export function AuthProvider({ children }) {
     if (data.access_token) {
       localStorage.setItem('access_token', data.access_token);
     }
+    scheduleRefresh(data.expires_in);
 
     // data.user contient username, role, group, permissions
     setUser(data.user);
@@ -61,7 +88,13 @@ export function AuthProvider({ children }) {
   }
 
   async function logout() {
-    await fetch(`${API_BASE}/api/auth/logout`, { method: 'POST', credentials: 'include' });
+    clearTimeout(refreshTimer.current);
+    const token = localStorage.getItem('access_token');
+    await fetch(`${API_BASE}/api/auth/logout`, {
+      method: 'POST',
+      credentials: 'include',
+      headers: token ? { Authorization: `Bearer ${token}` } : {},
+    });
     localStorage.removeItem('access_token');
     setUser(null);
   }
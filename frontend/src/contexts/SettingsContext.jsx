@@ -21,6 +21,7 @@ export function SettingsProvider({ children }) {
     email_password: '',
     email_tls: true,
     email_ssl: false,
+    email_backend: 'auto',
     features: {
       bon_de_commande: true,
       ereq_sap: true,
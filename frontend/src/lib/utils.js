@@ -13,16 +13,41 @@ export function log(...args) {
   }
 }
 
+// Renouvelle le jeton d'accès (courte durée) grâce au cookie de rafraîchissement.
+// Les appels simultanés partagent la même requête : le jeton de rafraîchissement est à usage unique.
+let refreshPromise = null;
+export function refreshAccessToken() {
+  if (!refreshPromise) {
+    const base = import.meta.env.VITE_BACKEND_URL || '';
+    refreshPromise = fetch(`${base}/api/auth/refresh`, { method: 'POST', credentials: 'include' })
+      .then(async (res) => {
+        if (!res.ok) return null;
+        const data = await res.json();
+        if (data.access_token) localStorage.setItem('access_token', data.access_token);
+        return data;
+      })
+      .catch(() => null)
+      .finally(() => { refreshPromise = null; });
+  }
+  return refreshPromise;
+}
+
 // Lightweight fetch wrapper that validates response.ok and attempts JSON parsing
-export async function fetchJson(url, options = {}) {
+export async function fetchJson(url, options = {}, retried = false) {
   // Ajouter le token Authorization si disponible
   const token = localStorage.getItem('access_token');
-  if (token && !options.headers?.Authorization) {
-    if (!options.headers) options.headers = {};
-    options.headers.Authorization = `Bearer ${token}`;
+  let headers = options.headers;
+  if (token && !headers?.Authorization) {
+    headers = { ...headers, Authorization: `Bearer ${token}` };
   }
   
-  const res = await fetch(url, { ...options, credentials: 'include' });
+  const res = await fetch(url, { ...options, headers, credentials: 'include' });
+  // Jeton d'accès expiré ou révoqué : un renouvellement puis un seul nouvel essai (nouveau jeton)
+  if (res.status === 401 && !retried && !url.includes('/api/auth/')) {
+    if (await refreshAccessToken()) {
+      return fetchJson(url, options, true);
+    }
+  }
   const text = await res.text();
   let data = null;
   try {